@@ -0,0 +1,60 @@
+"""
+Load test for the read endpoints of a running API instance.
+
+Fires :requests: GET requests with :concurrency: simultaneous clients and reports throughput and latency
+percentiles. Run it once against a worker started with ASYNC_DB=False and once with ASYNC_DB=True to compare.
+
+    python -m benchmarks.load_test --url http://127.0.0.1:8000/api/v1/selecciones/ --concurrency 200
+"""
+import argparse
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+
+def percentile(latencies: list, pct: float):
+    """ Get the :pct: percentile of an already sorted :latencies: list. """
+    index = min(len(latencies) - 1, int(round(pct / 100 * len(latencies))))
+    return latencies[index]
+
+
+def timed_get(session: requests.Session, url: str):
+    start = time.perf_counter()
+    try:
+        status_code = session.get(url, timeout=60).status_code
+    except requests.RequestException:
+        status_code = 599
+    elapsed = time.perf_counter() - start
+
+    return elapsed, status_code
+
+
+def run(url: str, concurrency: int, total_requests: int):
+    sessions = [requests.Session() for _ in range(concurrency)]
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        futures = [executor.submit(timed_get, sessions[i % concurrency], url) for i in range(total_requests)]
+        results = [future.result() for future in futures]
+    wall_time = time.perf_counter() - start
+
+    latencies = sorted(elapsed * 1000 for elapsed, _ in results)
+    errors = sum(1 for _, status_code in results if status_code >= 400)
+
+    print(f"url:         {url}")
+    print(f"requests:    {total_requests} ({errors} errors), concurrency: {concurrency}")
+    print(f"throughput:  {total_requests / wall_time:.1f} req/s")
+    print(f"latency ms:  p50={percentile(latencies, 50):.1f} p95={percentile(latencies, 95):.1f} "
+          f"p99={percentile(latencies, 99):.1f} max={latencies[-1]:.1f} mean={statistics.mean(latencies):.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Concurrent GET load test.")
+    parser.add_argument("--url", default="http://127.0.0.1:8000/api/v1/selecciones/")
+    parser.add_argument("--concurrency", type=int, default=100)
+    parser.add_argument("--requests", type=int, default=2000)
+    args = parser.parse_args()
+
+    run(args.url, args.concurrency, args.requests)
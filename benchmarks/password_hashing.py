@@ -0,0 +1,52 @@
+"""
+Micro-benchmark of password hashing settings, to size login capacity.
+
+For each setting it reports hashes/sec on a single thread (a login costs one verify, which costs the same as a
+hash) and the logins/sec a worker can sustain with PASSWORD_WORKERS threads.
+
+    python -m benchmarks.password_hashing --bcrypt-rounds 10 11 12 13 --argon2-time-costs 2 3
+"""
+import argparse
+import time
+
+from project.utils import create_pwd_context, PASSWORD_WORKERS
+
+
+def hashes_per_second(context, duration: float):
+    hashes = 0
+    start = time.perf_counter()
+
+    while time.perf_counter() - start < duration:
+        context.hash("benchmark-password")
+        hashes += 1
+
+    return hashes / (time.perf_counter() - start)
+
+
+def run(bcrypt_rounds: list, argon2_time_costs: list, argon2_memory_cost: int, duration: float):
+    settings = [(f"bcrypt rounds={rounds}", create_pwd_context(["bcrypt"], bcrypt_rounds=rounds))
+                for rounds in bcrypt_rounds]
+
+    try:
+        import argon2  # noqa: F401
+        settings += [(f"argon2 t={time_cost} m={argon2_memory_cost}KiB",
+                      create_pwd_context(["argon2"], argon2_time_cost=time_cost, argon2_memory_cost=argon2_memory_cost))
+                     for time_cost in argon2_time_costs]
+    except ImportError:
+        print("argon2-cffi is not installed, skipping argon2 settings")
+
+    print(f"{'setting':<32}{'ms/hash':>10}{'hashes/s':>10}{f'logins/s ({PASSWORD_WORKERS} workers)':>26}")
+    for name, context in settings:
+        rate = hashes_per_second(context, duration)
+        print(f"{name:<32}{1000 / rate:>10.1f}{rate:>10.1f}{rate * PASSWORD_WORKERS:>26.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Password hashing micro-benchmark.")
+    parser.add_argument("--bcrypt-rounds", type=int, nargs="*", default=[10, 11, 12, 13])
+    parser.add_argument("--argon2-time-costs", type=int, nargs="*", default=[2, 3])
+    parser.add_argument("--argon2-memory-cost", type=int, default=19456)
+    parser.add_argument("--duration", type=float, default=2.0, help="Seconds to measure each setting")
+    args = parser.parse_args()
+
+    run(args.bcrypt_rounds, args.argon2_time_costs, args.argon2_memory_cost, args.duration)
@@ -0,0 +1,74 @@
+"""
+Micro-benchmark of the serialization of a big list response, without the database nor the HTTP layer.
+
+It builds :count: Integrante objects (with their Seleccion, Equipo and Rol) in memory and reports the best time of
+:repeat: runs of each way of turning them into a response body:
+
+* response_model + JSONResponse: what FastAPI does for a handler returning ORM objects (orm_mode validation, then
+  jsonable_encoder, then json.dumps).
+* response_model + ORJSONResponse: the same with orjson as the default response class.
+* orm_response: the fast path of project.responses (orm_serializer, then orjson).
+
+    python -m benchmarks.serialization --count 10000
+"""
+import argparse
+import asyncio
+import time
+from typing import List
+
+from fastapi.responses import JSONResponse, ORJSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_response_field
+
+from project.models import Integrante, Seleccion, Equipo, Rol
+from project.responses import orm_response
+from project.schemas import IntegranteResponseModel
+
+
+def build_integrantes(count: int):
+    selecciones = [Seleccion(id=i, pais=f"pais_{i}") for i in range(32)]
+    equipos = [Equipo(id=i, nombre=f"equipo_{i}") for i in range(200)]
+    roles = [Rol(id=i, titulo=f"rol_{i}") for i in range(4)]
+
+    return [Integrante(id=i, nombre=f"nombre_{i}", apodo=f"apodo_{i}", apellido=f"apellido_{i}", edad=20 + i % 20,
+                       num_camiseta=i % 26, seleccion=selecciones[i % 32], equipo=equipos[i % 200],
+                       rol=roles[i % 4])
+            for i in range(count)]
+
+
+def best_time(function, repeat: int):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+
+    return min(times)
+
+
+def run(count: int, repeat: int):
+    integrantes = build_integrantes(count)
+    field = create_response_field(name="Response_integrantes", type_=List[IntegranteResponseModel])
+
+    def response_model(response_class):
+        return lambda: response_class(asyncio.run(serialize_response(field=field, response_content=integrantes))).body
+
+    paths = [("response_model + JSONResponse", response_model(JSONResponse)),
+             ("response_model + ORJSONResponse", response_model(ORJSONResponse)),
+             ("orm_response", lambda: orm_response(integrantes, IntegranteResponseModel).body)]
+
+    print(f"{count} integrantes, best of {repeat}")
+    baseline = None
+    for name, function in paths:
+        elapsed = best_time(function, repeat)
+        baseline = baseline or elapsed
+        print(f"{name:<34} {elapsed * 1000:8.1f} ms  x{baseline / elapsed:.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serialization micro-benchmark of a big list response.")
+    parser.add_argument("--count", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    run(args.count, args.repeat)
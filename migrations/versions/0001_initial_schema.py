@@ -0,0 +1,72 @@
+"""Initial schema, as created by Base.metadata.create_all before migrations existed
+
+Revision ID: 0001
+Revises:
+Create Date: 2022-07-04 10:00:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision = "0001"
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "selecciones",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("pais", sa.String(length=100), nullable=False),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_table(
+        "equipos",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("nombre", sa.String(length=100), nullable=False),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_table(
+        "roles",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("titulo", sa.String(length=50), nullable=False),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_table(
+        "usuarios",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("email", sa.String(), nullable=False),
+        sa.Column("password", sa.String(), nullable=False),
+        sa.Column("is_admin", sa.Boolean(), nullable=True),
+        sa.Column("created_at", postgresql.TIMESTAMP(timezone=True), server_default=sa.text("now()"),
+                  nullable=False),
+        sa.PrimaryKeyConstraint("id"),
+        sa.UniqueConstraint("email"),
+    )
+    op.create_table(
+        "integrantes",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("nombre", sa.String(length=50), nullable=False),
+        sa.Column("apodo", sa.String(length=50), nullable=True),
+        sa.Column("apellido", sa.String(length=50), nullable=False),
+        sa.Column("edad", sa.Integer(), nullable=True),
+        sa.Column("num_camiseta", sa.Integer(), nullable=True),
+        sa.Column("seleccion_id", sa.Integer(), nullable=False),
+        sa.Column("equipo_id", sa.Integer(), nullable=False),
+        sa.Column("rol_id", sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(["equipo_id"], ["equipos.id"]),
+        sa.ForeignKeyConstraint(["rol_id"], ["roles.id"]),
+        sa.ForeignKeyConstraint(["seleccion_id"], ["selecciones.id"]),
+        sa.PrimaryKeyConstraint("id"),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("integrantes")
+    op.drop_table("usuarios")
+    op.drop_table("roles")
+    op.drop_table("equipos")
+    op.drop_table("selecciones")
@@ -0,0 +1,27 @@
+"""Index the integrantes foreign keys
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2022-07-04 10:30:00
+
+"""
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "0002"
+down_revision = "0001"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # (seleccion_id, num_camiseta) also serves the lookups by seleccion_id alone.
+    op.create_index("ix_integrantes_seleccion_id_num_camiseta", "integrantes", ["seleccion_id", "num_camiseta"])
+    op.create_index("ix_integrantes_equipo_id", "integrantes", ["equipo_id"])
+    op.create_index("ix_integrantes_rol_id", "integrantes", ["rol_id"])
+
+
+def downgrade() -> None:
+    op.drop_index("ix_integrantes_rol_id", table_name="integrantes")
+    op.drop_index("ix_integrantes_equipo_id", table_name="integrantes")
+    op.drop_index("ix_integrantes_seleccion_id_num_camiseta", table_name="integrantes")
@@ -0,0 +1,33 @@
+"""Full-text search indexes on integrantes names and selecciones pais
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2022-07-18 10:00:00
+
+"""
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "0003"
+down_revision = "0002"
+branch_labels = None
+depends_on = None
+
+# Must be the same expression as project.search.search_vector, or the searches won't use the indexes.
+FOLD = "lower(translate({}, 'ÁÀÂÄÃÉÈÊËÍÌÎÏÓÒÔÖÕÚÙÛÜÑÇáàâäãéèêëíìîïóòôöõúùûüñç', " \
+       "'AAAAAEEEEIIIIOOOOOUUUUNCaaaaaeeeeiiiiooooouuuunc'))"
+
+
+def upgrade() -> None:
+    integrantes_text = "(((coalesce(nombre, '') || ' ') || coalesce(apodo, '')) || ' ') || coalesce(apellido, '')"
+    selecciones_text = "coalesce(pais, '')"
+
+    op.execute("CREATE INDEX ix_integrantes_search ON integrantes "
+               f"USING gin (to_tsvector('simple', {FOLD.format(integrantes_text)}))")
+    op.execute("CREATE INDEX ix_selecciones_search ON selecciones "
+               f"USING gin (to_tsvector('simple', {FOLD.format(selecciones_text)}))")
+
+
+def downgrade() -> None:
+    op.drop_index("ix_selecciones_search", table_name="selecciones")
+    op.drop_index("ix_integrantes_search", table_name="integrantes")
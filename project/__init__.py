@@ -1,22 +1,25 @@
-from fastapi import FastAPI, APIRouter
+from fastapi import FastAPI, APIRouter, Response
 from fastapi.middleware.cors import CORSMiddleware
 
-from .database import SessionLocal, engine
-from . import models
+from .http_cache import NotModified, not_modified_exception_handler
+from .metrics import MetricsMiddleware, route_metrics
+from .pagination import NEXT_CURSOR_HEADER
+from .responses import DefaultJSONResponse
 from .routers import router_roles
 from .routers import router_equipos
 from .routers import router_selecciones
 from .routers import router_integrantes
 from .routers import router_usuarios
 from .routers import router_authentication
-
-models.Base.metadata.create_all(bind=engine)
+from .routers import router_monitoring
+from .routers import router_export
 
 app = FastAPI(
     title="API - La ScalonetApp",
     description="API para el proyecto La ScalonetApp. Nos permite realizar operaciones CRUD sobre selecciones y sus "
                 "integrantes.",
-    version="1")
+    version="1",
+    default_response_class=DefaultJSONResponse)
 
 origins = ["*"]
 
@@ -26,8 +29,14 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[NEXT_CURSOR_HEADER, "ETag"],
 )
 
+# Added last so it wraps the other middlewares and its latencies include them.
+app.add_middleware(MetricsMiddleware)
+
+app.add_exception_handler(NotModified, not_modified_exception_handler)
+
 api_v1 = APIRouter(prefix="/api/v1")
 api_v1.include_router(router_roles)
 api_v1.include_router(router_equipos)
@@ -35,6 +44,8 @@ api_v1.include_router(router_selecciones)
 api_v1.include_router(router_integrantes)
 api_v1.include_router(router_usuarios)
 api_v1.include_router(router_authentication)
+api_v1.include_router(router_monitoring)
+api_v1.include_router(router_export)
 
 app.include_router(api_v1)
 
@@ -44,6 +55,12 @@ async def root():
     return {"message": "Hello World"}
 
 
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    """ Per-route request counts, latencies and requests in flight of this worker, in the Prometheus format. """
+    return Response(route_metrics.render(), media_type="text/plain; version=0.0.4")
+
+
 @app.get("/hello/{name}")
 async def say_hello(name: str):
     return {"message": f"Hello {name}"}
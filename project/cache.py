@@ -0,0 +1,506 @@
+import asyncio
+import functools
+import json
+import logging
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from typing import Type, Optional
+
+from decouple import config
+from fastapi.concurrency import run_in_threadpool
+from pydantic import BaseModel
+from sqlalchemy.exc import MissingGreenlet
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.util import await_only
+
+CACHE_BACKEND = config("CACHE_BACKEND", default="memory")
+REDIS_URL = config("REDIS_URL", default="redis://localhost:6379/0")
+# Seconds to wait for Redis to connect or answer before treating it as unavailable.
+REDIS_TIMEOUT = config("REDIS_TIMEOUT", default=1.0, cast=float)
+CATALOG_CACHE_TTL = config("CATALOG_CACHE_TTL", default=300, cast=float)
+CATALOG_CACHE_MAXSIZE = config("CATALOG_CACHE_MAXSIZE", default=1024, cast=int)
+AUTH_CACHE_TTL = config("AUTH_CACHE_TTL", default=30, cast=float)
+AUTH_CACHE_MAXSIZE = config("AUTH_CACHE_MAXSIZE", default=1024, cast=int)
+
+MISSING = object()
+
+# Seconds between attempts to listen to the invalidations again after Redis failed.
+REDIS_RETRY_SECONDS = 1.0
+
+try:
+    from redis.exceptions import RedisError, WatchError
+except ImportError:
+    # Without redis there is no RedisCacheBackend, so no Redis errors to catch.
+    RedisError = WatchError = ()
+
+logger = logging.getLogger(__name__)
+
+
+def run_blocking(function, *args, **kwargs):
+    """ Call a :function: that blocks on the network without blocking the event loop.
+
+    With ASYNC_DB the crud functions, and so the `cached` and `invalidates` wrappers, run inside
+    AsyncSession.run_sync, on the event loop thread. There :function: is sent to the threadpool and awaited through
+    the same greenlet SQLAlchemy uses to await asyncpg. Anywhere else (the threadpool, scripts) it's just called.
+    """
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return function(*args, **kwargs)
+
+    coroutine = run_in_threadpool(function, *args, **kwargs)
+    try:
+        return await_only(coroutine)
+    except MissingGreenlet:
+        # Plain synchronous code called from a coroutine: there is nothing to await with.
+        coroutine.close()
+        return function(*args, **kwargs)
+
+
+class CacheBackend:
+    """
+    Interface of the caches used by `cached` and `invalidates`.
+
+    Keys are tuples whose first item is a namespace (usually a table name), so every entry of a table can be
+    invalidated at once. Values must be JSON serializable.
+    """
+
+    def get(self, key: tuple):
+        """ Get the value stored for :key:, MISSING if there is none or it expired. """
+        raise NotImplementedError
+
+    def set(self, key: tuple, value, ttl: Optional[float] = None, version: Optional[str] = None):
+        """ Store :value: for :key:, during :ttl: seconds or the backend's default TTL.
+
+        With :version:, the value is only stored if it is still the version of the key's namespace, checked
+        atomically with the store, so a value read before an invalidation isn't stored after it.
+        """
+        raise NotImplementedError
+
+    def invalidate(self, namespace: str):
+        """ Drop every entry whose key starts with :namespace: and change its version. """
+        raise NotImplementedError
+
+    def version(self, namespace: str):
+        """ Get a token that changes every time :namespace: is invalidated. """
+        raise NotImplementedError
+
+    def clear(self):
+        """ Drop every entry and reset the counters. """
+        raise NotImplementedError
+
+    def stats(self):
+        """ Get the hit/miss counters and current size, for monitoring. """
+        raise NotImplementedError
+
+
+class MemoryCacheBackend(CacheBackend):
+    """
+    Thread-safe, size-bounded LRU cache whose entries expire :ttl: seconds after being set.
+
+    Entries live in the worker process, so writes made through other workers are only seen once they expire.
+    A :ttl: of 0 disables the cache.
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        # Versions start from a random value so they don't repeat after a restart.
+        self._versions = {}
+        self._epoch = secrets.token_hex(4)
+
+    def get(self, key: tuple):
+        with self._lock:
+            entry = self._entries.get(key)
+
+            if entry is None or entry[0] < time.monotonic():
+                self.misses += 1
+                return MISSING
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key: tuple, value, ttl: Optional[float] = None, version: Optional[str] = None):
+        ttl = self.ttl if ttl is None else min(ttl, self.ttl)
+        if ttl <= 0:
+            return
+
+        with self._lock:
+            if version is not None and version != self._version(key[0]):
+                return
+
+            self._entries[key] = (time.monotonic() + ttl, value)
+            self._entries.move_to_end(key)
+
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, namespace: str):
+        with self._lock:
+            for key in [key for key in self._entries if key[0] == namespace]:
+                del self._entries[key]
+
+            self._versions[namespace] = self._versions.get(namespace, 0) + 1
+
+    def drop(self, namespace: str):
+        """ Drop every entry whose key starts with :namespace:, keeping its version. """
+        with self._lock:
+            for key in [key for key in self._entries if key[0] == namespace]:
+                del self._entries[key]
+
+    def version(self, namespace: str):
+        """ Get a token that changes every time :namespace: is invalidated in this process.
+
+        Invalidations made through other workers don't reach it, so it also changes every :ttl: seconds: a stale
+        ETag lives as long as a stale entry, at most. With the cache disabled it changes on every call.
+        """
+        if self.ttl <= 0:
+            return secrets.token_hex(8)
+
+        with self._lock:
+            return self._version(namespace)
+
+    def _version(self, namespace: str):
+        return f"{self._epoch}.{self._versions.get(namespace, 0)}.{int(time.time() // self.ttl)}"
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                "backend": "memory",
+                "hits": self.hits,
+                "misses": self.misses,
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "ttl": self.ttl,
+            }
+
+
+class RedisCacheBackend(CacheBackend):
+    """
+    Cache shared by every worker through a Redis-protocol server, with a per-worker MemoryCacheBackend in front.
+
+    Its Redis calls go through run_blocking, so they don't block the event loop under ASYNC_DB.
+
+    If Redis is unavailable, the cache degrades instead of failing the requests: reads are misses, versions are new
+    random values (so no ETag matches), nothing is stored, and invalidations only drop the local entries. The
+    listener keeps retrying, and drops every local entry each time it fails, since invalidations may have been lost.
+
+    Each invalidation deletes the namespace keys from Redis and publishes the namespace on a channel. Every worker
+    listens to that channel and drops the namespace from its local cache, so an update made through one worker is
+    seen by the others right away. If a message is lost, a stale local entry lives at most :ttl: seconds.
+
+    Args:
+        client: A redis.Redis compatible client.
+        maxsize (int): Max entries of the local cache.
+        ttl (float): Seconds an entry lives, both locally and in Redis.
+        prefix (str): Prefix for every key and the channel name.
+    """
+
+    def __init__(self, client, maxsize: int, ttl: float, prefix: str = "scalonetapp"):
+        self.client = client
+        self.ttl = ttl
+        self.prefix = prefix
+        self.channel = f"{prefix}:invalidations"
+        self.local = MemoryCacheBackend(maxsize=maxsize, ttl=ttl)
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+        self._subscriber = None
+        self._subscribe_retry_at = 0.0
+        self._lock = threading.Lock()
+
+    def _redis_error(self, action: str, error: Exception):
+        self.errors += 1
+        logger.warning("Redis cache unavailable, %s: %s", action, error)
+
+    def _redis_key(self, key: tuple):
+        return ":".join([self.prefix, *map(str, key)])
+
+    def _namespace_key(self, namespace: str):
+        return f"{self.prefix}:{namespace}:keys"
+
+    def _version_key(self, namespace: str):
+        return f"{self.prefix}:{namespace}:version"
+
+    def _on_invalidation(self, message: dict):
+        self.local.drop(message["data"].decode())
+
+    def _on_listener_error(self, error: Exception, pubsub, thread):
+        # The connection is retried on the next poll; whatever was published meanwhile is lost.
+        self._redis_error("dropping the local cache", error)
+        self.local.clear()
+        time.sleep(REDIS_RETRY_SECONDS)
+
+    def subscribe(self):
+        """ Start listening (in a daemon thread) to the invalidations published by every worker, or again if the
+        listener died. After a failure it is retried every REDIS_RETRY_SECONDS. """
+        subscriber = self._subscriber
+        if (subscriber is None or not subscriber.is_alive()) and time.monotonic() >= self._subscribe_retry_at:
+            run_blocking(self._subscribe)
+
+    def _subscribe(self):
+        with self._lock:
+            if self._subscriber is not None and self._subscriber.is_alive():
+                return
+
+            pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+            try:
+                pubsub.subscribe(**{self.channel: self._on_invalidation})
+            except RedisError as error:
+                pubsub.close()
+                self._subscribe_retry_at = time.monotonic() + REDIS_RETRY_SECONDS
+                self._redis_error("not listening to invalidations", error)
+                return
+
+            # Entries stored while nobody listened may have missed their invalidations.
+            self.local.clear()
+            self._subscriber = pubsub.run_in_thread(sleep_time=0.1, daemon=True,
+                                                    exception_handler=self._on_listener_error)
+
+    def close(self):
+        """ Stop listening to invalidations. """
+        with self._lock:
+            if self._subscriber is not None:
+                self._subscriber.stop()
+                self._subscriber = None
+
+    def get(self, key: tuple):
+        self.subscribe()
+
+        value = self.local.get(key)
+        if value is not MISSING:
+            self.hits += 1
+            return value
+
+        try:
+            raw_value = run_blocking(self.client.get, self._redis_key(key))
+        except RedisError as error:
+            self._redis_error("reading as a miss", error)
+            raw_value = None
+
+        if raw_value is None:
+            self.misses += 1
+            return MISSING
+
+        self.hits += 1
+        value = json.loads(raw_value)
+        self.local.set(key, value)
+        return value
+
+    def set(self, key: tuple, value, ttl: Optional[float] = None, version: Optional[str] = None):
+        ttl = self.ttl if ttl is None else min(ttl, self.ttl)
+        if ttl <= 0:
+            return
+
+        self.subscribe()
+
+        try:
+            stored = run_blocking(self._store, key, json.dumps(value), ttl, version)
+        except RedisError as error:
+            self._redis_error("not storing", error)
+            return
+
+        if stored:
+            self.local.set(key, value, ttl)
+
+    def _store(self, key: tuple, raw_value: str, ttl: float, version: Optional[str]):
+        """ Store :raw_value: in Redis, if :version: is None or still the version in Redis (not the local copy,
+        which only learns about the invalidations of other workers through the listener). """
+        redis_key = self._redis_key(key)
+        version_key = self._version_key(key[0])
+
+        with self.client.pipeline() as pipeline:
+            try:
+                if version is not None:
+                    # Any INCR of the version between the WATCH and the EXEC makes the EXEC fail.
+                    pipeline.watch(version_key)
+                    current_version = pipeline.get(version_key)
+                    if current_version is None or current_version.decode() != version:
+                        return False
+                    pipeline.multi()
+
+                pipeline.set(redis_key, raw_value, ex=int(ttl) or 1)
+                pipeline.sadd(self._namespace_key(key[0]), redis_key)
+                pipeline.expire(self._namespace_key(key[0]), int(self.ttl) or 1)
+                pipeline.execute()
+            except WatchError:
+                return False
+
+        return True
+
+    def invalidate(self, namespace: str):
+        try:
+            run_blocking(self._invalidate, namespace)
+        except RedisError as error:
+            # The write is already committed: the other workers only find out when their entries expire.
+            self._redis_error(f"{namespace} only invalidated locally", error)
+
+        self.local.drop(namespace)
+
+    def _invalidate(self, namespace: str):
+        # The version goes first: a conditional set that lands before the INCR has its key listed below and
+        # deleted, and one that lands after it sees the new version and doesn't store anything.
+        self.client.incr(self._version_key(namespace))
+
+        namespace_key = self._namespace_key(namespace)
+        keys = self.client.smembers(namespace_key)
+
+        pipeline = self.client.pipeline()
+        pipeline.delete(namespace_key, *keys)
+        pipeline.publish(self.channel, namespace)
+        pipeline.execute()
+
+    def version(self, namespace: str):
+        self.subscribe()
+
+        # Versions are cached locally under the namespace, so the invalidation messages also drop them.
+        local_key = (namespace, "version")
+        value = self.local.get(local_key)
+        if value is not MISSING:
+            return value
+
+        try:
+            value = run_blocking(self._read_version, self._version_key(namespace))
+        except RedisError as error:
+            self._redis_error("using a new random version", error)
+            return secrets.token_hex(8)
+
+        self.local.set(local_key, value)
+        return value
+
+    def _read_version(self, version_key: str):
+        value = self.client.get(version_key)
+        if value is None:
+            # Start from a random value so versions don't repeat if Redis loses its data.
+            self.client.set(version_key, secrets.randbits(48), nx=True)
+            value = self.client.get(version_key)
+
+        return value.decode()
+
+    def clear(self):
+        for key in self.client.scan_iter(f"{self.prefix}:*"):
+            self.client.delete(key)
+
+        self.local.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def stats(self):
+        return {
+            "backend": "redis",
+            "hits": self.hits,
+            "misses": self.misses,
+            "errors": self.errors,
+            "ttl": self.ttl,
+            "local": self.local.stats(),
+        }
+
+
+def create_cache(backend: str = CACHE_BACKEND, maxsize: int = CATALOG_CACHE_MAXSIZE, ttl: float = CATALOG_CACHE_TTL,
+                 prefix: str = "scalonetapp"):
+    """ Build the cache backend selected by the CACHE_BACKEND config ("memory" or "redis").
+
+    Args:
+        backend (str): "memory" or "redis".
+        maxsize (int): Maximum number of entries kept in memory.
+        ttl (float): Seconds an entry lives.
+        prefix (str): Prefix for the Redis keys and invalidation channel, so caches sharing a server don't collide.
+    """
+    if backend == "redis":
+        import redis
+
+        client = redis.Redis.from_url(REDIS_URL, socket_timeout=REDIS_TIMEOUT, socket_connect_timeout=REDIS_TIMEOUT)
+        return RedisCacheBackend(client, maxsize=maxsize, ttl=ttl, prefix=prefix)
+
+    return MemoryCacheBackend(maxsize=maxsize, ttl=ttl)
+
+
+catalog_cache = create_cache()
+# The authenticated Usuarios live apart from the catalog, so logins don't evict catalog entries and each cache follows
+# its own size and TTL settings.
+auth_cache = create_cache(maxsize=AUTH_CACHE_MAXSIZE, ttl=AUTH_CACHE_TTL, prefix="scalonetapp:auth")
+
+
+def cached(namespace: str, schema: Type[BaseModel], ttl: Optional[float] = None,
+           cache: Optional[CacheBackend] = None):
+    """ Read-through cache for a crud getter whose first argument is the database Session.
+
+    Results are stored as plain dicts (a single one, a list of them or None) rather than ORM objects, so they don't
+    depend on the Session that loaded them and can be shared between workers. They are returned as :schema:
+    instances.
+
+    A lagging replica may return rows older than the current version, which would then be served under it until the
+    next write. So misses on a replica Session are read through the primary Session of the request, which get_read_db
+    leaves in its info, and only what the primary reads is stored.
+
+    Args:
+        namespace (str): The cache namespace, invalidated by the functions decorated with `invalidates`.
+        schema (Type[BaseModel]): The orm_mode response model used to store the results.
+        ttl (float): Seconds the results live, if shorter than the cache's TTL.
+        cache (CacheBackend): The backend storing the results, catalog_cache by default.
+    """
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(db, *args):
+            backend = catalog_cache if cache is None else cache
+            key = (namespace, function.__name__, *args)
+            value = backend.get(key)
+
+            if value is MISSING:
+                # Read before the query: if a write invalidates the namespace in between, the result may predate it
+                # and set doesn't store it.
+                version = backend.version(namespace)
+                primary_db = db.info.get("primary", db)
+                if isinstance(primary_db, AsyncSession):
+                    # Already inside the replica's run_sync greenlet, so the primary's own run_sync can be awaited.
+                    value = await_only(primary_db.run_sync(function, *args))
+                else:
+                    value = function(primary_db, *args)
+
+                if isinstance(value, list):
+                    value = [schema.from_orm(item).dict() for item in value]
+                elif value is not None:
+                    value = schema.from_orm(value).dict()
+
+                if not primary_db.info.get("replica"):
+                    backend.set(key, value, ttl, version=version)
+
+            if isinstance(value, list):
+                return [schema.construct(**item) for item in value]
+
+            return value if value is None else schema.construct(**value)
+
+        return wrapper
+
+    return decorator
+
+
+def invalidates(*namespaces: str, cache: Optional[CacheBackend] = None):
+    """ Drop the cache entries of :namespaces: from :cache: (catalog_cache by default) and change their versions after
+    the decorated crud write function runs. """
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            try:
+                return function(*args, **kwargs)
+            finally:
+                backend = catalog_cache if cache is None else cache
+                for namespace in namespaces:
+                    backend.invalidate(namespace)
+
+        return wrapper
+
+    return decorator
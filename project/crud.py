@@ -1,15 +1,139 @@
+import csv
+import io
+from typing import Optional, List, Union
+
 from fastapi.security import OAuth2PasswordRequestForm
-from sqlalchemy.orm import Session
+from sqlalchemy import insert, update, delete, select, literal, union_all, bindparam, and_, or_, tuple_, func, \
+    literal_column
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.orm import Session, Query, contains_eager, lazyload, aliased
 
+from project.cache import cached, invalidates, auth_cache
+from project.database import Base
 from project.models import Rol, Equipo, Seleccion, Integrante, Usuario
-from project.schemas import RolBaseModel, EquipoBaseModel, SeleccionBaseModel, IntegranteBaseModel, UsuarioBaseModel
+from project.schemas import RolBaseModel, EquipoBaseModel, SeleccionBaseModel, IntegranteBaseModel, UsuarioBaseModel, \
+    IntegranteBulkUpdateModel, RolResponseModel, EquipoResponseModel, SeleccionResponseModel, CurrentUsuarioModel, \
+    IntegranteFilterModel, RolPatchModel, EquipoPatchModel, SeleccionPatchModel, IntegrantePatchModel, UsuarioPatchModel
+from project.search import search_vector, search_words, prefix_query, fuzzy_prefix_lengths, fuzzy_query, fuzzy_score, \
+    FUZZY_MIN_SCORE, FUZZY_MAX_CANDIDATES, FUZZY_MAX_SCANNED
+
+
+def paginate(query: Query, model, limit: Optional[int] = None, after_id: Optional[int] = None):
+    """ Get a page of :query: results ordered by id, using a keyset (id > :after_id:) instead of OFFSET.
+
+    Args:
+        query (Query): The query over :model: to paginate.
+        model: The mapped class being queried.
+        limit (int): Max amount of rows to return, all rows if None.
+        after_id (int): Only rows with a greater id are returned, if given.
+
+    Returns:
+        List of :model: objects.
+    """
+    if after_id is not None:
+        query = query.filter(model.id > after_id)
+
+    query = query.order_by(model.id)
+
+    if limit is not None:
+        query = query.limit(limit)
+
+    return query.all()
+
+
+def write_returning(db: Session, model, statement):
+    """ Run an INSERT, UPDATE or DELETE :statement: on the :model: table and commit, loading the :model: objects of
+    the rows it changed in the same round trip.
+
+    The statement goes in a CTE with RETURNING, and the objects are selected from it along with their eagerly
+    loaded relationships, so a write costs a single statement instead of a lookup, the write and a refresh. The
+    objects are detached before the commit, so it doesn't expire them and reading them doesn't query again.
+
+    Args:
+        db (Session): The database Session.
+        model: The mapped class whose table :statement: writes to.
+        statement: The INSERT, UPDATE or DELETE statement, without RETURNING.
+
+    Returns:
+        List of :model: objects, as they were after the write (or before it, for a DELETE).
+    """
+    rows = statement.returning(*model.__table__.columns).cte(f"{model.__tablename__}_written")
+    objects = db.execute(select(aliased(model, rows)).execution_options(populate_existing=True)).scalars().all()
+
+    db.expunge_all()
+    db.commit()
+
+    return objects
+
+
+def search(db: Session, model, columns: list, q: str, limit: int):
+    """ Search the :model: rows whose :columns: have every word of :q: as a prefix, ignoring case and accents.
+
+    If none does, the rows with words similar to the searched ones are returned instead, so typos (after the first
+    letters) still find results. Both searches use the GIN index on search_vector(*:columns:).
+
+    Args:
+        db (Session): The database Session.
+        model: The mapped class being searched.
+        columns (list): The :model: columns searched.
+        q (str): The searched text.
+        limit (int): Max amount of rows to return.
 
-from project.utils import hash_password
+    Returns:
+        List of :model: objects, the best matches first.
+    """
+    words = search_words(q)
+    if not words:
+        return []
+
+    vector = search_vector(*columns)
+    tsquery = func.to_tsquery(literal_column("'simple'"), prefix_query(words))
+
+    rows = (db.query(model)
+            .filter(vector.op("@@")(tsquery))
+            .order_by(func.ts_rank(vector, tsquery).desc(), model.id)
+            .limit(limit)
+            .all())
+
+    if rows:
+        return rows
+
+    # The longer the prefix, the fewer the candidates: the first prefix length with similar rows is used. Each one is
+    # read in id order, so what FUZZY_MAX_SCANNED leaves out doesn't depend on the query plan.
+    scores = {}
+    scanned = 0
+    for prefix_length in fuzzy_prefix_lengths(words):
+        fuzzy_filter = vector.op("@@")(func.to_tsquery(literal_column("'simple'"), fuzzy_query(words, prefix_length)))
+        after_id = 0
+
+        while scanned < FUZZY_MAX_SCANNED:
+            batch_size = min(FUZZY_MAX_CANDIDATES, FUZZY_MAX_SCANNED - scanned)
+            candidates = (db.query(model)
+                          .filter(fuzzy_filter, model.id > after_id)
+                          .order_by(model.id)
+                          .limit(batch_size)
+                          .all())
+            scanned += len(candidates)
+
+            for row in candidates:
+                score = fuzzy_score(words, " ".join(filter(None, (getattr(row, column.key) for column in columns))))
+                if score >= FUZZY_MIN_SCORE:
+                    scores[row] = score
+
+            if len(candidates) < batch_size:
+                break
+            after_id = candidates[-1].id
+
+        if scores or scanned >= FUZZY_MAX_SCANNED:
+            break
+
+    return sorted(scores, key=lambda row: (-scores[row], row.id))[:limit]
 
 
 # ================================
 #           ROL
 # ================================
+@cached("roles", RolResponseModel)
 def get_rol(db: Session, rol_id: int):
     """ Get a Rol object from our database given an id :rol_id:
 
@@ -23,18 +147,22 @@ def get_rol(db: Session, rol_id: int):
     return db.query(Rol).filter(Rol.id == rol_id).first()
 
 
-def get_roles(db: Session):
-    """ Get all Rol objects from our database.
+@cached("roles", RolResponseModel)
+def get_roles(db: Session, limit: Optional[int] = None, after_id: Optional[int] = None):
+    """ Get Rol objects from our database, ordered by id.
 
         Args:
             db (Session): The database Session.
+            limit (int): Max amount of Rol objects to return, all of them if None.
+            after_id (int): Only Rol objects with a greater id are returned, if given.
 
         Returns:
             Rol objects if found, empty list otherwise.
         """
-    return db.query(Rol).all()
+    return paginate(db.query(Rol), Rol, limit, after_id)
 
 
+@invalidates("roles")
 def create_rol(db: Session, rol: RolBaseModel):
     """ Create a Rol in our database given the values in the :rol: param.
 
@@ -45,38 +173,29 @@ def create_rol(db: Session, rol: RolBaseModel):
     Returns:
         Created Rol object.
     """
-    db_rol = Rol(titulo=rol.titulo)
-    db.add(db_rol)
-    db.commit()
-    db.refresh(db_rol)
+    return write_returning(db, Rol, insert(Rol.__table__).values(titulo=rol.titulo))[0]
 
-    return db_rol
 
-
-def update_rol(db: Session, rol: RolBaseModel, rol_id: int):
-    """ Update a Rol in our database given the values in the :rol: param.
+@invalidates("roles")
+def update_rol(db: Session, rol: Union[RolBaseModel, RolPatchModel], rol_id: int):
+    """ Update a Rol in our database given the values in the :rol: param. Only the fields set in :rol: are written.
 
         Args:
             db (Session): The database Session.
-            rol (RolBaseModel): The RolBaseModel to update a Rol in our database.
+            rol (RolBaseModel | RolPatchModel): The values to update a Rol in our database.
             rol_id (int): The Rol id passed as url param.
 
         Returns:
             Updated Rol object if found, None otherwise.
         """
-    db_rol = db.get(Rol, rol_id)
-
-    if db_rol is None:
-        return db_rol
-
-    db_rol.titulo = rol.titulo
-    db.add(db_rol)
-    db.commit()
-    db.refresh(db_rol)
+    roles = write_returning(db, Rol, update(Rol.__table__)
+                            .where(Rol.id == rol_id)
+                            .values(**rol.dict(exclude_unset=True)))
 
-    return db_rol
+    return roles[0] if roles else None
 
 
+@invalidates("roles")
 def delete_rol(db: Session, rol_id: int):
     """ Delete a Rol in our database given an id :rol_id:
 
@@ -87,20 +206,15 @@ def delete_rol(db: Session, rol_id: int):
         Returns:
             Deleted Rol object if found, None otherwise.
         """
-    db_rol = db.get(Rol, rol_id)
-
-    if db_rol is None:
-        return db_rol
-
-    db.delete(db_rol)
-    db.commit()
+    roles = write_returning(db, Rol, delete(Rol.__table__).where(Rol.id == rol_id))
 
-    return db_rol
+    return roles[0] if roles else None
 
 
 # ================================
 #           EQUIPO
 # ================================
+@cached("equipos", EquipoResponseModel)
 def get_equipo(db: Session, equipo_id: int):
     """ Get an Equipo object from our database given an id :equipo_id:
 
@@ -114,18 +228,57 @@ def get_equipo(db: Session, equipo_id: int):
     return db.query(Equipo).filter(Equipo.id == equipo_id).first()
 
 
-def get_equipos(db: Session):
-    """ Get all Equipo objects from our database.
+@cached("equipos", EquipoResponseModel)
+def get_equipos(db: Session, limit: Optional[int] = None, after_id: Optional[int] = None):
+    """ Get Equipo objects from our database, ordered by id.
 
         Args:
             db (Session): The database Session.
+            limit (int): Max amount of Equipo objects to return, all of them if None.
+            after_id (int): Only Equipo objects with a greater id are returned, if given.
 
         Returns:
             Equipo objects if found, Empty List otherwise.
         """
-    return db.query(Equipo).all()
+    return paginate(db.query(Equipo), Equipo, limit, after_id)
+
+
+def get_equipo_integrantes(db: Session, equipo_id: int, limit: Optional[int] = None, after_id: Optional[int] = None):
+    """ Get an Equipo object given an id :equipo_id: and a page of its Integrante objects (ordered by id, each with
+    its Seleccion) in a single query.
+
+    Args:
+        db (Session): The database Session.
+        equipo_id (int): The Equipo id.
+        limit (int): Max amount of Integrante objects to return, all of them if None.
+        after_id (int): Only Integrante objects with a greater id are returned, if given.
+
+    Returns:
+        Tuple with the Equipo object and its Integrante objects list if found, None otherwise.
+    """
+    # The page conditions go in the ON clause, so the Equipo row comes back even when it has no Integrantes left.
+    join_condition = Integrante.equipo_id == Equipo.id
+    if after_id is not None:
+        join_condition = and_(join_condition, Integrante.id > after_id)
+
+    query = (db.query(Equipo, Integrante)
+             .outerjoin(Integrante, join_condition)
+             .outerjoin(Integrante.seleccion)
+             .options(contains_eager(Integrante.seleccion), lazyload(Integrante.equipo), lazyload(Integrante.rol))
+             .filter(Equipo.id == equipo_id)
+             .order_by(Integrante.id))
 
+    if limit is not None:
+        query = query.limit(limit)
 
+    rows = query.all()
+    if not rows:
+        return None
+
+    return rows[0][0], [integrante for _, integrante in rows if integrante is not None]
+
+
+@invalidates("equipos")
 def create_equipo(db: Session, equipo: EquipoBaseModel):
     """ Create a Equipo in our database given the values in the :equipo: param.
 
@@ -136,38 +289,30 @@ def create_equipo(db: Session, equipo: EquipoBaseModel):
     Returns:
         Created Equipo object.
     """
-    db_equipo = Equipo(nombre=equipo.nombre)
-    db.add(db_equipo)
-    db.commit()
-    db.refresh(db_equipo)
+    return write_returning(db, Equipo, insert(Equipo.__table__).values(nombre=equipo.nombre))[0]
 
-    return db_equipo
 
-
-def update_equipo(db: Session, equipo: EquipoBaseModel, equipo_id: int):
-    """ Update an Equipo in our database given the values in the :equipo: param.
+@invalidates("equipos")
+def update_equipo(db: Session, equipo: Union[EquipoBaseModel, EquipoPatchModel], equipo_id: int):
+    """ Update an Equipo in our database given the values in the :equipo: param. Only the fields set in :equipo: are
+    written.
 
     Args:
         db (Session): The database Session.
-        equipo (EquipoBaseModel): The EquipoBaseModel to update an Equipo in our database.
+        equipo (EquipoBaseModel | EquipoPatchModel): The values to update an Equipo in our database.
         equipo_id (int): The Equipo id passed as url param.
 
     Returns:
         Updated Equipo object if found, None otherwise.
     """
-    db_equipo = db.get(Equipo, equipo_id)
-
-    if db_equipo is None:
-        return db_equipo
-
-    db_equipo.nombre = equipo.nombre
-    db.add(db_equipo)
-    db.commit()
-    db.refresh(db_equipo)
+    equipos = write_returning(db, Equipo, update(Equipo.__table__)
+                              .where(Equipo.id == equipo_id)
+                              .values(**equipo.dict(exclude_unset=True)))
 
-    return db_equipo
+    return equipos[0] if equipos else None
 
 
+@invalidates("equipos")
 def delete_equipo(db: Session, equipo_id: int):
     """ Delete an Equipo in our database given an id :equipo_id:
 
@@ -178,20 +323,15 @@ def delete_equipo(db: Session, equipo_id: int):
         Returns:
             Deleted Equipo object if found, None otherwise.
         """
-    db_equipo = db.get(Equipo, equipo_id)
-
-    if db_equipo is None:
-        return db_equipo
-
-    db.delete(db_equipo)
-    db.commit()
+    equipos = write_returning(db, Equipo, delete(Equipo.__table__).where(Equipo.id == equipo_id))
 
-    return db_equipo
+    return equipos[0] if equipos else None
 
 
 # ================================
 #           SELECCION
 # ================================
+@cached("selecciones", SeleccionResponseModel)
 def get_seleccion(db: Session, seleccion_id: int):
     """ Get a Seleccion object from our database given an id :seleccion_id:
 
@@ -205,18 +345,61 @@ def get_seleccion(db: Session, seleccion_id: int):
     return db.query(Seleccion).filter(Seleccion.id == seleccion_id).first()
 
 
-def get_selecciones(db: Session):
-    """ Get all Seleccion objects from our database.
+@cached("selecciones", SeleccionResponseModel)
+def get_selecciones(db: Session, limit: Optional[int] = None, after_id: Optional[int] = None):
+    """ Get Seleccion objects from our database, ordered by id.
 
         Args:
             db (Session): The database Session.
+            limit (int): Max amount of Seleccion objects to return, all of them if None.
+            after_id (int): Only Seleccion objects with a greater id are returned, if given.
 
         Returns:
             Seleccion objects list if found, empty list otherwise.
         """
-    return db.query(Seleccion).all()
+    return paginate(db.query(Seleccion), Seleccion, limit, after_id)
+
+
+def search_selecciones(db: Session, q: str, limit: int):
+    """ Search Seleccion objects by pais. See search.
+
+    Args:
+        db (Session): The database Session.
+        q (str): The searched text.
+        limit (int): Max amount of Seleccion objects to return.
+
+    Returns:
+        Seleccion objects list, the best matches first.
+    """
+    return search(db, Seleccion, [Seleccion.pais], q, limit)
+
+
+def get_seleccion_integrantes(db: Session, seleccion_id: int):
+    """ Get a Seleccion object given an id :seleccion_id:, with its Integrante objects and their Equipo loaded in
+    the same query. Integrantes are ordered by num_camiseta.
 
+    Args:
+        db (Session): The database Session.
+        seleccion_id (int): The Seleccion id.
+
+    Returns:
+        Seleccion object if found, None otherwise.
+    """
+    selecciones = (db.query(Seleccion)
+                   .outerjoin(Seleccion.integrantes)
+                   .outerjoin(Integrante.equipo)
+                   .options(contains_eager(Seleccion.integrantes).contains_eager(Integrante.equipo),
+                            contains_eager(Seleccion.integrantes).lazyload(Integrante.seleccion),
+                            contains_eager(Seleccion.integrantes).lazyload(Integrante.rol))
+                   .filter(Seleccion.id == seleccion_id)
+                   .order_by(Integrante.num_camiseta, Integrante.id)
+                   .all())
 
+    # Every row carries the same Seleccion, one per Integrante.
+    return selecciones[0] if selecciones else None
+
+
+@invalidates("selecciones")
 def create_seleccion(db: Session, seleccion: SeleccionBaseModel):
     """ Create a Seleccion in our database given the values in the :seleccion: param.
 
@@ -227,38 +410,30 @@ def create_seleccion(db: Session, seleccion: SeleccionBaseModel):
         Returns:
             Created Seleccion object.
         """
-    db_seleccion = Seleccion(pais=seleccion.pais)
-    db.add(db_seleccion)
-    db.commit()
-    db.refresh(db_seleccion)
-
-    return db_seleccion
+    return write_returning(db, Seleccion, insert(Seleccion.__table__).values(pais=seleccion.pais))[0]
 
 
-def update_seleccion(db: Session, seleccion: SeleccionBaseModel, seleccion_id: int):
-    """ Update an Seleccion in our database given the values in the :seleccion: param.
+@invalidates("selecciones")
+def update_seleccion(db: Session, seleccion: Union[SeleccionBaseModel, SeleccionPatchModel], seleccion_id: int):
+    """ Update an Seleccion in our database given the values in the :seleccion: param. Only the fields set in
+    :seleccion: are written.
 
     Args:
         db (Session): The database Session.
-        seleccion (SeleccionBaseModel): The SeleccionBaseModel to update an Seleccion in our database.
+        seleccion (SeleccionBaseModel | SeleccionPatchModel): The values to update an Seleccion in our database.
         seleccion_id (int): The Seleccion id passed as url param.
 
     Returns:
         Updated Seleccion object if found, None otherwise.
     """
-    db_seleccion = db.get(Seleccion, seleccion_id)
-
-    if db_seleccion is None:
-        return db_seleccion
-
-    db_seleccion.pais = seleccion.pais
-    db.add(db_seleccion)
-    db.commit()
-    db.refresh(db_seleccion)
+    selecciones = write_returning(db, Seleccion, update(Seleccion.__table__)
+                                  .where(Seleccion.id == seleccion_id)
+                                  .values(**seleccion.dict(exclude_unset=True)))
 
-    return db_seleccion
+    return selecciones[0] if selecciones else None
 
 
+@invalidates("selecciones")
 def delete_seleccion(db: Session, seleccion_id: int):
     """ Delete a Seleccion in our database given an id :seleccion_id:
 
@@ -269,15 +444,9 @@ def delete_seleccion(db: Session, seleccion_id: int):
         Returns:
             Deleted Seleccion object if found, None otherwise.
         """
-    db_seleccion = db.get(Seleccion, seleccion_id)
+    selecciones = write_returning(db, Seleccion, delete(Seleccion.__table__).where(Seleccion.id == seleccion_id))
 
-    if db_seleccion is None:
-        return db_seleccion
-
-    db.delete(db_seleccion)
-    db.commit()
-
-    return db_seleccion
+    return selecciones[0] if selecciones else None
 
 
 # ================================
@@ -296,18 +465,100 @@ def get_integrante(db: Session, integrante_id: int):
     return db.query(Integrante).filter(Integrante.id == integrante_id).first()
 
 
-def get_integrantes(db: Session):
-    """ Get all Integrante objects from our database.
+def after_sort_key(order_by: list, after: tuple, descending: bool):
+    """ Build the filter of the rows that come after the sort key :after: in the order of :order_by: (a column and
+    then id, or just id).
+
+    Postgres sorts NULLs last in ascending order and first in descending order, and comparing a row with a NULL in it
+    gives NULL, so the rows whose sort column is NULL are matched on their own.
+    """
+    sort_key = tuple_(*order_by)
+    if len(order_by) == 1 or not order_by[0].expression.nullable:
+        return sort_key < tuple_(*after) if descending else sort_key > tuple_(*after)
+
+    column, id_column = order_by
+    value, after_id = after
+    if value is None:
+        if descending:
+            return or_(and_(column.is_(None), id_column < after_id), column.isnot(None))
+        return and_(column.is_(None), id_column > after_id)
+
+    if descending:
+        return sort_key < tuple_(value, after_id)
+    return or_(sort_key > tuple_(value, after_id), column.is_(None))
+
+
+def get_integrantes(db: Session, limit: Optional[int] = None, after: Optional[tuple] = None,
+                    filters: Optional[IntegranteFilterModel] = None, sort: str = "id",
+                    fields: Optional[List[str]] = None):
+    """ Get Integrante objects from our database, ordered by :sort: and then id.
 
         Args:
             db (Session): The database Session.
+            limit (int): Max amount of Integrante objects to return, all of them if None.
+            after (tuple): Only Integrante objects after this sort key are returned, if given. The key is (id,)
+                when sorting by id, (:sort: value, id) otherwise.
+            filters (IntegranteFilterModel): Only Integrante objects matching every filter set are returned.
+            sort (str): The Integrante column to order by, in descending order if it starts with "-".
+            fields (List[str]): Only select these columns and relationships (see INTEGRANTE_FIELDS), if given.
+                id and the :sort: column are always selected.
 
         Returns:
-            Integrantes list if found, Empty List otherwise.
+            Integrantes list if found, Empty List otherwise. With :fields:, a list of dicts instead.
         """
-    return db.query(Integrante).all()
+    descending = sort.startswith("-")
+    sort_name = sort.lstrip("-")
+    sort_column = getattr(Integrante, sort_name)
+
+    query = db.query(Integrante)
+
+    if fields is not None:
+        columns = []
+        for field in dict.fromkeys(["id", sort_name, *fields]):
+            attribute = getattr(Integrante, field)
+
+            if field in ("seleccion", "equipo", "rol"):
+                # Aliased so the row key is the field name.
+                related = aliased(attribute.mapper.class_, name=field)
+                query = query.join(attribute.of_type(related))
+                columns.append(related)
+            else:
+                columns.append(attribute)
+
+        query = query.with_entities(*columns)
+
+    filters = filters or IntegranteFilterModel()
+    for name in ("seleccion_id", "equipo_id", "rol_id", "num_camiseta"):
+        if getattr(filters, name) is not None:
+            query = query.filter(getattr(Integrante, name) == getattr(filters, name))
 
+    if filters.edad_min is not None:
+        query = query.filter(Integrante.edad >= filters.edad_min)
 
+    if filters.edad_max is not None:
+        query = query.filter(Integrante.edad <= filters.edad_max)
+
+    order_by = [Integrante.id] if sort_name == "id" else [sort_column, Integrante.id]
+
+    if after is not None:
+        query = query.filter(after_sort_key(order_by, after, descending))
+
+    query = query.order_by(*[column.desc() if descending else column for column in order_by])
+
+    if limit is not None:
+        query = query.limit(limit)
+
+    if fields is None:
+        return query.all()
+
+    # Related objects are sent as their columns, without going through the response models.
+    return [{key: {column.key: getattr(value, column.key) for column in value.__table__.columns}
+             if isinstance(value, Base) else value
+             for key, value in row._mapping.items()}
+            for row in query.all()]
+
+
+@invalidates("integrantes")
 def create_integrante(db: Session, integrante: IntegranteBaseModel):
     """ Create an Integrante in our database given the values in the :integrante: param.
 
@@ -318,53 +569,31 @@ def create_integrante(db: Session, integrante: IntegranteBaseModel):
         Returns:
             Created Integrante object.
         """
-    db_integrante = Integrante(nombre=integrante.nombre,
-                               apodo=integrante.apodo,
-                               apellido=integrante.apellido,
-                               edad=integrante.edad,
-                               num_camiseta=integrante.num_camiseta,
-                               seleccion_id=integrante.seleccion_id,
-                               equipo_id=integrante.equipo_id,
-                               rol_id=integrante.rol_id)
-    db.add(db_integrante)
-    db.commit()
-    db.refresh(db_integrante)
+    return write_returning(db, Integrante, insert(Integrante.__table__).values(**integrante.dict()))[0]
 
-    return db_integrante
 
-
-def update_integrante(db: Session, integrante: IntegranteBaseModel, integrante_id: int):
-    """ Update an Integrante in our database given the values in the :integrante: param.
+@invalidates("integrantes")
+def update_integrante(db: Session, integrante: Union[IntegranteBaseModel, IntegrantePatchModel], integrante_id: int):
+    """ Update an Integrante in our database given the values in the :integrante: param. Only the fields set in
+    :integrante: are written, so a partial update neither rewrites the other columns nor checks foreign keys it
+    doesn't change.
 
     Args:
         db (Session): The database Session.
-        integrante (IntegranteBaseModel): The IntegranteBaseModel to update an Integrante in our database.
+        integrante (IntegranteBaseModel | IntegrantePatchModel): The values to update an Integrante in our database.
         integrante_id (int): The Integrante id passed as url param.
 
     Returns:
         Updated Integrante object if found, None otherwise.
     """
-    db_integrante = db.get(Integrante, integrante_id)
-
-    if db_integrante is None:
-        return db_integrante
-
-    db_integrante.nombre = integrante.nombre
-    db_integrante.apodo = integrante.apodo
-    db_integrante.apellido = integrante.apellido
-    db_integrante.edad = integrante.edad
-    db_integrante.num_camiseta = integrante.num_camiseta
-    db_integrante.seleccion_id = integrante.seleccion_id
-    db_integrante.equipo_id = integrante.equipo_id
-    db_integrante.rol_id = integrante.rol_id
-
-    db.add(db_integrante)
-    db.commit()
-    db.refresh(db_integrante)
+    integrantes = write_returning(db, Integrante, update(Integrante.__table__)
+                                  .where(Integrante.id == integrante_id)
+                                  .values(**integrante.dict(exclude_unset=True)))
 
-    return db_integrante
+    return integrantes[0] if integrantes else None
 
 
+@invalidates("integrantes")
 def delete_integrante(db: Session, integrante_id: int):
     """ Delete an Integrante in our database given an id :integrante_id:
 
@@ -375,15 +604,233 @@ def delete_integrante(db: Session, integrante_id: int):
         Returns:
             Deleted Integrante object if found, None otherwise.
         """
-    db_integrante = db.get(Integrante, integrante_id)
+    if not write_returning(db, Integrante, delete(Integrante.__table__).where(Integrante.id == integrante_id)):
+        return None
 
-    if db_integrante is None:
-        return db_integrante
+    return {"OK": f"Integrante con id: {integrante_id} eliminado exitosamente"}
+
+
+def search_integrantes(db: Session, q: str, limit: int):
+    """ Search Integrante objects by nombre, apodo and apellido. See search.
+
+    Args:
+        db (Session): The database Session.
+        q (str): The searched text.
+        limit (int): Max amount of Integrante objects to return.
+
+    Returns:
+        Integrante objects list, the best matches first.
+    """
+    return search(db, Integrante, [Integrante.nombre, Integrante.apodo, Integrante.apellido], q, limit)
+
+
+def select_integrantes_export():
+    """ Build the query of every Integrante, with the names of its Seleccion, Equipo and Rol as flat columns,
+    ordered by id. It is meant to be streamed (see database.stream_db) rather than loaded at once.
+
+    Returns:
+        The Select statement.
+    """
+    return (select(Integrante.id, Integrante.nombre, Integrante.apodo, Integrante.apellido, Integrante.edad,
+                   Integrante.num_camiseta, Integrante.seleccion_id, Seleccion.pais.label("seleccion_pais"),
+                   Integrante.equipo_id, Equipo.nombre.label("equipo_nombre"), Integrante.rol_id,
+                   Rol.titulo.label("rol_titulo"))
+            .join(Seleccion, Integrante.seleccion_id == Seleccion.id)
+            .join(Equipo, Integrante.equipo_id == Equipo.id)
+            .join(Rol, Integrante.rol_id == Rol.id)
+            .order_by(Integrante.id))
+
+
+def get_integrantes_by_ids(db: Session, integrante_ids: List[int]):
+    """ Get the Integrante objects whose id is in :integrante_ids:, ordered by id.
+
+    Args:
+        db (Session): The database Session.
+        integrante_ids (List[int]): The Integrante ids.
+
+    Returns:
+        Integrantes list, missing ids are skipped.
+    """
+    if not integrante_ids:
+        return []
+
+    return db.query(Integrante).filter(Integrante.id.in_(integrante_ids)).order_by(Integrante.id).all()
+
+
+def _integrante_reference_errors(db: Session, integrantes: List[IntegranteBaseModel]):
+    """ Check in a single query that the Seleccion, Equipo and Rol referenced by each of :integrantes: exist.
+
+    Args:
+        db (Session): The database Session.
+        integrantes (List[IntegranteBaseModel]): The integrantes to check.
 
-    db.delete(db_integrante)
+    Returns:
+        Dict mapping the index of each invalid integrante to its error message.
+    """
+    references = ((Seleccion, "seleccion_id", "Selección no encontrada"),
+                  (Equipo, "equipo_id", "Equipo no encontrado."),
+                  (Rol, "rol_id", "Rol no encontrado."))
+
+    existing_ids_query = union_all(*[select(literal(field).label("field"), model.id)
+                                     .where(model.id.in_({getattr(integrante, field) for integrante in integrantes}))
+                                     for model, field, _ in references])
+    existing_ids = set(db.execute(existing_ids_query).all())
+
+    errors = {}
+    for index, integrante in enumerate(integrantes):
+        missing = [detail for _, field, detail in references if (field, getattr(integrante, field)) not in existing_ids]
+        if missing:
+            errors[index] = " ".join(missing)
+
+    return errors
+
+
+@invalidates("integrantes")
+def create_integrantes(db: Session, integrantes: List[IntegranteBaseModel]):
+    """ Create many Integrantes in our database with a single multi-row INSERT ... RETURNING, in one transaction.
+
+    Integrantes referencing a Seleccion, Equipo or Rol that doesn't exist are skipped and reported.
+
+    Args:
+        db (Session): The database Session.
+        integrantes (List[IntegranteBaseModel]): The IntegranteBaseModels to create Integrantes in our database.
+
+    Returns:
+        Tuple with the list of created Integrante objects and a list of {"index", "detail"} errors.
+    """
+    errors = _integrante_reference_errors(db, integrantes)
+    valid = [integrante.dict() for index, integrante in enumerate(integrantes) if index not in errors]
+
+    created = []
+    if valid:
+        created = sorted(write_returning(db, Integrante, insert(Integrante.__table__).values(valid)),
+                         key=lambda integrante: integrante.id)
+
+    return created, [{"index": index, "detail": detail} for index, detail in errors.items()]
+
+
+@invalidates("integrantes")
+def update_integrantes(db: Session, integrantes: List[IntegranteBulkUpdateModel]):
+    """ Update many Integrantes in our database in one transaction, given the values in :integrantes:.
+
+    Integrantes that don't exist or reference a Seleccion, Equipo or Rol that doesn't exist are skipped and
+    reported.
+
+    Args:
+        db (Session): The database Session.
+        integrantes (List[IntegranteBulkUpdateModel]): The values to update, each one with its Integrante id.
+
+    Returns:
+        Tuple with the list of updated Integrante objects and a list of {"index", "detail"} errors.
+    """
+    errors = _integrante_reference_errors(db, integrantes)
+
+    requested_ids = {integrante.id for integrante in integrantes}
+    existing_ids = set(db.execute(select(Integrante.id).where(Integrante.id.in_(requested_ids))).scalars())
+    for index, integrante in enumerate(integrantes):
+        if integrante.id not in existing_ids:
+            errors[index] = "Integrante no encontrado"
+
+    valid = [integrante for index, integrante in enumerate(integrantes) if index not in errors]
+
+    if valid:
+        # The SET clause is built from the keys of each parameter dict
+        integrantes_table = Integrante.__table__
+        statement = update(integrantes_table).where(integrantes_table.c.id == bindparam("integrante_id"))
+        db.execute(statement, [{"integrante_id": integrante.id, **integrante.dict(exclude={"id"})}
+                               for integrante in valid])
     db.commit()
 
-    return {"OK": f"Integrante con id: {integrante_id} eliminado exitosamente"}
+    return (get_integrantes_by_ids(db, [integrante.id for integrante in valid]),
+            [{"index": index, "detail": detail} for index, detail in sorted(errors.items())])
+
+
+@invalidates("integrantes")
+def delete_integrantes(db: Session, integrante_ids: List[int]):
+    """ Delete many Integrantes in our database with a single DELETE ... RETURNING, in one transaction.
+
+    Args:
+        db (Session): The database Session.
+        integrante_ids (List[int]): The Integrante ids.
+
+    Returns:
+        Tuple with the list of deleted ids and a list of {"index", "detail"} errors for the ids not found.
+    """
+    integrantes_table = Integrante.__table__
+    statement = (delete(integrantes_table)
+                 .where(integrantes_table.c.id.in_(integrante_ids))
+                 .returning(integrantes_table.c.id))
+    deleted_ids = set(db.execute(statement).scalars())
+    db.commit()
+
+    return (sorted(deleted_ids),
+            [{"index": index, "detail": "Integrante no encontrado"}
+             for index, integrante_id in enumerate(integrante_ids) if integrante_id not in deleted_ids])
+
+
+# Columns of the integrantes table filled by copy_integrantes, in the order sent to COPY.
+INTEGRANTE_COPY_COLUMNS = ("nombre", "apodo", "apellido", "edad", "num_camiseta", "seleccion_id", "equipo_id", "rol_id")
+
+
+def get_integrante_references(db: Session):
+    """ Get the id and name of every Seleccion, Equipo and Rol, so imports can resolve references in memory.
+
+    Args:
+        db (Session): The database Session.
+
+    Returns:
+        Dict mapping "seleccion_id", "equipo_id" and "rol_id" to a dict of {id: name} of the referenced table.
+    """
+    references = (("seleccion_id", Seleccion.id, Seleccion.pais),
+                  ("equipo_id", Equipo.id, Equipo.nombre),
+                  ("rol_id", Rol.id, Rol.titulo))
+
+    return {field: dict(db.execute(select(id_column, name_column)).all())
+            for field, id_column, name_column in references}
+
+
+@invalidates("integrantes")
+def copy_integrantes(db: Session, integrantes: List[dict]):
+    """ Insert many already validated Integrantes in our database and commit, without loading them back.
+
+    With psycopg2 the rows are sent in a single COPY ... FROM STDIN, which is several times faster than INSERT for
+    big batches. Other drivers fall back to an executemany INSERT.
+
+    Args:
+        db (Session): The database Session.
+        integrantes (List[dict]): The values of the INTEGRANTE_COPY_COLUMNS of each Integrante.
+
+    Returns:
+        The method used, "copy" or "executemany".
+
+    Raises:
+        DBAPIError: If the database rejects the rows. Nothing is committed then.
+    """
+    connection = db.connection()
+
+    if connection.dialect.driver == "psycopg2":
+        buffer = io.StringIO()
+        # Strings are always quoted, so only None is written as an unquoted empty field, which COPY reads as NULL.
+        csv.writer(buffer, quoting=csv.QUOTE_NONNUMERIC).writerows(
+            [integrante[column] for column in INTEGRANTE_COPY_COLUMNS] for integrante in integrantes)
+        buffer.seek(0)
+
+        statement = f"COPY {Integrante.__tablename__} ({', '.join(INTEGRANTE_COPY_COLUMNS)}) " \
+                    f"FROM STDIN WITH (FORMAT csv)"
+        try:
+            with connection.connection.cursor() as cursor:
+                cursor.copy_expert(statement, buffer)
+        except connection.dialect.dbapi.Error as error:
+            # The raw cursor bypasses SQLAlchemy, so its errors are wrapped like the ones of db.execute.
+            raise DBAPIError.instance(statement, None, error, connection.dialect.dbapi.Error)
+        method = "copy"
+    else:
+        db.execute(insert(Integrante), integrantes)
+        method = "executemany"
+
+    db.commit()
+
+    return method
 
 
 # ================================
@@ -402,63 +849,64 @@ def get_usuario(db: Session, usuario_id: int):
     return db.query(Usuario).filter(Usuario.id == usuario_id).first()
 
 
-def get_usuarios(db: Session):
-    """ Get all Usuario objects from our database
+def get_usuarios(db: Session, limit: Optional[int] = None, after_id: Optional[int] = None):
+    """ Get Usuario objects from our database, ordered by id
 
     Args:
         db (Session): The database Session.
+        limit (int): Max amount of Usuario objects to return, all of them if None.
+        after_id (int): Only Usuario objects with a greater id are returned, if given.
 
     Returns:
         Usuario objects list if found, empty list otherwise.
     """
-    return db.query(Usuario).all()
+    return paginate(db.query(Usuario), Usuario, limit, after_id)
 
 
-def create_usuario(db: Session, usuario: UsuarioBaseModel):
+# A new Usuario changes the usuarios listings (and their ETag), but no cached principal can refer to it.
+@invalidates("usuarios")
+def create_usuario(db: Session, usuario: UsuarioBaseModel, hashed_password: str):
     """ Create an Usuario in our database given the values in the :usuario: param.
 
             Args:
                 db (Session): The database Session.
                 usuario (UsuarioBaseModel): The UsuarioBaseModel to create an Usuario in our database.
+                hashed_password (str): The hash of usuario.password, stored instead of it.
 
             Returns:
                 Created Usuario object.
             """
-    db_usuario = Usuario(email=usuario.email,
-                         password=hash_password(usuario.password))
-    db.add(db_usuario)
-    db.commit()
-    db.refresh(db_usuario)
-
-    return db_usuario
+    return write_returning(db, Usuario, insert(Usuario.__table__).values(email=usuario.email,
+                                                                         password=hashed_password))[0]
 
 
-def update_usuario(db: Session, usuario: UsuarioBaseModel, usuario_id: int):
-    """ Update an Usuario in our database given the values in the :usuario: param.
+@invalidates("usuarios")
+@invalidates("current_usuarios", cache=auth_cache)
+def update_usuario(db: Session, usuario: Union[UsuarioBaseModel, UsuarioPatchModel], hashed_password: Optional[str],
+                   usuario_id: int):
+    """ Update an Usuario in our database given the values in the :usuario: param. Only the fields set in :usuario:
+    are written.
 
     Args:
         db (Session): The database Session.
-        usuario (UsuarioBaseModel): The UsuarioBaseModel to update an Usuario in our database.
+        usuario (UsuarioBaseModel | UsuarioPatchModel): The values to update an Usuario in our database.
+        hashed_password (str): The hash of usuario.password, stored instead of it. None if it isn't updated.
         usuario_id (int): The Usuario id passed as url param.
 
     Returns:
         Updated Usuario object if found, None otherwise.
     """
-    db_usuario = db.get(Usuario, usuario_id)
+    values = usuario.dict(exclude_unset=True, exclude={"password"})
+    if hashed_password is not None:
+        values["password"] = hashed_password
 
-    if db_usuario is None:
-        return db_usuario
+    usuarios = write_returning(db, Usuario, update(Usuario.__table__).where(Usuario.id == usuario_id).values(**values))
 
-    db_usuario.email = usuario.email
-    db_usuario.password = hash_password(usuario.password)
-
-    db.add(db_usuario)
-    db.commit()
-    db.refresh(db_usuario)
-
-    return db_usuario
+    return usuarios[0] if usuarios else None
 
 
+@invalidates("usuarios")
+@invalidates("current_usuarios", cache=auth_cache)
 def delete_usuario(db: Session, usuario_id: int):
     """ Delete an Usuario in our database given an id :usuario_id:
 
@@ -469,15 +917,38 @@ def delete_usuario(db: Session, usuario_id: int):
         Returns:
             Message if Usuario is found, None otherwise.
         """
-    db_usuario = db.get(Usuario, usuario_id)
+    if not write_returning(db, Usuario, delete(Usuario.__table__).where(Usuario.id == usuario_id)):
+        return None
+
+    return {"OK": f"Usuario con id: {usuario_id} eliminado exitosamente"}
+
 
-    if db_usuario is None:
-        return db_usuario
+@invalidates("current_usuarios", cache=auth_cache)
+def update_usuario_password(db: Session, usuario_id: int, hashed_password: str):
+    """ Replace the password hash of an Usuario, e.g. after rehashing it with the current hash settings.
 
-    db.delete(db_usuario)
+    Args:
+        db (Session): The database Session.
+        usuario_id (int): The Usuario id.
+        hashed_password (str): The new password hash.
+    """
+    db.query(Usuario).filter(Usuario.id == usuario_id).update({Usuario.password: hashed_password},
+                                                             synchronize_session=False)
     db.commit()
 
-    return {"OK": f"Usuario con id: {usuario_id} eliminado exitosamente"}
+
+@cached("current_usuarios", CurrentUsuarioModel, cache=auth_cache)
+def get_current_usuario(db: Session, usuario_id: int):
+    """ Get the id, email and is_admin of the authenticated Usuario, cached for AUTH_CACHE_TTL seconds.
+
+    Args:
+        db (Session): The database Session.
+        usuario_id (int): The Usuario id from the access token.
+
+    Returns:
+        CurrentUsuarioModel if found, None otherwise.
+    """
+    return db.query(Usuario).filter(Usuario.id == usuario_id).first()
 
 
 def get_usuario_by_email(db: Session, usuario: OAuth2PasswordRequestForm):
@@ -1,7 +1,20 @@
-from sqlalchemy import create_engine
+import asyncio
+import itertools
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from fastapi import Depends, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
-from decouple import config
+from sqlalchemy.pool import QueuePool, AsyncAdaptedQueuePool
+from decouple import config, Csv
+
+from project.metrics import PoolMetrics, observe_statement
 
 DB_HOST = config("DB_HOST")
 DB_USER = config("DB_USER")
@@ -9,22 +22,265 @@ DB_PASSWORD = config("DB_PASSWORD")
 DB_PORT = config("DB_PORT")
 # SQLALCHEMY_DATABASE_URL = config("DATABASE_URL_2")
 
-SQLALCHEMY_DATABASE_URL = f"postgresql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/db_scalonetapp"
+# When enabled, requests get an AsyncSession (asyncpg) instead of a psycopg2 Session.
+ASYNC_DB = config("ASYNC_DB", default=False, cast=bool)
+
+# Per worker: size the pool so workers * (DB_POOL_SIZE + DB_MAX_OVERFLOW) stays below Postgres max_connections.
+DB_POOL_SIZE = config("DB_POOL_SIZE", default=5, cast=int)
+DB_MAX_OVERFLOW = config("DB_MAX_OVERFLOW", default=10, cast=int)
+DB_POOL_TIMEOUT = config("DB_POOL_TIMEOUT", default=30, cast=float)
+DB_POOL_RECYCLE = config("DB_POOL_RECYCLE", default=1800, cast=int)
+DB_POOL_PRE_PING = config("DB_POOL_PRE_PING", default=True, cast=bool)
+# Threads that release the connections of finished requests, apart from the threadpool (see close_session).
+DB_CLOSE_WORKERS = config("DB_CLOSE_WORKERS", default=4, cast=int)
+
+# Read replicas as "host" or "host:port", with the primary's credentials. Without them every query uses the primary.
+DB_REPLICA_HOSTS = config("DB_REPLICA_HOSTS", default="", cast=Csv())
+# Seconds a client keeps reading from the primary after a write, so it sees its own writes despite replication lag.
+DB_REPLICA_STICKINESS = config("DB_REPLICA_STICKINESS", default=5, cast=int)
+
+PRIMARY_COOKIE = "db_primary"
+
+
+def database_url(host: str, port: str = DB_PORT, driver: str = "postgresql"):
+    """ Build the URL of the db_scalonetapp database at :host:, which may carry its own port as "host:port". """
+    host, _, host_port = host.partition(":")
+    return f"{driver}://{DB_USER}:{DB_PASSWORD}@{host}:{host_port or port}/db_scalonetapp"
+
+
+SQLALCHEMY_DATABASE_URL = database_url(DB_HOST)
+SQLALCHEMY_ASYNC_DATABASE_URL = database_url(DB_HOST, driver="postgresql+asyncpg")
+
+
+class MeteredPoolMixin:
+    """
+    Records in self.metrics how long each connection checkout waited for the pool.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.metrics = PoolMetrics()
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except PoolTimeoutError:
+            self.metrics.observe_checkout(time.perf_counter() - start, timed_out=True)
+            raise
+
+        self.metrics.observe_checkout(time.perf_counter() - start)
+        return connection
+
+    def stats(self):
+        """ Get the pool usage and checkout metrics. """
+        return {
+            "size": self.size(),
+            "checked_out": self.checkedout(),
+            "checked_in": self.checkedin(),
+            "overflow": self.overflow(),
+            **self.metrics.stats(),
+        }
+
+
+class MeteredQueuePool(MeteredPoolMixin, QueuePool):
+    pass
+
+
+class MeteredAsyncQueuePool(MeteredPoolMixin, AsyncAdaptedQueuePool):
+    pass
 
-engine = create_engine(SQLALCHEMY_DATABASE_URL)
+
+@event.listens_for(Engine, "before_cursor_execute")
+def start_statement_timer(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("statement_start", []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def stop_statement_timer(conn, cursor, statement, parameters, context, executemany):
+    """
+    Record every statement and its duration in the RequestTimings of the current request (see project.metrics).
+    Listening on the Engine class covers the primary, the replicas and the sync_engine of the async engines.
+    """
+    observe_statement(statement, time.perf_counter() - conn.info["statement_start"].pop())
+
+
+@event.listens_for(Engine, "handle_error")
+def discard_statement_timer(exception_context):
+    # Failed statements don't reach after_cursor_execute, so their start time is dropped here.
+    connection = exception_context.connection
+    if connection is not None and connection.info.get("statement_start"):
+        connection.info["statement_start"].pop()
+
+
+POOL_SETTINGS = {
+    "pool_size": DB_POOL_SIZE,
+    "max_overflow": DB_MAX_OVERFLOW,
+    "pool_timeout": DB_POOL_TIMEOUT,
+    "pool_recycle": DB_POOL_RECYCLE,
+    "pool_pre_ping": DB_POOL_PRE_PING,
+}
+
+engine = create_engine(SQLALCHEMY_DATABASE_URL, poolclass=MeteredQueuePool, **POOL_SETTINGS)
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+async_engine = create_async_engine(SQLALCHEMY_ASYNC_DATABASE_URL, poolclass=MeteredAsyncQueuePool,
+                                   **POOL_SETTINGS) if ASYNC_DB else None
+
+AsyncSessionLocal = sessionmaker(autocommit=False, autoflush=False, expire_on_commit=False,
+                                 class_=AsyncSession, bind=async_engine)
+
+# Session.info of the replica Sessions, so what they read can be told apart (see project.cache.cached).
+REPLICA_SESSION_INFO = {"replica": True}
+
+if ASYNC_DB:
+    replica_engines = [create_async_engine(database_url(host, driver="postgresql+asyncpg"),
+                                           poolclass=MeteredAsyncQueuePool, **POOL_SETTINGS)
+                       for host in DB_REPLICA_HOSTS]
+    replica_sessions = [sessionmaker(autocommit=False, autoflush=False, expire_on_commit=False,
+                                     class_=AsyncSession, bind=replica_engine, info=REPLICA_SESSION_INFO)
+                        for replica_engine in replica_engines]
+else:
+    replica_engines = [create_engine(database_url(host), poolclass=MeteredQueuePool, **POOL_SETTINGS)
+                       for host in DB_REPLICA_HOSTS]
+    replica_sessions = [sessionmaker(autocommit=False, autoflush=False, bind=replica_engine,
+                                     info=REPLICA_SESSION_INFO)
+                        for replica_engine in replica_engines]
+
+# Round robin over the replicas. Dependencies run on the event loop, so no lock is needed.
+next_replica_session = itertools.cycle(replica_sessions).__next__ if replica_sessions else None
+
 Base = declarative_base()
 
 
-def get_db():
+close_executor = ThreadPoolExecutor(max_workers=DB_CLOSE_WORKERS, thread_name_prefix="db-close")
+
+
+async def close_session(db):
+    """ Close a regular Session without blocking the event loop nor taking a threadpool slot.
+
+    Releasing a connection rolls its transaction back, a round trip to the database, so it runs in close_executor.
+    Not in the threadpool: under load every thread can end up waiting for a pooled connection that is only released
+    by a close() queued behind them. A Session that never opened a connection is closed right away.
+    """
+    if db.in_transaction():
+        await asyncio.get_running_loop().run_in_executor(close_executor, db.close)
+    else:
+        db.close()
+
+
+async def get_sync_db():
     """
     Creates a SQLAlchemy SessionLocal dependency that will be used in a single request.
-    It is closed once the request is finished.
+    It is closed once the request is finished, with close_session.
     """
     db = SessionLocal()
     try:
         yield db
     finally:
-        db.close()
+        await close_session(db)
+
+
+async def get_async_db():
+    """
+    Creates a SQLAlchemy AsyncSession dependency that will be used in a single request.
+    It is closed once the request is finished.
+    """
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
+get_db = get_async_db if ASYNC_DB else get_sync_db
+
+
+async def get_write_db(response: Response, db=Depends(get_db)):
+    """
+    Session on the primary for handlers that write. When there are replicas, it also marks the client to read from
+    the primary during the next DB_REPLICA_STICKINESS seconds, so it doesn't miss its own write.
+    """
+    if replica_sessions:
+        response.set_cookie(PRIMARY_COOKIE, "1", max_age=DB_REPLICA_STICKINESS, httponly=True, samesite="lax")
+
+    return db
+
+
+def reads_from_replica(request: Request):
+    """ Whether get_read_db serves :request: from a replica: there are replicas and the client didn't write
+    recently (see get_write_db). """
+    return next_replica_session is not None and not request.cookies.get(PRIMARY_COOKIE)
+
+
+async def get_read_db(request: Request, db=Depends(get_db)):
+    """
+    Session for read-only handlers: on the next replica, or on the primary if there are no replicas or the client
+    wrote recently (see get_write_db). The primary Session doesn't open a connection unless it is used.
+    """
+    if not reads_from_replica(request):
+        yield db
+        return
+
+    replica_db = next_replica_session()
+    # Cache misses are read through the primary (see project.cache.cached), which opens no connection otherwise.
+    replica_db.info["primary"] = db
+    try:
+        yield replica_db
+    finally:
+        if isinstance(replica_db, AsyncSession):
+            await replica_db.close()
+        else:
+            await close_session(replica_db)
+
+
+async def run_db(db, function, *args, **kwargs):
+    """ Run a synchronous crud :function: without blocking the event loop.
+
+    With an AsyncSession the function runs through AsyncSession.run_sync, so its queries go over the
+    asyncpg driver. With a regular Session the function is sent to the threadpool.
+
+    Args:
+        db (Session | AsyncSession): The database Session.
+        function (Callable): The crud function, which receives the Session as its first argument.
+        *args: Remaining arguments for :function:.
+        **kwargs: Keyword arguments for :function:.
+
+    Returns:
+        Whatever :function: returns.
+    """
+    if isinstance(db, AsyncSession):
+        return await db.run_sync(function, *args, **kwargs)
+
+    return await run_in_threadpool(function, db, *args, **kwargs)
+
+
+async def stream_db(db, statement, batch_size: int):
+    """ Iterate the rows of :statement: in lists of up to :batch_size: rows, read through a server-side cursor.
+
+    Only one batch is held in memory at a time. With a regular Session every fetch is sent to the threadpool.
+
+    Args:
+        db (Session | AsyncSession): The database Session.
+        statement (Select): The query to run.
+        batch_size (int): Rows fetched from the cursor at a time.
+    """
+    statement = statement.execution_options(yield_per=batch_size)
+
+    if isinstance(db, AsyncSession):
+        result = await db.stream(statement)
+        try:
+            async for partition in result.partitions():
+                yield partition
+        finally:
+            await result.close()
+        return
+
+    result = await run_in_threadpool(db.execute, statement)
+    partitions = result.partitions()
+    try:
+        while True:
+            partition = await run_in_threadpool(next, partitions, None)
+            if partition is None:
+                return
+            yield partition
+    finally:
+        await run_in_threadpool(result.close)
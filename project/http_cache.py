@@ -0,0 +1,68 @@
+import hashlib
+import time
+
+from decouple import config
+from fastapi import Request, Response, status
+
+from project.cache import catalog_cache
+from project.database import DB_REPLICA_STICKINESS, reads_from_replica
+
+HTTP_CACHE_CONTROL = config("HTTP_CACHE_CONTROL", default="no-cache")
+
+
+class NotModified(Exception):
+    """
+    Raised by ETag when the client already has the current representation of the resource.
+    """
+
+    def __init__(self, etag: str):
+        self.etag = etag
+
+
+async def not_modified_exception_handler(request: Request, exc: NotModified):
+    return Response(status_code=status.HTTP_304_NOT_MODIFIED,
+                    headers={"ETag": exc.etag, "Cache-Control": HTTP_CACHE_CONTROL})
+
+
+class ETag:
+    """
+    Conditional GET dependency based on the versions of the tables a response is built from.
+
+    The versions change every time a crud write function decorated with `invalidates` runs, so the ETag is computed
+    without touching the database. It is computed before the handler reads anything: a write landing in between
+    can only make the ETag older than the data, never newer. When If-None-Match matches, NotModified is raised and
+    the handler doesn't run.
+
+    That doesn't hold for reads served by a replica, which may not have the last write yet. Their ETag also changes
+    every DB_REPLICA_STICKINESS seconds (the lag get_write_db already assumes), so a stale one lives that long at
+    most, and never matches the ETag of the same versions read from the primary. Responses built only by `cached`
+    getters don't need it: those read their misses through the primary.
+
+    __call__ is a plain function on purpose: FastAPI runs it in the threadpool, so looking the versions up in Redis
+    doesn't block the event loop.
+
+    Args:
+        *namespaces (str): The tables (cache namespaces) the response depends on.
+        cached (bool): Whether the response is built only by `cached` crud getters.
+    """
+
+    def __init__(self, *namespaces: str, cached: bool = False):
+        self.namespaces = namespaces
+        self.cached = cached
+
+    def __call__(self, request: Request, response: Response):
+        versions = ",".join(f"{namespace}={catalog_cache.version(namespace)}" for namespace in self.namespaces)
+        if not self.cached and reads_from_replica(request):
+            versions += f",replica={int(time.time() // max(DB_REPLICA_STICKINESS, 1))}"
+        etag = f'"{hashlib.sha1(versions.encode()).hexdigest()[:20]}"'
+
+        if_none_match = request.headers.get("If-None-Match")
+        if if_none_match is not None:
+            # If-None-Match uses the weak comparison, so W/ prefixes are ignored
+            client_etags = {client_etag.strip().replace("W/", "", 1) for client_etag in if_none_match.split(",")}
+
+            if etag in client_etags or "*" in client_etags:
+                raise NotModified(etag)
+
+        response.headers["ETag"] = etag
+        response.headers["Cache-Control"] = HTTP_CACHE_CONTROL
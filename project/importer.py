@@ -0,0 +1,275 @@
+"""
+Bulk import of integrantes from a CSV or NDJSON file, read as a stream.
+
+Each record is validated with IntegranteBaseModel. Its Seleccion, Equipo and Rol can be given by id (seleccion_id,
+equipo_id, rol_id) or by name (seleccion, equipo, rol, or the seleccion_pais, equipo_nombre and rol_titulo columns
+of the export), ignoring case and accents. References are resolved against maps loaded once per import, and the
+valid records are loaded with crud.copy_integrantes every IMPORT_BATCH_SIZE lines.
+
+    python -m project.importer jugadores.csv
+    python -m project.importer jugadores.ndjson --format ndjson
+"""
+import argparse
+import asyncio
+import codecs
+import csv
+import functools
+import json
+import sys
+import time
+from enum import Enum
+from typing import AsyncIterator, List, Tuple
+
+from decouple import config
+from pydantic import ValidationError
+from sqlalchemy.exc import DBAPIError
+
+from project import crud
+from project.cache import CACHE_BACKEND
+from project.database import run_db
+from project.schemas import IntegranteBaseModel
+from project.search import search_words
+
+IMPORT_BATCH_SIZE = config("IMPORT_BATCH_SIZE", default=5000, cast=int)
+# Rejected records listed in the report; the rest are only counted.
+IMPORT_MAX_ERRORS = config("IMPORT_MAX_ERRORS", default=100, cast=int)
+
+# Reference field, the fields that can carry its name, and the error when the name isn't found.
+REFERENCES = (("seleccion_id", ("seleccion", "seleccion_pais"), "Selección no encontrada"),
+              ("equipo_id", ("equipo", "equipo_nombre"), "Equipo no encontrado"),
+              ("rol_id", ("rol", "rol_titulo"), "Rol no encontrado"))
+
+AMBIGUOUS = object()
+
+
+class ImportFormat(str, Enum):
+    csv = "csv"
+    ndjson = "ndjson"
+
+
+@functools.lru_cache(maxsize=4096)
+def name_key(name: str):
+    """ The key names are compared by: their lowercase, unaccented words. Cached, since imported records repeat the
+    same few names. """
+    return " ".join(search_words(name))
+
+
+class IntegranteImporter:
+    """
+    Validates and loads the batches of lines of one import, and keeps its counters.
+
+    Args:
+        import_format (ImportFormat): The format of the lines.
+        references (dict): The Seleccion, Equipo and Rol {id: name} maps, from crud.get_integrante_references.
+    """
+
+    def __init__(self, import_format: ImportFormat, references: dict):
+        self.import_format = import_format
+        self.ids = {field: set(names) for field, names in references.items()}
+        self.names = {}
+        for field, names in references.items():
+            self.names[field] = {}
+            for reference_id, name in names.items():
+                key = name_key(name)
+                # Names shared by several rows can't be resolved.
+                self.names[field][key] = AMBIGUOUS if key in self.names[field] else reference_id
+
+        self.header = None
+        self.inserted = 0
+        self.rejected = 0
+        self.errors = []
+        self.method = None
+
+    def reject(self, line: int, detail: str):
+        self.rejected += 1
+        if len(self.errors) < IMPORT_MAX_ERRORS:
+            self.errors.append({"line": line, "detail": detail})
+
+    def parse(self, number: int, line: str):
+        """ Turn a :line: into a record dict, None if it is rejected or is the CSV header. """
+        if self.import_format is ImportFormat.ndjson:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                self.reject(number, "JSON inválido.")
+                return None
+
+            if not isinstance(record, dict):
+                self.reject(number, "Se esperaba un objeto JSON.")
+                return None
+            return record
+
+        # Each line is read on its own, so an unclosed quote can't swallow the following lines.
+        row = next(csv.reader([line]))
+        if self.header is None:
+            self.header = [column.strip() for column in row]
+            return None
+
+        if len(row) != len(self.header):
+            self.reject(number, f"Se esperaban {len(self.header)} columnas y hay {len(row)}.")
+            return None
+        return dict(zip(self.header, row))
+
+    def validate(self, number: int, record: dict):
+        """ Resolve the references of :record: and validate it, None if it is rejected. """
+        for field, name_fields, not_found in REFERENCES:
+            name = next((record[name_field] for name_field in name_fields if record.get(name_field)), None)
+
+            if name is not None:
+                reference_id = self.names[field].get(name_key(str(name)))
+                if reference_id is None:
+                    self.reject(number, f"{not_found}: {name}.")
+                    return None
+                if reference_id is AMBIGUOUS:
+                    self.reject(number, f"Hay más de un registro con el nombre {name}.")
+                    return None
+                record[field] = reference_id
+
+        try:
+            integrante = IntegranteBaseModel(**record)
+        except ValidationError as error:
+            self.reject(number, "; ".join(f"{'.'.join(map(str, detail['loc']))}: {detail['msg']}"
+                                          for detail in error.errors()))
+            return None
+
+        missing = [not_found for field, _, not_found in REFERENCES if getattr(integrante, field) not in self.ids[field]]
+        if missing:
+            self.reject(number, " ".join(f"{not_found}." for not_found in missing))
+            return None
+
+        return integrante.dict()
+
+    def load(self, db, lines: List[Tuple[int, str]]):
+        """ Validate a batch of numbered :lines: and load the valid records in a single COPY.
+
+        If the database still rejects the batch, it is rolled back and its records are rejected, and the import
+        goes on with the next batch.
+        """
+        numbers = []
+        integrantes = []
+        for number, line in lines:
+            record = self.parse(number, line)
+            integrante = None if record is None else self.validate(number, record)
+            if integrante is not None:
+                numbers.append(number)
+                integrantes.append(integrante)
+
+        if not integrantes:
+            return
+
+        try:
+            self.method = crud.copy_integrantes(db, integrantes)
+        except DBAPIError as error:
+            # copy_integrantes commits each batch on its own, so this only discards the current one.
+            db.rollback()
+            detail = str(error.orig).strip().splitlines()[0]
+            for number in numbers:
+                self.reject(number, f"No se pudo cargar el lote: {detail}")
+            return
+
+        self.inserted += len(integrantes)
+
+
+async def numbered_lines(chunks: AsyncIterator[bytes], batch_size: int):
+    """ Split a stream of UTF-8 :chunks: into batches of up to :batch_size: (line number, line) pairs, skipping
+    blank lines. Records can't span lines, not even inside quoted CSV fields. """
+    decoder = codecs.getincrementaldecoder("utf-8-sig")(errors="replace")
+    pending = ""
+    number = 0
+    batch = []
+
+    async for chunk in chunks:
+        *lines, pending = (pending + decoder.decode(chunk)).split("\n")
+
+        for line in lines:
+            number += 1
+            if line.strip():
+                batch.append((number, line.rstrip("\r")))
+
+        while len(batch) >= batch_size:
+            yield batch[:batch_size]
+            batch = batch[batch_size:]
+
+    pending += decoder.decode(b"", final=True)
+    if pending.strip():
+        batch.append((number + 1, pending.rstrip("\r")))
+
+    if batch:
+        yield batch
+
+
+async def import_integrantes(db, chunks: AsyncIterator[bytes], import_format: ImportFormat,
+                             batch_size: int = IMPORT_BATCH_SIZE):
+    """ Import the integrantes of a CSV or NDJSON file read as a stream of :chunks:.
+
+    Only one batch of lines is held in memory. Each batch is validated and loaded in the threadpool (or through
+    AsyncSession.run_sync) and committed on its own, so the batches loaded before an unexpected error are kept.
+
+    Args:
+        db (Session | AsyncSession): The database Session.
+        chunks (AsyncIterator[bytes]): The file contents.
+        import_format (ImportFormat): The file format. CSV files start with a header line.
+        batch_size (int): Lines validated and loaded at a time.
+
+    Returns:
+        Dict with the amount of inserted and rejected records, the first IMPORT_MAX_ERRORS errors, the load method
+        and the elapsed time and rows/sec.
+    """
+    start = time.perf_counter()
+    importer = IntegranteImporter(import_format, await run_db(db, crud.get_integrante_references))
+
+    async for lines in numbered_lines(chunks, batch_size):
+        await run_db(db, importer.load, lines)
+
+    seconds = time.perf_counter() - start
+
+    return {
+        "inserted": importer.inserted,
+        "rejected": importer.rejected,
+        "errors": importer.errors,
+        "method": importer.method,
+        "seconds": round(seconds, 3),
+        "rows_per_second": round(importer.inserted / seconds, 1) if seconds else 0.0,
+    }
+
+
+async def read_file(path: str, chunk_size: int = 64 * 1024):
+    with open(path, "rb") as file:
+        while chunk := file.read(chunk_size):
+            yield chunk
+
+
+def main():
+    from project.database import SessionLocal
+
+    parser = argparse.ArgumentParser(description="Importa integrantes desde un archivo CSV o NDJSON.")
+    parser.add_argument("path")
+    parser.add_argument("--format", choices=[import_format.value for import_format in ImportFormat],
+                        help="Por defecto, según la extensión del archivo.")
+    parser.add_argument("--batch-size", type=int, default=IMPORT_BATCH_SIZE)
+    parser.add_argument("--force", action="store_true",
+                        help="Importar aunque la caché no sea compartida con la API (CACHE_BACKEND=memory).")
+    args = parser.parse_args()
+
+    # The import invalidates the integrantes cache of this process only, unless the cache is shared through Redis:
+    # the API workers would keep serving their cached lists and ETags.
+    if CACHE_BACKEND != "redis":
+        if not args.force:
+            parser.error("con CACHE_BACKEND=memory la API no se entera de la importación y sigue respondiendo los "
+                         "datos anteriores; usar CACHE_BACKEND=redis o --force.")
+        print("Atención: la API puede seguir respondiendo los integrantes anteriores hasta CATALOG_CACHE_TTL o "
+              "hasta reiniciarse.", file=sys.stderr)
+
+    import_format = ImportFormat(args.format or ("ndjson" if args.path.endswith((".ndjson", ".jsonl")) else "csv"))
+
+    with SessionLocal() as db:
+        report = asyncio.run(import_integrantes(db, read_file(args.path), import_format, args.batch_size))
+
+    print(f"insertados:  {report['inserted']} ({report['method']}), rechazados: {report['rejected']}")
+    print(f"tiempo:      {report['seconds']} s, {report['rows_per_second']} filas/s")
+    for error in report["errors"]:
+        print(f"línea {error['line']}: {error['detail']}")
+
+
+if __name__ == "__main__":
+    main()
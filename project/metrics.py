@@ -0,0 +1,346 @@
+import asyncio
+import bisect
+import collections
+import contextlib
+import contextvars
+import functools
+import logging
+import threading
+import time
+
+from decouple import config, Csv
+from fastapi.routing import APIRoute
+from starlette.datastructures import MutableHeaders
+
+# Upper bounds, in seconds, of the latency histogram buckets of /metrics.
+HTTP_LATENCY_BUCKETS = config("HTTP_LATENCY_BUCKETS", default="0.005,0.01,0.025,0.05,0.1,0.25,0.5,1,2.5,5,10",
+                              cast=Csv(float))
+
+# Add a Server-Timing header (db, serialize, auth and total, in milliseconds) to every response.
+SERVER_TIMING = config("SERVER_TIMING", default=True, cast=bool)
+# Debug mode: log the statements executed more than this many times in a single request (likely N+1 queries).
+# 0 disables it.
+SQL_N_PLUS_ONE_THRESHOLD = config("SQL_N_PLUS_ONE_THRESHOLD", default=0, cast=int)
+
+UNMATCHED_ROUTE = "<unmatched>"
+
+TIMING_PHASES = ("db", "serialize", "auth")
+
+logger = logging.getLogger(__name__)
+
+
+class PoolMetrics:
+    """
+    Counters of the connection checkouts of a pool: how many, how long they waited for a connection and how many
+    gave up after the pool timeout.
+    """
+
+    def __init__(self):
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+        self._lock = threading.Lock()
+
+    def observe_checkout(self, wait_seconds: float, timed_out: bool = False):
+        with self._lock:
+            if timed_out:
+                self.timeouts += 1
+            else:
+                self.checkouts += 1
+
+            self.wait_seconds_total += wait_seconds
+            self.wait_seconds_max = max(self.wait_seconds_max, wait_seconds)
+
+    def stats(self):
+        with self._lock:
+            attempts = self.checkouts + self.timeouts
+            return {
+                "checkouts": self.checkouts,
+                "timeouts": self.timeouts,
+                "wait_seconds_total": self.wait_seconds_total,
+                "wait_seconds_avg": self.wait_seconds_total / attempts if attempts else 0.0,
+                "wait_seconds_max": self.wait_seconds_max,
+            }
+
+
+class RouteMetrics:
+    """
+    Request counters and latency histograms by route, plus the requests in flight, for the /metrics endpoint.
+
+    Routes are recorded by their path template (e.g. /api/v1/integrantes/{integrante_id}), so the amount of series
+    doesn't grow with the ids requested. Requests that match no route are recorded as UNMATCHED_ROUTE.
+
+    Args:
+        buckets (tuple): Upper bounds, in seconds, of the latency histogram buckets.
+    """
+
+    def __init__(self, buckets: tuple = HTTP_LATENCY_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self.in_flight = 0
+        self.requests = {}
+        self.latencies = {}
+        self.db_statements = {}
+        self.phase_seconds = {}
+        self._lock = threading.Lock()
+
+    def start_request(self):
+        with self._lock:
+            self.in_flight += 1
+
+    def observe_request(self, method: str, route: str, status_code: int, seconds: float, timings=None):
+        """ Record a finished request, and the database, serialization and auth time of its :timings:
+        (a RequestTimings), if any. """
+        with self._lock:
+            self.in_flight -= 1
+
+            key = (method, route, str(status_code))
+            self.requests[key] = self.requests.get(key, 0) + 1
+
+            histogram = self.latencies.get((method, route))
+            if histogram is None:
+                # Count of each bucket (not cumulative), the +Inf bucket, and the sum of the latencies.
+                histogram = self.latencies[(method, route)] = [[0] * (len(self.buckets) + 1), 0.0]
+
+            histogram[0][bisect.bisect_left(self.buckets, seconds)] += 1
+            histogram[1] += seconds
+
+            if timings is not None:
+                self.db_statements[(method, route)] = \
+                    self.db_statements.get((method, route), 0) + timings.db_statements
+                for phase, phase_seconds in timings.phases.items():
+                    self.phase_seconds[(method, route, phase)] = \
+                        self.phase_seconds.get((method, route, phase), 0.0) + phase_seconds
+
+    def clear(self):
+        with self._lock:
+            self.requests.clear()
+            self.latencies.clear()
+            self.db_statements.clear()
+            self.phase_seconds.clear()
+
+    def render(self):
+        """ Render the metrics in the Prometheus text exposition format. """
+        with self._lock:
+            lines = ["# HELP http_requests_total Requests handled, by method, route and status code.",
+                     "# TYPE http_requests_total counter"]
+            for (method, route, status_code), count in sorted(self.requests.items()):
+                lines.append(f"http_requests_total{labels(method=method, route=route, status=status_code)} {count}")
+
+            lines += ["# HELP http_request_duration_seconds Time until the last byte of the response was sent.",
+                      "# TYPE http_request_duration_seconds histogram"]
+            for (method, route), (counts, total) in sorted(self.latencies.items()):
+                cumulative = 0
+                for bound, count in zip([*map(repr, self.buckets), "+Inf"], counts):
+                    cumulative += count
+                    lines.append(f"http_request_duration_seconds_bucket"
+                                 f"{labels(method=method, route=route, le=bound)} {cumulative}")
+                lines.append(f"http_request_duration_seconds_sum{labels(method=method, route=route)} {total!r}")
+                lines.append(f"http_request_duration_seconds_count{labels(method=method, route=route)} {cumulative}")
+
+            lines += ["# HELP http_request_db_statements_total SQL statements executed by the requests.",
+                      "# TYPE http_request_db_statements_total counter"]
+            for (method, route), count in sorted(self.db_statements.items()):
+                lines.append(f"http_request_db_statements_total{labels(method=method, route=route)} {count}")
+
+            lines += ["# HELP http_request_phase_seconds_total Time the requests spent in the database, serializing "
+                      "the response and authenticating.",
+                      "# TYPE http_request_phase_seconds_total counter"]
+            for (method, route, phase), total in sorted(self.phase_seconds.items()):
+                lines.append(f"http_request_phase_seconds_total"
+                             f"{labels(method=method, route=route, phase=phase)} {total!r}")
+
+            lines += ["# HELP http_requests_in_flight Requests being handled.",
+                      "# TYPE http_requests_in_flight gauge",
+                      f"http_requests_in_flight {self.in_flight}"]
+
+        return "\n".join(lines) + "\n"
+
+
+class RequestTimings:
+    """
+    Where the time of a single request went: the SQL statements it executed and how long they took (recorded by the
+    engine events of project.database), plus the time spent authenticating and serializing the response.
+
+    The time of the auth phase includes its own statements, which are also part of the db phase.
+
+    Args:
+        track_statements (bool): Also count the executions of each statement, to find N+1 patterns.
+    """
+
+    def __init__(self, track_statements: bool = False):
+        self.start = time.perf_counter()
+        self.total_seconds = None
+        self.endpoint_end = None
+        self.db_statements = 0
+        self.phases = dict.fromkeys(TIMING_PHASES, 0.0)
+        self.statement_counts = collections.Counter() if track_statements else None
+
+    def observe_statement(self, statement: str, seconds: float):
+        self.db_statements += 1
+        self.phases["db"] += seconds
+        if self.statement_counts is not None:
+            self.statement_counts[statement] += 1
+
+    def add(self, phase: str, seconds: float):
+        self.phases[phase] += seconds
+
+    def response_started(self):
+        """ Close the serialize phase started when the endpoint returned (see TimedRoute) and the total time. """
+        now = time.perf_counter()
+        if self.endpoint_end is not None:
+            self.add("serialize", now - self.endpoint_end)
+            self.endpoint_end = None
+        self.total_seconds = now - self.start
+
+    def server_timing(self):
+        """ The value of the Server-Timing header, with the durations in milliseconds. """
+        metrics = [f'db;dur={self.phases["db"] * 1000:.3f};desc="{self.db_statements} statements"']
+        metrics += [f"{phase};dur={self.phases[phase] * 1000:.3f}" for phase in TIMING_PHASES if phase != "db"]
+        if self.total_seconds is not None:
+            metrics.append(f"total;dur={self.total_seconds * 1000:.3f}")
+
+        return ", ".join(metrics)
+
+    def repeated_statements(self, threshold: int):
+        """ The statements executed more than :threshold: times, with their count, most repeated first. """
+        if self.statement_counts is None:
+            return []
+
+        return [(statement, count) for statement, count in self.statement_counts.most_common() if count > threshold]
+
+
+# Timings of the request being handled, set by MetricsMiddleware. The threadpool and AsyncSession.run_sync copy the
+# context, so the statements of sync crud functions are recorded in the same RequestTimings.
+request_timings = contextvars.ContextVar("request_timings", default=None)
+
+
+def observe_statement(statement: str, seconds: float):
+    """ Record an executed statement in the timings of the current request, if there is one. """
+    timings = request_timings.get()
+    if timings is not None:
+        timings.observe_statement(statement, seconds)
+
+
+@contextlib.contextmanager
+def timed(phase: str):
+    """ Add the time spent inside the block to the :phase: of the current request, if there is one. """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings = request_timings.get()
+        if timings is not None:
+            timings.add(phase, time.perf_counter() - start)
+
+
+def _mark_endpoint_end():
+    timings = request_timings.get()
+    if timings is not None:
+        timings.endpoint_end = time.perf_counter()
+
+
+class TimedRoute(APIRoute):
+    """
+    APIRoute that marks when its endpoint returns, so the response_model validation and encoding and the rendering of
+    the response, until its headers are sent, count as the serialize phase of the request.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+
+        call = self.dependant.call
+        # The request handler built by APIRoute calls self.dependant.call, and decides whether to await it or send it
+        # to the threadpool from the original endpoint, so the wrapper keeps its kind.
+        if asyncio.iscoroutinefunction(call):
+            @functools.wraps(call)
+            async def endpoint(*args, **kwargs):
+                try:
+                    return await call(*args, **kwargs)
+                finally:
+                    _mark_endpoint_end()
+        else:
+            @functools.wraps(call)
+            def endpoint(*args, **kwargs):
+                try:
+                    return call(*args, **kwargs)
+                finally:
+                    _mark_endpoint_end()
+
+        self.dependant.call = endpoint
+
+
+def labels(**values: str):
+    """ Format Prometheus labels, escaping their values. """
+    escaped = {name: value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+               for name, value in values.items()}
+    return "{" + ",".join(f'{name}="{value}"' for name, value in escaped.items()) + "}"
+
+
+route_metrics = RouteMetrics()
+
+
+def route_path(scope):
+    """ The path template of the route that handled the request in :scope:, UNMATCHED_ROUTE if none did. """
+    route = scope.get("route")
+    if route is not None:
+        return route.path
+
+    # Plain Starlette routes (like /docs) only leave their endpoint in the scope.
+    endpoint = scope.get("endpoint")
+    if endpoint is not None:
+        for route in scope["app"].routes:
+            if getattr(route, "endpoint", None) is endpoint:
+                return route.path
+
+    return UNMATCHED_ROUTE
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware that records every HTTP request in route_metrics.
+
+    The latency is measured until the last chunk of the body is sent, so streamed responses count in full.
+    Unhandled exceptions are recorded as 500.
+
+    It also collects the RequestTimings of the request, sent in the Server-Timing header. Those are measured until
+    the headers are sent, so the queries of a streamed body only reach the metrics.
+    """
+
+    def __init__(self, app, metrics: RouteMetrics = route_metrics, server_timing: bool = SERVER_TIMING,
+                 n_plus_one_threshold: int = SQL_N_PLUS_ONE_THRESHOLD):
+        self.app = app
+        self.metrics = metrics
+        self.server_timing = server_timing
+        self.n_plus_one_threshold = n_plus_one_threshold
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status_code = 500
+        start = time.perf_counter()
+        self.metrics.start_request()
+        timings = RequestTimings(track_statements=self.n_plus_one_threshold > 0)
+        token = request_timings.set(timings)
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                timings.response_started()
+                if self.server_timing:
+                    MutableHeaders(scope=message).append("Server-Timing", timings.server_timing())
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            request_timings.reset(token)
+            route = route_path(scope)
+            self.metrics.observe_request(scope["method"], route, status_code, time.perf_counter() - start, timings)
+
+            for statement, count in timings.repeated_statements(self.n_plus_one_threshold):
+                logger.warning("Possible N+1 in %s %s: statement executed %d times: %s",
+                               scope["method"], route, count, statement)
@@ -1,8 +1,9 @@
-from sqlalchemy import Column, Integer, String, ForeignKey, text, Boolean
+from sqlalchemy import Column, Integer, String, ForeignKey, text, Boolean, Index
 from sqlalchemy.dialects.postgresql import TIMESTAMP
 from sqlalchemy.orm import relationship
 
 from .database import Base
+from .search import search_vector
 
 
 # ================================
@@ -13,6 +14,8 @@ class Seleccion(Base):
     id: int = Column(Integer(), primary_key=True, nullable=False)
     pais: str = Column(String(100), nullable=False)
 
+    __table_args__ = (Index("ix_selecciones_search", search_vector(pais), postgresql_using="gin"),)
+
 
 # ================================
 #           EQUIPO
@@ -44,11 +47,19 @@ class Integrante(Base):
     edad: int = Column(Integer())
     num_camiseta: int = Column(Integer())
     seleccion_id: int = Column(Integer(), ForeignKey("selecciones.id"), nullable=False)
-    equipo_id: int = Column(Integer(), ForeignKey("equipos.id"), nullable=False)
-    rol_id: int = Column(Integer(), ForeignKey("roles.id"), nullable=False)
-    seleccion = relationship("Seleccion", backref="integrantes")
-    equipo = relationship("Equipo", backref="integrantes")
-    rol = relationship("Rol", backref="integrantes")
+    equipo_id: int = Column(Integer(), ForeignKey("equipos.id"), nullable=False, index=True)
+    rol_id: int = Column(Integer(), ForeignKey("roles.id"), nullable=False, index=True)
+
+    __table_args__ = (
+        # Also serves the lookups by seleccion_id alone, so seleccion_id has no index of its own.
+        Index("ix_integrantes_seleccion_id_num_camiseta", "seleccion_id", "num_camiseta"),
+        Index("ix_integrantes_search", search_vector(nombre, apodo, apellido), postgresql_using="gin"),
+    )
+
+    # Every Integrante response embeds its Seleccion, Equipo and Rol, so they're loaded in the same SELECT.
+    seleccion = relationship("Seleccion", backref="integrantes", lazy="joined", innerjoin=True)
+    equipo = relationship("Equipo", backref="integrantes", lazy="joined", innerjoin=True)
+    rol = relationship("Rol", backref="integrantes", lazy="joined", innerjoin=True)
 
 
 # ================================
@@ -1,3 +1,4 @@
+import time
 from datetime import datetime, timedelta
 
 from decouple import config
@@ -6,8 +7,10 @@ from fastapi import status, Depends, HTTPException
 from fastapi.security import OAuth2PasswordBearer
 from sqlalchemy.orm import Session
 
-from project.database import get_db
-from project.models import Usuario
+from project import crud
+from project.cache import MemoryCacheBackend, MISSING, AUTH_CACHE_TTL, AUTH_CACHE_MAXSIZE
+from project.database import get_db, run_db
+from project.metrics import timed
 from project.schemas import TokenData
 
 SECRET_KEY = config("SECRET_KEY")
@@ -16,6 +19,9 @@ ACCESS_TOKEN_EXPIRE_HOURS = 8
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="login")
 
+# Already verified tokens, so each request doesn't decode and check the signature again.
+token_cache = MemoryCacheBackend(maxsize=AUTH_CACHE_MAXSIZE, ttl=AUTH_CACHE_TTL)
+
 
 def create_access_token(data: dict):
     data_copy = data.copy()
@@ -29,28 +35,40 @@ def create_access_token(data: dict):
 
 
 def verify_access_token(token: str, credentials_exception: Exception):
+    cached_token = token_cache.get(("tokens", token))
+    if cached_token is not MISSING and (cached_token["exp"] is None or cached_token["exp"] > time.time()):
+        return TokenData(id=cached_token["id"])
+
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
 
         usuario_id: str = payload.get("usuario_id")
 
-        if id is None:
+        if usuario_id is None:
             raise credentials_exception
 
         token_data = TokenData(id=usuario_id)
     except JWTError:
         raise credentials_exception
 
+    expiration = payload.get("exp")
+    token_cache.set(("tokens", token), {"id": token_data.id, "exp": expiration},
+                    None if expiration is None else expiration - time.time())
+
     return token_data
 
 
-def get_current_usuario(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+async def get_current_usuario(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
     credentials_exception = HTTPException(status_code=status.HTTP_401_UNAUTHORIZED,
                                           detail="No pudimos validar las credenciales",
                                           headers={"WWW-Authenticate": "Bearer"})
 
-    token_data = verify_access_token(token, credentials_exception)
+    with timed("auth"):
+        token_data = verify_access_token(token, credentials_exception)
 
-    current_usuario = db.query(Usuario).filter(Usuario.id == token_data.id).first()
+        current_usuario = await run_db(db, crud.get_current_usuario, token_data.id)
+
+    if current_usuario is None:
+        raise credentials_exception
 
     return current_usuario
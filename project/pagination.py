@@ -0,0 +1,96 @@
+import base64
+import binascii
+import json
+from typing import Optional, Callable
+
+from decouple import config
+from fastapi import HTTPException, Query, Response, status
+
+DEFAULT_PAGE_LIMIT = config("DEFAULT_PAGE_LIMIT", default=100, cast=int)
+MAX_PAGE_LIMIT = config("MAX_PAGE_LIMIT", default=1000, cast=int)
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+def encode_cursor(*key):
+    """ Encode the sort key of the last row of a page (usually just its id) as an opaque cursor. """
+    payload = key[0] if len(key) == 1 else list(key)
+    return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str):
+    """ Decode a cursor created by encode_cursor back into the sort key of the last row seen.
+
+    Returns:
+        The key as a tuple.
+
+    Raises:
+        HTTPException: 400 if the cursor wasn't created by encode_cursor.
+    """
+    try:
+        key = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode())
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Cursor inválido.")
+
+    return tuple(key) if isinstance(key, list) else (key,)
+
+
+class Pagination:
+    """
+    Keyset pagination dependency for list endpoints.
+
+    Pages are ordered by id (or by a column and then id) and a page starts right after the sort key carried by
+    :cursor:, so reading page N costs the same as reading the first one. The cursor for the next page is sent in the
+    X-Next-Cursor header and is omitted on the last page.
+    """
+
+    def __init__(self,
+                 limit: int = Query(DEFAULT_PAGE_LIMIT, ge=1, le=MAX_PAGE_LIMIT),
+                 cursor: Optional[str] = Query(None)):
+        self.limit = limit
+        self.after = decode_cursor(cursor) if cursor else None
+
+    def after_key(self, *types):
+        """ Get the sort key carried by the cursor, None on the first page.
+
+        Args:
+            *types: The type of each item of the key, or a tuple of types, e.g. (str, type(None)) for a nullable
+                column.
+
+        Raises:
+            HTTPException: 400 if the key doesn't have one item of each of :types:, e.g. a cursor of another order.
+        """
+        if self.after is None:
+            return None
+
+        if len(self.after) != len(types) or not all(type(item) in (item_type if isinstance(item_type, tuple)
+                                                                   else (item_type,))
+                                                    for item, item_type in zip(self.after, types)):
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Cursor inválido.")
+
+        return self.after
+
+    @property
+    def after_id(self):
+        """ The id carried by the cursor of pages ordered by id, None on the first page. """
+        after = self.after_key(int)
+        return after[0] if after else None
+
+    @property
+    def fetch_limit(self):
+        """ Rows to request from the database: one extra to know whether there is a next page. """
+        return self.limit + 1
+
+    def page(self, response: Response, rows: list, key: Optional[Callable] = None):
+        """ Trim :rows: (fetched with fetch_limit) to the page size and set the next cursor header.
+
+        Args:
+            response (Response): The response to set the header on.
+            rows (list): The rows fetched.
+            key (Callable): Gets the sort key of a row as a tuple, (row.id,) if None.
+        """
+        if len(rows) > self.limit:
+            rows = rows[:self.limit]
+            response.headers[NEXT_CURSOR_HEADER] = encode_cursor(*(key(rows[-1]) if key else (rows[-1].id,)))
+
+        return rows
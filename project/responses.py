@@ -0,0 +1,75 @@
+import functools
+from typing import Optional, Type
+
+from decouple import config
+from fastapi import Response
+from fastapi.responses import JSONResponse, ORJSONResponse
+from pydantic import BaseModel
+from pydantic.fields import SHAPE_LIST, SHAPE_SINGLETON
+from pydantic.utils import lenient_issubclass
+
+from project.metrics import timed
+
+# "orjson" renders responses with orjson when it is installed, "json" with the standard library.
+JSON_RESPONSE_CLASS = config("JSON_RESPONSE_CLASS", default="orjson")
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+DefaultJSONResponse = ORJSONResponse if JSON_RESPONSE_CLASS == "orjson" and orjson is not None else JSONResponse
+
+
+@functools.lru_cache(maxsize=None)
+def orm_serializer(schema: Type[BaseModel]):
+    """ Build a function that copies the :schema: fields of an object (or dict) into a JSON-ready dict.
+
+    It reads ORM objects the same way an orm_mode model does, but without building the model and then encoding it
+    again with jsonable_encoder, so it is several times faster on big lists. There is no validation: it is meant for
+    values read from our own database, whose types already match the schema.
+
+    Raises:
+        TypeError: If :schema: has a field that isn't a single value, a model or a list of them.
+    """
+    fields = []
+    for field in schema.__fields__.values():
+        if field.shape not in (SHAPE_SINGLETON, SHAPE_LIST):
+            raise TypeError(f"{schema.__name__}.{field.name} can't be serialized by orm_serializer")
+
+        nested = orm_serializer(field.type_) if lenient_issubclass(field.type_, BaseModel) else None
+        fields.append((field.name, field.alias, nested, field.shape == SHAPE_LIST))
+
+    def serialize(value):
+        get = value.get if isinstance(value, dict) else functools.partial(getattr, value)
+        data = {}
+
+        for name, alias, nested, is_list in fields:
+            item = get(name)
+            if nested is not None and item is not None:
+                item = [nested(element) for element in item] if is_list else nested(item)
+            data[alias] = item
+
+        return data
+
+    return serialize
+
+
+def orm_response(content, schema: Type[BaseModel], response: Optional[Response] = None):
+    """ Fast path for handlers returning many ORM objects: serialize :content: (an object or a list of them) with
+    orm_serializer and render it with DefaultJSONResponse, skipping the response_model validation and encoding.
+
+    Args:
+        content: The object or list of objects.
+        schema (Type[BaseModel]): The response model of each object, normally the route's response_model.
+        response (Response): The response injected in the handler, whose headers (ETag, X-Next-Cursor) are copied.
+    """
+    serialize = orm_serializer(schema)
+    with timed("serialize"):
+        json_response = DefaultJSONResponse([serialize(item) for item in content] if isinstance(content, list)
+                                            else serialize(content))
+
+    if response is not None:
+        json_response.headers.raw.extend(response.headers.raw)
+
+    return json_response
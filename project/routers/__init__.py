@@ -4,3 +4,5 @@ from .selecciones import router as router_selecciones
 from .integrantes import router as router_integrantes
 from .usuarios import router as router_usuarios
 from .authentication import router as router_authentication
+from .monitoring import router as router_monitoring
+from .export import router as router_export
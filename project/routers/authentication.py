@@ -1,24 +1,43 @@
-from fastapi import APIRouter, Depends, status, HTTPException, Response
+from fastapi import APIRouter, BackgroundTasks, Depends, status, HTTPException, Response
 from fastapi.security.oauth2 import OAuth2PasswordRequestForm
 from sqlalchemy.orm import Session
 
-from project.database import get_db
+from project.database import get_db, run_db
 from project import crud, utils, oauth2
 from project.schemas import Token
+from project.metrics import TimedRoute
 
-router = APIRouter(prefix="/auth", tags=["authentication"])
+router = APIRouter(prefix="/auth", tags=["authentication"], route_class=TimedRoute)
+
+
+async def rehash_password(db: Session, usuario_id: int, plain_password: str):
+    """
+    Replaces a password hash made with outdated hash settings. Runs as a background task after the login
+    response, using the request Session (dependencies with yield are closed after background tasks).
+    """
+    try:
+        hashed_password = await utils.async_hash_password(plain_password)
+    except HTTPException:
+        # Password pool is full: the hash is updated on a later login.
+        return
+
+    await run_db(db, crud.update_usuario_password, usuario_id, hashed_password)
 
 
 @router.post("/login", response_model=Token)
-def login(usuario_credentials: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
-    usuario = crud.get_usuario_by_email(db, usuario_credentials)
+async def login(background_tasks: BackgroundTasks, usuario_credentials: OAuth2PasswordRequestForm = Depends(),
+                db: Session = Depends(get_db)):
+    usuario = await run_db(db, crud.get_usuario_by_email, usuario_credentials)
 
     if usuario is None:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Credenciales inválidas.")
 
-    if not utils.verify_password(usuario_credentials.password, usuario.password):
+    if not await utils.async_verify_password(usuario_credentials.password, usuario.password):
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Credenciales inválidas.")
 
+    if utils.password_needs_update(usuario.password):
+        background_tasks.add_task(rehash_password, db, usuario.id, usuario_credentials.password)
+
     usuario_data = {
         "usuario_id": usuario.id
     }
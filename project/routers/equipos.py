@@ -1,27 +1,34 @@
 from typing import List
 
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, status, Response
 from sqlalchemy.orm import Session
 
 from project import crud
-from project.database import get_db
-from project.models import Usuario
+from project.database import get_read_db, get_write_db, run_db
+from project.http_cache import ETag
+from project.metrics import TimedRoute
 from project.oauth2 import get_current_usuario
-from project.schemas import EquipoResponseModel, EquipoBaseModel, TokenData
+from project.pagination import Pagination
+from project.responses import orm_response
+from project.schemas import EquipoResponseModel, EquipoBaseModel, EquipoPatchModel, TokenData, CurrentUsuarioModel, \
+    IntegrantesXEquipoResponseModel
 
-router = APIRouter(prefix="/equipos")
+router = APIRouter(prefix="/equipos", route_class=TimedRoute)
 
+equipos_etag = ETag("equipos", cached=True)
+equipo_integrantes_etag = ETag("equipos", "integrantes", "selecciones")
 
-@router.get("/", response_model=List[EquipoResponseModel], tags=["equipos"])
-async def get_equipos(db: Session = Depends(get_db)):
-    equipos = crud.get_equipos(db)
 
-    return [equipo for equipo in equipos]
+@router.get("/", response_model=List[EquipoResponseModel], tags=["equipos"], dependencies=[Depends(equipos_etag)])
+async def get_equipos(response: Response, pagination: Pagination = Depends(), db: Session = Depends(get_read_db)):
+    equipos = await run_db(db, crud.get_equipos, pagination.fetch_limit, pagination.after_id)
 
+    return pagination.page(response, equipos)
 
-@router.get("/{equipo_id}", response_model=EquipoResponseModel, tags=["equipos"])
-async def get_equipo(equipo_id: int, db: Session = Depends(get_db)):
-    equipo = crud.get_equipo(db, equipo_id)
+
+@router.get("/{equipo_id}", response_model=EquipoResponseModel, tags=["equipos"], dependencies=[Depends(equipos_etag)])
+async def get_equipo(equipo_id: int, db: Session = Depends(get_read_db)):
+    equipo = await run_db(db, crud.get_equipo, equipo_id)
 
     if equipo is None:
         raise HTTPException(status_code=404, detail="Equipo no encontrado.")
@@ -29,14 +36,30 @@ async def get_equipo(equipo_id: int, db: Session = Depends(get_db)):
     return equipo
 
 
+@router.get("/{equipo_id}/integrantes", response_model=IntegrantesXEquipoResponseModel, tags=["equipos"],
+            dependencies=[Depends(equipo_integrantes_etag)])
+async def get_equipo_integrantes(equipo_id: int, response: Response, pagination: Pagination = Depends(),
+                                 db: Session = Depends(get_read_db)):
+    equipo_integrantes = await run_db(db, crud.get_equipo_integrantes, equipo_id, pagination.fetch_limit,
+                                      pagination.after_id)
+
+    if equipo_integrantes is None:
+        raise HTTPException(status_code=404, detail="Equipo no encontrado.")
+
+    equipo, integrantes = equipo_integrantes
+
+    return orm_response({"equipo": equipo, "integrantes": pagination.page(response, integrantes)},
+                        IntegrantesXEquipoResponseModel, response)
+
+
 @router.post("/", response_model=EquipoResponseModel, tags=["equipos"])
-async def create_equipo(equipo: EquipoBaseModel, db: Session = Depends(get_db),
-                        current_usuario: Usuario = Depends(get_current_usuario)):
+async def create_equipo(equipo: EquipoBaseModel, db: Session = Depends(get_write_db),
+                        current_usuario: CurrentUsuarioModel = Depends(get_current_usuario)):
     if current_usuario.is_admin is False:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN,
                             detail="Solo usuarios administradores pueden crear equipos.")
 
-    new_equipo = crud.create_equipo(db, equipo)
+    new_equipo = await run_db(db, crud.create_equipo, equipo)
 
     if new_equipo is None:
         raise HTTPException(status_code=404, detail="Equipo no encontrado.")
@@ -45,13 +68,28 @@ async def create_equipo(equipo: EquipoBaseModel, db: Session = Depends(get_db),
 
 
 @router.put("/{equipo_id}", response_model=EquipoResponseModel, tags=["equipos"])
-async def update_equipo(equipo: EquipoBaseModel, equipo_id: int, db: Session = Depends(get_db),
-                        current_usuario: Usuario = Depends(get_current_usuario)):
+async def update_equipo(equipo: EquipoBaseModel, equipo_id: int, db: Session = Depends(get_write_db),
+                        current_usuario: CurrentUsuarioModel = Depends(get_current_usuario)):
+    if current_usuario.is_admin is False:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN,
+                            detail="Solo usuarios administradores pueden modificar equipos.")
+
+    new_equipo = await run_db(db, crud.update_equipo, equipo, equipo_id)
+
+    if new_equipo is None:
+        raise HTTPException(status_code=404, detail="Equipo no encontrado.")
+
+    return new_equipo
+
+
+@router.patch("/{equipo_id}", response_model=EquipoResponseModel, tags=["equipos"])
+async def patch_equipo(equipo: EquipoPatchModel, equipo_id: int, db: Session = Depends(get_write_db),
+                       current_usuario: CurrentUsuarioModel = Depends(get_current_usuario)):
     if current_usuario.is_admin is False:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN,
                             detail="Solo usuarios administradores pueden modificar equipos.")
 
-    new_equipo = crud.update_equipo(db, equipo, equipo_id)
+    new_equipo = await run_db(db, crud.update_equipo, equipo, equipo_id)
 
     if new_equipo is None:
         raise HTTPException(status_code=404, detail="Equipo no encontrado.")
@@ -60,13 +98,13 @@ async def update_equipo(equipo: EquipoBaseModel, equipo_id: int, db: Session = D
 
 
 @router.delete("/{equipo_id}", response_model=EquipoResponseModel, tags=["equipos"])
-async def delete_equipo(equipo_id: int, db: Session = Depends(get_db),
-                        current_usuario: Usuario = Depends(get_current_usuario)):
+async def delete_equipo(equipo_id: int, db: Session = Depends(get_write_db),
+                        current_usuario: CurrentUsuarioModel = Depends(get_current_usuario)):
     if current_usuario.is_admin is False:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN,
                             detail="Solo usuarios administradores pueden eliminar equipos.")
 
-    deleted_equipo = crud.delete_equipo(db, equipo_id)
+    deleted_equipo = await run_db(db, crud.delete_equipo, equipo_id)
 
     if deleted_equipo is None:
         raise HTTPException(status_code=404, detail="Equipo no encontrado.")
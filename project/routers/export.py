@@ -0,0 +1,68 @@
+import csv
+import io
+import json
+from enum import Enum
+
+from decouple import config
+from fastapi import APIRouter, Depends, Query, Response
+from fastapi.responses import StreamingResponse
+from sqlalchemy.orm import Session
+
+from project import crud
+from project.database import get_read_db, stream_db
+from project.http_cache import ETag
+from project.metrics import TimedRoute
+
+EXPORT_BATCH_SIZE = config("EXPORT_BATCH_SIZE", default=1000, cast=int)
+
+router = APIRouter(prefix="/export", route_class=TimedRoute)
+
+integrantes_export_etag = ETag("integrantes", "selecciones", "equipos", "roles")
+
+
+class ExportFormat(str, Enum):
+    ndjson = "ndjson"
+    csv = "csv"
+
+
+async def ndjson_chunks(partitions):
+    """ Turn each partition of rows into a chunk of JSON lines. """
+    async for partition in partitions:
+        yield "".join(json.dumps(dict(row._mapping), ensure_ascii=False) + "\n" for row in partition)
+
+
+async def csv_chunks(partitions, columns: list):
+    """ Turn each partition of rows into a chunk of CSV lines, after a header line with :columns:. """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    writer.writerow(columns)
+    async for partition in partitions:
+        writer.writerows(partition)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+
+    # Only the header is left when there are no rows.
+    if buffer.getvalue():
+        yield buffer.getvalue()
+
+
+@router.get("/integrantes", tags=["export"], dependencies=[Depends(integrantes_export_etag)],
+            response_class=StreamingResponse)
+async def export_integrantes(response: Response,
+                             export_format: ExportFormat = Query(ExportFormat.ndjson, alias="format"),
+                             db: Session = Depends(get_read_db)):
+    statement = crud.select_integrantes_export()
+    partitions = stream_db(db, statement, EXPORT_BATCH_SIZE)
+
+    if export_format is ExportFormat.csv:
+        export_response = StreamingResponse(
+            csv_chunks(partitions, [column.name for column in statement.selected_columns]), media_type="text/csv",
+            headers={"Content-Disposition": 'attachment; filename="integrantes.csv"'})
+    else:
+        export_response = StreamingResponse(ndjson_chunks(partitions), media_type="application/x-ndjson")
+
+    # The ETag set by the dependency
+    export_response.headers.raw.extend(response.headers.raw)
+    return export_response
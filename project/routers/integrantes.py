@@ -1,27 +1,125 @@
-from typing import List
+from typing import List, Optional
 
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, status, Request, Response, Query
+from pydantic import conlist
 from sqlalchemy.orm import Session
 
 from project import crud
-from project.database import get_db
-from project.models import Usuario
+from project.database import get_read_db, get_write_db, run_db
+from project.http_cache import ETag
+from project.importer import ImportFormat, import_integrantes as import_integrantes_file
+from project.metrics import TimedRoute
 from project.oauth2 import get_current_usuario
-from project.schemas import IntegranteResponseModel, IntegranteBaseModel, TokenData
+from project.pagination import Pagination
+from project.responses import DefaultJSONResponse, orm_response
+from project.models import Integrante
+from project.schemas import IntegranteResponseModel, IntegranteBaseModel, IntegrantePatchModel, TokenData, \
+    IntegranteBulkUpdateModel, IntegrantesBulkResponseModel, IntegrantesBulkDeleteResponseModel, CurrentUsuarioModel, \
+    BULK_MAX_ITEMS, IntegranteFilterModel, INTEGRANTE_SORT_COLUMNS, INTEGRANTE_FIELDS, IntegrantesImportResponseModel
+
+router = APIRouter(prefix="/integrantes", route_class=TimedRoute)
+
+integrantes_etag = ETag("integrantes", "selecciones", "equipos", "roles")
+
+
+@router.get("/", response_model=List[IntegranteResponseModel], tags=["integrantes"],
+            dependencies=[Depends(integrantes_etag)])
+async def get_integrantes(response: Response, pagination: Pagination = Depends(),
+                          filters: IntegranteFilterModel = Depends(),
+                          sort: str = Query("id", regex=f"^-?({'|'.join(INTEGRANTE_SORT_COLUMNS)})$"),
+                          fields: Optional[str] = Query(None, description="Campos separados por comas."),
+                          db: Session = Depends(get_read_db)):
+    selected_fields = fields.split(",") if fields else None
+    if selected_fields is not None and not set(selected_fields) <= set(INTEGRANTE_FIELDS):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                            detail=f"Campos inválidos. Los campos posibles son: {', '.join(INTEGRANTE_FIELDS)}.")
+
+    sort_name = sort.lstrip("-")
+    key_columns = ("id",) if sort_name == "id" else (sort_name, "id")
+    # The cursor of a page ending in a NULL carries None for nullable sort columns.
+    after = pagination.after_key(*[(column.type.python_type, type(None)) if column.nullable
+                                   else column.type.python_type
+                                   for column in (Integrante.__table__.c[name] for name in key_columns)])
+
+    integrantes = await run_db(db, crud.get_integrantes, pagination.fetch_limit, after, filters=filters, sort=sort,
+                               fields=selected_fields)
+    integrantes = pagination.page(response, integrantes, lambda row: tuple(
+        row[column] if selected_fields else getattr(row, column) for column in key_columns))
+
+    if selected_fields is None:
+        return orm_response(integrantes, IntegranteResponseModel, response)
+
+    # Projected rows only carry some fields, so they skip the response model.
+    projected_response = DefaultJSONResponse(integrantes)
+    projected_response.headers.raw.extend(response.headers.raw)
+    return projected_response
+
+
+@router.get("/search", response_model=List[IntegranteResponseModel], tags=["integrantes"],
+            dependencies=[Depends(integrantes_etag)])
+async def search_integrantes(response: Response, q: str = Query(..., min_length=1, max_length=100),
+                             limit: int = Query(20, ge=1, le=100), db: Session = Depends(get_read_db)):
+    return orm_response(await run_db(db, crud.search_integrantes, q, limit), IntegranteResponseModel, response)
+
+
+@router.post("/bulk", response_model=IntegrantesBulkResponseModel, tags=["integrantes"])
+async def create_integrantes(integrantes: conlist(IntegranteBaseModel, min_items=1, max_items=BULK_MAX_ITEMS),
+                             db: Session = Depends(get_write_db),
+                             current_usuario: CurrentUsuarioModel = Depends(get_current_usuario)):
+    if current_usuario.is_admin is False:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN,
+                            detail="Solo usuarios administradores pueden agregar integrantes.")
+
+    new_integrantes, errors = await run_db(db, crud.create_integrantes, integrantes)
+
+    return {"integrantes": new_integrantes, "errors": errors}
+
+
+@router.put("/bulk", response_model=IntegrantesBulkResponseModel, tags=["integrantes"])
+async def update_integrantes(integrantes: conlist(IntegranteBulkUpdateModel, min_items=1, max_items=BULK_MAX_ITEMS),
+                             db: Session = Depends(get_write_db),
+                             current_usuario: CurrentUsuarioModel = Depends(get_current_usuario)):
+    if current_usuario.is_admin is False:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN,
+                            detail="Solo usuarios administradores pueden modificar integrantes.")
+
+    updated_integrantes, errors = await run_db(db, crud.update_integrantes, integrantes)
+
+    return {"integrantes": updated_integrantes, "errors": errors}
+
+
+@router.delete("/bulk", response_model=IntegrantesBulkDeleteResponseModel, tags=["integrantes"])
+async def delete_integrantes(ids: List[int] = Query(...), db: Session = Depends(get_write_db),
+                             current_usuario: CurrentUsuarioModel = Depends(get_current_usuario)):
+    if current_usuario.is_admin is False:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN,
+                            detail="Solo usuarios administradores pueden eliminar integrantes.")
+
+    if len(ids) > BULK_MAX_ITEMS:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                            detail=f"Se pueden eliminar hasta {BULK_MAX_ITEMS} integrantes por request.")
 
-router = APIRouter(prefix="/integrantes")
+    deleted_ids, errors = await run_db(db, crud.delete_integrantes, ids)
 
+    return {"ids": deleted_ids, "errors": errors}
 
-@router.get("/", response_model=List[IntegranteResponseModel], tags=["integrantes"])
-async def get_integrantes(db: Session = Depends(get_db)):
-    integrantes = crud.get_integrantes(db)
 
-    return [integrante for integrante in integrantes]
+@router.post("/import", response_model=IntegrantesImportResponseModel, tags=["integrantes"])
+async def import_integrantes(request: Request, import_format: ImportFormat = Query(ImportFormat.csv, alias="format"),
+                             db: Session = Depends(get_write_db),
+                             current_usuario: CurrentUsuarioModel = Depends(get_current_usuario)):
+    if current_usuario.is_admin is False:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN,
+                            detail="Solo usuarios administradores pueden importar integrantes.")
+
+    # The body is read as it arrives, so the file is never held in memory.
+    return await import_integrantes_file(db, request.stream(), import_format)
 
 
-@router.get("/{integrante_id}", response_model=IntegranteResponseModel, tags=["integrantes"])
-async def get_integrante(integrante_id: int, db: Session = Depends(get_db)):
-    integrante = crud.get_integrante(db, integrante_id)
+@router.get("/{integrante_id}", response_model=IntegranteResponseModel, tags=["integrantes"],
+            dependencies=[Depends(integrantes_etag)])
+async def get_integrante(integrante_id: int, db: Session = Depends(get_read_db)):
+    integrante = await run_db(db, crud.get_integrante, integrante_id)
 
     if integrante is None:
         raise HTTPException(status_code=404, detail="Integrante no encontrado")
@@ -30,25 +128,40 @@ async def get_integrante(integrante_id: int, db: Session = Depends(get_db)):
 
 
 @router.post("/", response_model=IntegranteResponseModel, tags=["integrantes"])
-async def create_integrante(integrante: IntegranteBaseModel, db: Session = Depends(get_db),
-                            current_usuario: Usuario = Depends(get_current_usuario)):
+async def create_integrante(integrante: IntegranteBaseModel, db: Session = Depends(get_write_db),
+                            current_usuario: CurrentUsuarioModel = Depends(get_current_usuario)):
     if current_usuario.is_admin is False:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN,
                             detail="Solo usuarios administradores pueden agregar integrantes.")
 
-    new_integrante = crud.create_integrante(db, integrante)
+    new_integrante = await run_db(db, crud.create_integrante, integrante)
 
     return new_integrante
 
 
 @router.put("/{integrante_id}", response_model=IntegranteResponseModel, tags=["integrantes"])
-async def update_integrante(integrante: IntegranteBaseModel, integrante_id: int, db: Session = Depends(get_db),
-                            current_usuario: Usuario = Depends(get_current_usuario)):
+async def update_integrante(integrante: IntegranteBaseModel, integrante_id: int, db: Session = Depends(get_write_db),
+                            current_usuario: CurrentUsuarioModel = Depends(get_current_usuario)):
+    if current_usuario.is_admin is False:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN,
+                            detail="Solo usuarios administradores pueden modificar integrantes.")
+
+    updated_integrante = await run_db(db, crud.update_integrante, integrante, integrante_id)
+
+    if updated_integrante is None:
+        raise HTTPException(status_code=404, detail="Integrante no encontrado")
+
+    return updated_integrante
+
+
+@router.patch("/{integrante_id}", response_model=IntegranteResponseModel, tags=["integrantes"])
+async def patch_integrante(integrante: IntegrantePatchModel, integrante_id: int, db: Session = Depends(get_write_db),
+                           current_usuario: CurrentUsuarioModel = Depends(get_current_usuario)):
     if current_usuario.is_admin is False:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN,
                             detail="Solo usuarios administradores pueden modificar integrantes.")
 
-    updated_integrante = crud.update_integrante(db, integrante, integrante_id)
+    updated_integrante = await run_db(db, crud.update_integrante, integrante, integrante_id)
 
     if updated_integrante is None:
         raise HTTPException(status_code=404, detail="Integrante no encontrado")
@@ -57,13 +170,13 @@ async def update_integrante(integrante: IntegranteBaseModel, integrante_id: int,
 
 
 @router.delete("/{integrante_id}", tags=["integrantes"])
-async def delete_integrante(integrante_id: int, db: Session = Depends(get_db),
-                            current_usuario: Usuario = Depends(get_current_usuario)):
+async def delete_integrante(integrante_id: int, db: Session = Depends(get_write_db),
+                            current_usuario: CurrentUsuarioModel = Depends(get_current_usuario)):
     if current_usuario.is_admin is False:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN,
                             detail="Solo usuarios administradores pueden eliminar integrantes.")
 
-    deleted_integrante = crud.delete_integrante(db, integrante_id)
+    deleted_integrante = await run_db(db, crud.delete_integrante, integrante_id)
 
     if deleted_integrante is None:
         raise HTTPException(status_code=404, detail="Integrante no encontrado")
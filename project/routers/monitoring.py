@@ -0,0 +1,25 @@
+from fastapi import APIRouter
+
+from project.cache import catalog_cache, auth_cache
+from project.database import engine, async_engine, replica_engines
+from project.metrics import TimedRoute
+
+router = APIRouter(prefix="/monitoring", tags=["monitoring"], route_class=TimedRoute)
+
+
+@router.get("/cache")
+async def get_cache_stats():
+    return {"catalog": catalog_cache.stats(), "auth": auth_cache.stats()}
+
+
+@router.get("/db")
+async def get_db_pool_stats():
+    pools = {"sync": engine.pool.stats()}
+
+    if async_engine is not None:
+        pools["async"] = async_engine.pool.stats()
+
+    if replica_engines:
+        pools["replicas"] = [replica_engine.pool.stats() for replica_engine in replica_engines]
+
+    return pools
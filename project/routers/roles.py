@@ -1,27 +1,31 @@
 from typing import List
 
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, status, Response
 from sqlalchemy.orm import Session
 
-from project.database import get_db
+from project.database import get_read_db, get_write_db, run_db
 from project import crud
-from project.models import Usuario
+from project.http_cache import ETag
+from project.metrics import TimedRoute
 from project.oauth2 import get_current_usuario
-from project.schemas import RolResponseModel, RolBaseModel, TokenData
+from project.pagination import Pagination
+from project.schemas import RolResponseModel, RolBaseModel, RolPatchModel, TokenData, CurrentUsuarioModel
 
-router = APIRouter(prefix="/roles")
+router = APIRouter(prefix="/roles", route_class=TimedRoute)
 
+roles_etag = ETag("roles", cached=True)
 
-@router.get("/", response_model=List[RolResponseModel], tags=["roles"])
-async def get_roles(db: Session = Depends(get_db)):
-    roles = crud.get_roles(db)
 
-    return [rol for rol in roles]
+@router.get("/", response_model=List[RolResponseModel], tags=["roles"], dependencies=[Depends(roles_etag)])
+async def get_roles(response: Response, pagination: Pagination = Depends(), db: Session = Depends(get_read_db)):
+    roles = await run_db(db, crud.get_roles, pagination.fetch_limit, pagination.after_id)
 
+    return pagination.page(response, roles)
 
-@router.get("/{rol_id}", response_model=RolResponseModel, tags=["roles"])
-async def get_rol(rol_id: int, db: Session = Depends(get_db)):
-    rol = crud.get_rol(db, rol_id)
+
+@router.get("/{rol_id}", response_model=RolResponseModel, tags=["roles"], dependencies=[Depends(roles_etag)])
+async def get_rol(rol_id: int, db: Session = Depends(get_read_db)):
+    rol = await run_db(db, crud.get_rol, rol_id)
 
     if rol is None:
         raise HTTPException(status_code=404, detail="Rol no encontrado.")
@@ -30,25 +34,40 @@ async def get_rol(rol_id: int, db: Session = Depends(get_db)):
 
 
 @router.post("/", response_model=RolResponseModel, tags=["roles"])
-async def create_rol(rol: RolBaseModel, db: Session = Depends(get_db),
-                     current_usuario: Usuario = Depends(get_current_usuario)):
+async def create_rol(rol: RolBaseModel, db: Session = Depends(get_write_db),
+                     current_usuario: CurrentUsuarioModel = Depends(get_current_usuario)):
     if current_usuario.is_admin is False:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN,
                             detail="Solo usuarios administradores pueden agregar roles.")
 
-    new_rol = crud.create_rol(db, rol)
+    new_rol = await run_db(db, crud.create_rol, rol)
 
     return new_rol
 
 
 @router.put("/{rol_id}", response_model=RolResponseModel, tags=["roles"])
-async def update_rol(rol: RolBaseModel, rol_id: int, db: Session = Depends(get_db),
-                     current_usuario: Usuario = Depends(get_current_usuario)):
+async def update_rol(rol: RolBaseModel, rol_id: int, db: Session = Depends(get_write_db),
+                     current_usuario: CurrentUsuarioModel = Depends(get_current_usuario)):
+    if current_usuario.is_admin is False:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN,
+                            detail="Solo usuarios administradores pueden modificar roles.")
+
+    new_rol = await run_db(db, crud.update_rol, rol, rol_id)
+
+    if new_rol is None:
+        raise HTTPException(status_code=404, detail="Rol no encontrado.")
+
+    return new_rol
+
+
+@router.patch("/{rol_id}", response_model=RolResponseModel, tags=["roles"])
+async def patch_rol(rol: RolPatchModel, rol_id: int, db: Session = Depends(get_write_db),
+                    current_usuario: CurrentUsuarioModel = Depends(get_current_usuario)):
     if current_usuario.is_admin is False:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN,
                             detail="Solo usuarios administradores pueden modificar roles.")
 
-    new_rol = crud.update_rol(db, rol, rol_id)
+    new_rol = await run_db(db, crud.update_rol, rol, rol_id)
 
     if new_rol is None:
         raise HTTPException(status_code=404, detail="Rol no encontrado.")
@@ -57,13 +76,13 @@ async def update_rol(rol: RolBaseModel, rol_id: int, db: Session = Depends(get_d
 
 
 @router.delete("/{rol_id}", response_model=RolResponseModel, tags=["roles"])
-async def delete_rol(rol_id: int, db: Session = Depends(get_db),
-                     current_usuario: Usuario = Depends(get_current_usuario)):
+async def delete_rol(rol_id: int, db: Session = Depends(get_write_db),
+                     current_usuario: CurrentUsuarioModel = Depends(get_current_usuario)):
     if current_usuario.is_admin is False:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN,
                             detail="Solo usuarios administradores pueden eliminar roles.")
 
-    deleted_rol = crud.delete_rol(db, rol_id)
+    deleted_rol = await run_db(db, crud.delete_rol, rol_id)
 
     if deleted_rol is None:
         raise HTTPException(status_code=404, detail="Rol no encontrado.")
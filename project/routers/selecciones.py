@@ -1,27 +1,44 @@
 from typing import List
 
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, status, Response, Query
 from sqlalchemy.orm import Session
 
 from project import crud
-from project.database import get_db
-from project.models import Usuario
+from project.database import get_read_db, get_write_db, run_db
+from project.http_cache import ETag
+from project.metrics import TimedRoute
 from project.oauth2 import get_current_usuario
-from project.schemas import SeleccionResponseModel, SeleccionBaseModel, TokenData
+from project.pagination import Pagination
+from project.responses import orm_response
+from project.schemas import SeleccionResponseModel, SeleccionBaseModel, SeleccionPatchModel, TokenData, \
+    CurrentUsuarioModel, IntegrantesXSeleccionResponseModel
 
-router = APIRouter(prefix="/selecciones")
+router = APIRouter(prefix="/selecciones", route_class=TimedRoute)
 
+selecciones_etag = ETag("selecciones", cached=True)
+selecciones_search_etag = ETag("selecciones")
+seleccion_integrantes_etag = ETag("selecciones", "integrantes", "equipos")
 
-@router.get("/", response_model=List[SeleccionResponseModel], tags=["selecciones"])
-async def get_selecciones(db: Session = Depends(get_db)):
-    selecciones = crud.get_selecciones(db)
 
-    return [seleccion for seleccion in selecciones]
+@router.get("/", response_model=List[SeleccionResponseModel], tags=["selecciones"],
+            dependencies=[Depends(selecciones_etag)])
+async def get_selecciones(response: Response, pagination: Pagination = Depends(), db: Session = Depends(get_read_db)):
+    selecciones = await run_db(db, crud.get_selecciones, pagination.fetch_limit, pagination.after_id)
 
+    return pagination.page(response, selecciones)
 
-@router.get("/{seleccion_id}", response_model=SeleccionResponseModel, tags=["selecciones"])
-async def get_seleccion(seleccion_id: int, db: Session = Depends(get_db)):
-    seleccion = crud.get_seleccion(db, seleccion_id)
+
+@router.get("/search", response_model=List[SeleccionResponseModel], tags=["selecciones"],
+            dependencies=[Depends(selecciones_search_etag)])
+async def search_selecciones(q: str = Query(..., min_length=1, max_length=100), limit: int = Query(20, ge=1, le=100),
+                             db: Session = Depends(get_read_db)):
+    return await run_db(db, crud.search_selecciones, q, limit)
+
+
+@router.get("/{seleccion_id}", response_model=SeleccionResponseModel, tags=["selecciones"],
+            dependencies=[Depends(selecciones_etag)])
+async def get_seleccion(seleccion_id: int, db: Session = Depends(get_read_db)):
+    seleccion = await run_db(db, crud.get_seleccion, seleccion_id)
 
     if seleccion is None:
         raise HTTPException(status_code=404, detail="Selección no encontrada")
@@ -29,26 +46,53 @@ async def get_seleccion(seleccion_id: int, db: Session = Depends(get_db)):
     return seleccion
 
 
+@router.get("/{seleccion_id}/integrantes", response_model=IntegrantesXSeleccionResponseModel, tags=["selecciones"],
+            dependencies=[Depends(seleccion_integrantes_etag)])
+async def get_seleccion_integrantes(seleccion_id: int, response: Response, db: Session = Depends(get_read_db)):
+    seleccion = await run_db(db, crud.get_seleccion_integrantes, seleccion_id)
+
+    if seleccion is None:
+        raise HTTPException(status_code=404, detail="Selección no encontrada")
+
+    return orm_response({"seleccion": seleccion, "integrantes": seleccion.integrantes},
+                        IntegrantesXSeleccionResponseModel, response)
+
+
 @router.post("/", response_model=SeleccionResponseModel, tags=["selecciones"])
-async def create_seleccion(seleccion: SeleccionBaseModel, db: Session = Depends(get_db),
-                           current_usuario: Usuario = Depends(get_current_usuario)):
+async def create_seleccion(seleccion: SeleccionBaseModel, db: Session = Depends(get_write_db),
+                           current_usuario: CurrentUsuarioModel = Depends(get_current_usuario)):
     if current_usuario.is_admin is False:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN,
                             detail="Solo usuarios administradores pueden agregar selecciones.")
 
-    new_seleccion = crud.create_seleccion(db, seleccion)
+    new_seleccion = await run_db(db, crud.create_seleccion, seleccion)
 
     return new_seleccion
 
 
 @router.put("/{seleccion_id}", response_model=SeleccionResponseModel, tags=["selecciones"])
-async def update_seleccion(seleccion: SeleccionBaseModel, seleccion_id: int, db: Session = Depends(get_db),
-                           current_usuario: Usuario = Depends(get_current_usuario)):
+async def update_seleccion(seleccion: SeleccionBaseModel, seleccion_id: int, db: Session = Depends(get_write_db),
+                           current_usuario: CurrentUsuarioModel = Depends(get_current_usuario)):
+    if current_usuario.is_admin is False:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN,
+                            detail="Solo usuarios administradores pueden modificar selecciones.")
+
+    updated_seleccion = await run_db(db, crud.update_seleccion, seleccion, seleccion_id)
+
+    if updated_seleccion is None:
+        raise HTTPException(status_code=404, detail="Selección no encontrada")
+
+    return updated_seleccion
+
+
+@router.patch("/{seleccion_id}", response_model=SeleccionResponseModel, tags=["selecciones"])
+async def patch_seleccion(seleccion: SeleccionPatchModel, seleccion_id: int, db: Session = Depends(get_write_db),
+                          current_usuario: CurrentUsuarioModel = Depends(get_current_usuario)):
     if current_usuario.is_admin is False:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN,
                             detail="Solo usuarios administradores pueden modificar selecciones.")
 
-    updated_seleccion = crud.update_seleccion(db, seleccion, seleccion_id)
+    updated_seleccion = await run_db(db, crud.update_seleccion, seleccion, seleccion_id)
 
     if updated_seleccion is None:
         raise HTTPException(status_code=404, detail="Selección no encontrada")
@@ -57,13 +101,13 @@ async def update_seleccion(seleccion: SeleccionBaseModel, seleccion_id: int, db:
 
 
 @router.delete("/{seleccion_id}", response_model=SeleccionResponseModel, tags=["selecciones"])
-async def delete_seleccion(seleccion_id: int, db: Session = Depends(get_db),
-                           current_usuario: Usuario = Depends(get_current_usuario)):
+async def delete_seleccion(seleccion_id: int, db: Session = Depends(get_write_db),
+                           current_usuario: CurrentUsuarioModel = Depends(get_current_usuario)):
     if current_usuario.is_admin is False:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN,
                             detail="Solo usuarios administradores pueden eliminar selecciones.")
 
-    deleted_seleccion = crud.delete_seleccion(db, seleccion_id)
+    deleted_seleccion = await run_db(db, crud.delete_seleccion, seleccion_id)
 
     if deleted_seleccion is None:
         raise HTTPException(status_code=404, detail="Selección no encontrada")
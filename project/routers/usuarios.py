@@ -1,28 +1,32 @@
 from typing import List
 
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Response
 
 from sqlalchemy.orm import Session
 
-from project.database import get_db
-from project import crud
-from project.models import Usuario
+from project.database import get_read_db, get_write_db, run_db
+from project import crud, utils
+from project.http_cache import ETag
+from project.metrics import TimedRoute
 from project.oauth2 import get_current_usuario
-from project.schemas import UsuarioResponseModel, UsuarioBaseModel, TokenData
+from project.pagination import Pagination
+from project.schemas import UsuarioResponseModel, UsuarioBaseModel, UsuarioPatchModel, TokenData, CurrentUsuarioModel
 
-router = APIRouter(prefix="/usuarios", tags=["usuarios"])
+router = APIRouter(prefix="/usuarios", tags=["usuarios"], route_class=TimedRoute)
 
+usuarios_etag = ETag("usuarios")
 
-@router.get("/", response_model=List[UsuarioResponseModel])
-async def get_usuarios(db: Session = Depends(get_db)):
-    usuarios = crud.get_usuarios(db)
 
-    return [usuario for usuario in usuarios]
+@router.get("/", response_model=List[UsuarioResponseModel], dependencies=[Depends(usuarios_etag)])
+async def get_usuarios(response: Response, pagination: Pagination = Depends(), db: Session = Depends(get_read_db)):
+    usuarios = await run_db(db, crud.get_usuarios, pagination.fetch_limit, pagination.after_id)
 
+    return pagination.page(response, usuarios)
 
-@router.get("/{usuario_id}", response_model=UsuarioResponseModel)
-async def get_usuario(usuario_id: int, db: Session = Depends(get_db)):
-    usuario = crud.get_usuario(db, usuario_id)
+
+@router.get("/{usuario_id}", response_model=UsuarioResponseModel, dependencies=[Depends(usuarios_etag)])
+async def get_usuario(usuario_id: int, db: Session = Depends(get_read_db)):
+    usuario = await run_db(db, crud.get_usuario, usuario_id)
 
     if usuario is None:
         raise HTTPException(status_code=404, detail="Usuario inexistente.")
@@ -31,16 +35,30 @@ async def get_usuario(usuario_id: int, db: Session = Depends(get_db)):
 
 
 @router.post("/", response_model=UsuarioResponseModel)
-async def create_usuario(usuario: UsuarioBaseModel, db: Session = Depends(get_db)):
-    new_usuario = crud.create_usuario(db, usuario)
+async def create_usuario(usuario: UsuarioBaseModel, db: Session = Depends(get_write_db)):
+    hashed_password = await utils.async_hash_password(usuario.password)
+    new_usuario = await run_db(db, crud.create_usuario, usuario, hashed_password)
 
     return new_usuario
 
 
 @router.put("/{usuario_id}", response_model=UsuarioResponseModel)
-async def update_usuario(usuario_id: int, usuario: UsuarioBaseModel, db: Session = Depends(get_db),
-                         current_usuario: Usuario = Depends(get_current_usuario)):
-    updated_usuario = crud.update_usuario(db, usuario, usuario_id)
+async def update_usuario(usuario_id: int, usuario: UsuarioBaseModel, db: Session = Depends(get_write_db),
+                         current_usuario: CurrentUsuarioModel = Depends(get_current_usuario)):
+    hashed_password = await utils.async_hash_password(usuario.password)
+    updated_usuario = await run_db(db, crud.update_usuario, usuario, hashed_password, usuario_id)
+
+    if updated_usuario is None:
+        raise HTTPException(status_code=404, detail="Usuario inexistente.")
+
+    return updated_usuario
+
+
+@router.patch("/{usuario_id}", response_model=UsuarioResponseModel)
+async def patch_usuario(usuario_id: int, usuario: UsuarioPatchModel, db: Session = Depends(get_write_db),
+                        current_usuario: CurrentUsuarioModel = Depends(get_current_usuario)):
+    hashed_password = None if usuario.password is None else await utils.async_hash_password(usuario.password)
+    updated_usuario = await run_db(db, crud.update_usuario, usuario, hashed_password, usuario_id)
 
     if updated_usuario is None:
         raise HTTPException(status_code=404, detail="Usuario inexistente.")
@@ -49,9 +67,9 @@ async def update_usuario(usuario_id: int, usuario: UsuarioBaseModel, db: Session
 
 
 @router.delete("/{usuario_id}")
-async def delete_usuario(usuario_id: int, db: Session = Depends(get_db),
-                         current_usuario: Usuario = Depends(get_current_usuario)):
-    deleted_usuario = crud.delete_usuario(db, usuario_id)
+async def delete_usuario(usuario_id: int, db: Session = Depends(get_write_db),
+                         current_usuario: CurrentUsuarioModel = Depends(get_current_usuario)):
+    deleted_usuario = await run_db(db, crud.delete_usuario, usuario_id)
 
     if deleted_usuario is None:
         raise HTTPException(status_code=404, detail="Usuario inexistente.")
@@ -1,8 +1,11 @@
 from datetime import datetime
 from typing import List, Optional
 
-from pydantic import BaseModel, EmailStr
-from pydantic import validator
+from pydantic import BaseModel, EmailStr, constr
+from pydantic import validator, root_validator
+
+
+BULK_MAX_ITEMS = 1000
 
 
 class ResponseModel(BaseModel):
@@ -10,6 +13,35 @@ class ResponseModel(BaseModel):
         orm_mode = True
 
 
+class PatchModel(BaseModel):
+    """
+    Body of a PATCH: only the fields sent are updated, so every field is optional, but at least one must be sent and
+    none can be null. Unknown fields are rejected rather than ignored.
+    """
+
+    class Config:
+        extra = "forbid"
+
+    @root_validator(pre=True)
+    def validate_not_empty(cls, values):
+        if not values:
+            raise ValueError("Se debe enviar al menos un campo.")
+
+        return values
+
+    @validator("*", pre=True)
+    def validate_not_null(cls, value):
+        if value is None:
+            raise ValueError("El campo no puede ser null.")
+
+        return value
+
+
+class BulkErrorModel(BaseModel):
+    index: int
+    detail: str
+
+
 # ================================
 #           SELECCION
 # ================================
@@ -24,6 +56,10 @@ class SeleccionBaseModel(BaseModel):
         return pais
 
 
+class SeleccionPatchModel(PatchModel, SeleccionBaseModel):
+    pais: Optional[str]
+
+
 class SeleccionResponseModel(ResponseModel):
     id: int
     pais: str
@@ -43,6 +79,10 @@ class EquipoBaseModel(BaseModel):
         return nombre
 
 
+class EquipoPatchModel(PatchModel, EquipoBaseModel):
+    nombre: Optional[str]
+
+
 class EquipoResponseModel(ResponseModel):
     id: int
     nombre: str
@@ -55,6 +95,10 @@ class RolBaseModel(BaseModel):
     titulo: str
 
 
+class RolPatchModel(PatchModel, RolBaseModel):
+    titulo: Optional[str]
+
+
 class RolResponseModel(ResponseModel):
     id: int
     titulo: str
@@ -64,9 +108,10 @@ class RolResponseModel(ResponseModel):
 #           INTEGRANTE
 # ================================
 class IntegranteBaseModel(BaseModel):
-    nombre: str
-    apodo: str
-    apellido: str
+    # As long as their columns, so longer values are rejected before reaching the database.
+    nombre: constr(max_length=50)
+    apodo: constr(max_length=50)
+    apellido: constr(max_length=50)
     edad: int
     num_camiseta: int
     seleccion_id: int
@@ -74,6 +119,17 @@ class IntegranteBaseModel(BaseModel):
     rol_id: int
 
 
+class IntegrantePatchModel(PatchModel, IntegranteBaseModel):
+    nombre: Optional[constr(max_length=50)]
+    apodo: Optional[constr(max_length=50)]
+    apellido: Optional[constr(max_length=50)]
+    edad: Optional[int]
+    num_camiseta: Optional[int]
+    seleccion_id: Optional[int]
+    equipo_id: Optional[int]
+    rol_id: Optional[int]
+
+
 class IntegranteResponseModel(ResponseModel):
     id: int
     nombre: str
@@ -86,6 +142,49 @@ class IntegranteResponseModel(ResponseModel):
     rol: RolResponseModel
 
 
+# Columns /integrantes/ can be sorted by, and fields it can be projected to.
+INTEGRANTE_SORT_COLUMNS = ("id", "nombre", "apodo", "apellido", "edad", "num_camiseta", "seleccion_id", "equipo_id",
+                           "rol_id")
+INTEGRANTE_FIELDS = ("id", "nombre", "apodo", "apellido", "edad", "num_camiseta", "seleccion", "equipo", "rol")
+
+
+class IntegranteFilterModel(BaseModel):
+    seleccion_id: Optional[int] = None
+    equipo_id: Optional[int] = None
+    rol_id: Optional[int] = None
+    num_camiseta: Optional[int] = None
+    edad_min: Optional[int] = None
+    edad_max: Optional[int] = None
+
+
+class IntegranteBulkUpdateModel(IntegranteBaseModel):
+    id: int
+
+
+class IntegrantesBulkResponseModel(ResponseModel):
+    integrantes: List[IntegranteResponseModel]
+    errors: List[BulkErrorModel]
+
+
+class IntegrantesBulkDeleteResponseModel(BaseModel):
+    ids: List[int]
+    errors: List[BulkErrorModel]
+
+
+class ImportErrorModel(BaseModel):
+    line: int
+    detail: str
+
+
+class IntegrantesImportResponseModel(BaseModel):
+    inserted: int
+    rejected: int
+    errors: List[ImportErrorModel]
+    method: Optional[str]
+    seconds: float
+    rows_per_second: float
+
+
 class IntegranteXSeleccionModel(IntegranteBaseModel, ResponseModel):
     id: int
     equipo: EquipoResponseModel
@@ -114,11 +213,22 @@ class UsuarioBaseModel(BaseModel):
     password: str
 
 
+class UsuarioPatchModel(PatchModel, UsuarioBaseModel):
+    email: Optional[EmailStr]
+    password: Optional[str]
+
+
 class UsuarioResponseModel(ResponseModel):
     id: int
     email: str
 
 
+class CurrentUsuarioModel(ResponseModel):
+    id: int
+    email: str
+    is_admin: Optional[bool]
+
+
 class Token(BaseModel):
     access_token: str
     token_type: str
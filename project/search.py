@@ -0,0 +1,67 @@
+import re
+from difflib import SequenceMatcher
+from functools import reduce
+from typing import List
+
+from sqlalchemy import func, literal_column
+
+ACCENTS = "ÁÀÂÄÃÉÈÊËÍÌÎÏÓÒÔÖÕÚÙÛÜÑÇáàâäãéèêëíìîïóòôöõúùûüñç"
+UNACCENTED = "AAAAAEEEEIIIIOOOOOUUUUNCaaaaaeeeeiiiiooooouuuunc"
+UNACCENT_TABLE = str.maketrans(ACCENTS, UNACCENTED)
+
+# Typo tolerant searches look for words starting like the searched ones and keep the similar enough. The longest
+# prefixes are tried first, down to FUZZY_PREFIX_LENGTH letters.
+FUZZY_PREFIX_LENGTH = 3
+FUZZY_MIN_SCORE = 0.75
+# Candidates are read FUZZY_MAX_CANDIDATES at a time, by id, and a search gives up after FUZZY_MAX_SCANNED of them.
+FUZZY_MAX_CANDIDATES = 200
+FUZZY_MAX_SCANNED = 5000
+
+
+def fold(expression):
+    """ Lowercase and strip the accents of a SQL text :expression:.
+
+    Only immutable built-in functions and literals are used, so the result can be indexed and the index matches
+    the queries built with the same expression.
+    """
+    return func.lower(func.translate(expression, literal_column(f"'{ACCENTS}'"), literal_column(f"'{UNACCENTED}'")))
+
+
+def search_vector(*columns):
+    """ The tsvector of the folded text of :columns:, with the 'simple' configuration (no stemming nor stop words).
+    Null columns count as empty. """
+    texts = [func.coalesce(column, literal_column("''")) for column in columns]
+    text = reduce(lambda text, other: text.op("||")(literal_column("' '")).op("||")(other), texts)
+    return func.to_tsvector(literal_column("'simple'"), fold(text))
+
+
+def search_words(text: str) -> List[str]:
+    """ The lowercase, unaccented words of :text:, as search_vector splits them. """
+    return re.findall(r"\w+", text.translate(UNACCENT_TABLE).lower())
+
+
+def prefix_query(words: List[str]):
+    """ A tsquery matching rows with every word of :words: as a prefix, e.g. "lio:* & mes:*". """
+    return " & ".join(f"{word}:*" for word in words)
+
+
+def fuzzy_prefix_lengths(words: List[str]) -> List[int]:
+    """ The prefix lengths to look for typos in :words: with, longest first. The whole words already failed. """
+    longest = max(len(word) for word in words)
+    return list(range(max(longest - 1, FUZZY_PREFIX_LENGTH), FUZZY_PREFIX_LENGTH - 1, -1))
+
+
+def fuzzy_query(words: List[str], prefix_length: int = FUZZY_PREFIX_LENGTH):
+    """ A tsquery matching rows with any word starting with the first :prefix_length: letters of one of :words:, to
+    look for typos. """
+    return " | ".join(f"{word[:prefix_length]}:*" for word in words)
+
+
+def fuzzy_score(words: List[str], text: str):
+    """ How similar (0 to 1) the searched :words: are to the closest words of :text:, on average. """
+    text_words = search_words(text)
+    if not words or not text_words:
+        return 0.0
+
+    return sum(max(SequenceMatcher(None, word, text_word).ratio() for text_word in text_words)
+               for word in words) / len(words)
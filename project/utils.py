@@ -1,6 +1,46 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from decouple import config, Csv
+from fastapi import HTTPException, status
 from passlib.context import CryptContext
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+PASSWORD_WORKERS = config("PASSWORD_WORKERS", default=2, cast=int)
+PASSWORD_QUEUE_SIZE = config("PASSWORD_QUEUE_SIZE", default=16, cast=int)
+
+# The first scheme hashes new passwords, the others are only accepted (and rehashed on login).
+PASSWORD_SCHEMES = config("PASSWORD_SCHEMES", default="bcrypt", cast=Csv())
+BCRYPT_ROUNDS = config("BCRYPT_ROUNDS", default=12, cast=int)
+ARGON2_TIME_COST = config("ARGON2_TIME_COST", default=2, cast=int)
+ARGON2_MEMORY_COST = config("ARGON2_MEMORY_COST", default=19456, cast=int)
+
+
+def create_pwd_context(schemes: list = PASSWORD_SCHEMES, bcrypt_rounds: int = BCRYPT_ROUNDS,
+                       argon2_time_cost: int = ARGON2_TIME_COST, argon2_memory_cost: int = ARGON2_MEMORY_COST):
+    """ Build the CryptContext for :schemes:, with the cost settings of each scheme.
+
+    Hashes made with another scheme or another cost report needs_update, so they are replaced on the next login.
+    """
+    settings = {}
+
+    if "bcrypt" in schemes:
+        settings.update(bcrypt__rounds=bcrypt_rounds, bcrypt__min_rounds=bcrypt_rounds,
+                        bcrypt__max_rounds=bcrypt_rounds)
+
+    if "argon2" in schemes:
+        settings.update(argon2__rounds=argon2_time_cost, argon2__min_rounds=argon2_time_cost,
+                        argon2__max_rounds=argon2_time_cost, argon2__memory_cost=argon2_memory_cost)
+
+    return CryptContext(schemes=schemes, deprecated="auto", **settings)
+
+
+pwd_context = create_pwd_context()
+
+# bcrypt releases the GIL, so a few dedicated threads keep hashing off the event loop and out of the threadpool
+# used for database work.
+password_executor = ThreadPoolExecutor(max_workers=PASSWORD_WORKERS, thread_name_prefix="password")
+password_slots = threading.BoundedSemaphore(PASSWORD_WORKERS + PASSWORD_QUEUE_SIZE)
 
 
 def hash_password(password: str):
@@ -9,3 +49,35 @@ def hash_password(password: str):
 
 def verify_password(plain_password: str, hashed_password: str):
     return pwd_context.verify(plain_password, hashed_password)
+
+
+def password_needs_update(hashed_password: str):
+    return pwd_context.needs_update(hashed_password)
+
+
+async def run_in_password_pool(function, *args):
+    """ Run a password hashing :function: in the password pool without blocking the event loop.
+
+    At most PASSWORD_WORKERS tasks run at once and PASSWORD_QUEUE_SIZE more wait for a worker.
+
+    Raises:
+        HTTPException: 503 if the pool and its queue are full.
+    """
+    if not password_slots.acquire(blocking=False):
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                            detail="Servidor ocupado, intente nuevamente en unos segundos.",
+                            headers={"Retry-After": "1"})
+
+    # The slot is released when the task finishes, even if the request awaiting it was cancelled.
+    future = password_executor.submit(function, *args)
+    future.add_done_callback(lambda _: password_slots.release())
+
+    return await asyncio.wrap_future(future)
+
+
+async def async_hash_password(password: str):
+    return await run_in_password_pool(hash_password, password)
+
+
+async def async_verify_password(plain_password: str, hashed_password: str):
+    return await run_in_password_pool(verify_password, plain_password, hashed_password)
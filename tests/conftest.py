@@ -3,13 +3,16 @@ from datetime import datetime
 import pytest
 from decouple import config
 from jose import jwt
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
 from sqlalchemy.orm import sessionmaker, Session
+from sqlalchemy.pool import NullPool
 from fastapi.testclient import TestClient
 
 from project import app
+from project.cache import catalog_cache, auth_cache
 from project.database import get_db, Base
-from project.models import Usuario, Equipo, Seleccion, Rol
+from project.models import Usuario, Equipo, Seleccion, Rol, Integrante
 from project.oauth2 import SECRET_KEY, ALGORITHM
 from project.schemas import Token
 from project.utils import hash_password
@@ -24,16 +27,24 @@ ADMIN_EMAIL = config("ADMIN_EMAIL")
 ADMIN_PASSWORD = hash_password(config("ADMIN_PASSWORD"))
 
 SQLALCHEMY_TEST_DATABASE_URL = f"postgresql://{TEST_DB_USER}:{TEST_DB_PASSWORD}@{TEST_DB_HOST}:{TEST_DB_PORT}/test_scalonetapp"
+SQLALCHEMY_TEST_ASYNC_DATABASE_URL = (f"postgresql+asyncpg://{TEST_DB_USER}:{TEST_DB_PASSWORD}@{TEST_DB_HOST}:{TEST_DB_PORT}"
+                                      f"/test_scalonetapp")
 
 engine = create_engine(SQLALCHEMY_TEST_DATABASE_URL)
+# TestClient runs every request on a new event loop, so asyncpg connections can't be pooled between them.
+async_engine = create_async_engine(SQLALCHEMY_TEST_ASYNC_DATABASE_URL, poolclass=NullPool)
 
 TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+TestingAsyncSessionLocal = sessionmaker(autocommit=False, autoflush=False, expire_on_commit=False,
+                                        class_=AsyncSession, bind=async_engine)
 
 
 @pytest.fixture()
 def session():
     Base.metadata.drop_all(bind=engine)
     Base.metadata.create_all(bind=engine)
+    catalog_cache.clear()
+    auth_cache.clear()
 
     db = TestingSessionLocal()
     try:
@@ -42,6 +53,23 @@ def session():
         db.close()
 
 
+@pytest.fixture()
+def queries():
+    """
+    Collects every SQL statement sent to the test database while the fixture is active.
+    """
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, "before_cursor_execute", before_cursor_execute)
+
+
 @pytest.fixture()
 def client(session):
     def override_get_db():
@@ -58,6 +86,20 @@ def client(session):
     yield TestClient(app)
 
 
+@pytest.fixture()
+def async_client(client):
+    async def override_get_db():
+        """
+        Creates a SQLAlchemy AsyncSession dependency that will be used in a single request.
+        It is closed once the request is finished.
+        """
+        async with TestingAsyncSessionLocal() as db:
+            yield db
+
+    app.dependency_overrides[get_db] = override_get_db
+    yield client
+
+
 @pytest.fixture
 def usuario_test(session):
     new_usuario = Usuario(email="test@email.com", password=hash_password("password123"))
@@ -159,3 +201,41 @@ def rol_test(client, session):
         "id": new_rol.id,
         "titulo": new_rol.titulo
     }
+
+
+@pytest.fixture
+def integrante_test(client, session, seleccion_test, equipo_test, rol_test):
+    new_integrante = Integrante(nombre="nombre_test", apodo="apodo_test", apellido="apellido_test", edad=30,
+                                num_camiseta=10, seleccion_id=seleccion_test.get("id"),
+                                equipo_id=equipo_test.get("id"), rol_id=rol_test.get("id"))
+
+    session.add(new_integrante)
+    session.commit()
+    session.refresh(new_integrante)
+
+    return {
+        "id": new_integrante.id,
+        "nombre": new_integrante.nombre,
+        "apodo": new_integrante.apodo,
+        "apellido": new_integrante.apellido,
+        "edad": new_integrante.edad,
+        "num_camiseta": new_integrante.num_camiseta,
+        "seleccion": seleccion_test,
+        "equipo": equipo_test,
+        "rol": rol_test,
+    }
+
+
+@pytest.fixture
+def plantel_test(session):
+    selecciones = [Seleccion(pais=f"pais_{i}") for i in range(4)]
+    equipos = [Equipo(nombre=f"equipo_{i}") for i in range(4)]
+    roles = [Rol(titulo=f"rol_{i}") for i in range(4)]
+    session.add_all(selecciones + equipos + roles)
+    session.flush()
+
+    session.add_all([Integrante(nombre=f"nombre_{i}", apodo=f"apodo_{i}", apellido=f"apellido_{i}", edad=20 + i,
+                                num_camiseta=i, seleccion_id=selecciones[i % 4].id, equipo_id=equipos[i // 4 % 4].id,
+                                rol_id=roles[i // 16].id)
+                     for i in range(26)])
+    session.commit()
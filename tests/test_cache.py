@@ -0,0 +1,265 @@
+import asyncio
+import socket
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+from sqlalchemy.util import greenlet_spawn
+
+from project import cache, http_cache
+from project.cache import MemoryCacheBackend, RedisCacheBackend, MISSING, cached, catalog_cache
+from project.schemas import RolResponseModel
+
+ROLES_URL = "/api/v1/roles"
+SELECCIONES_URL = "/api/v1/selecciones"
+CACHE_URL = "/api/v1/monitoring/cache"
+
+
+class TestMemoryCacheBackendClass:
+
+    def test_lru_eviction(self):
+        cache = MemoryCacheBackend(maxsize=2, ttl=60)
+        cache.set(("roles", 1), "a")
+        cache.set(("roles", 2), "b")
+        cache.get(("roles", 1))
+        cache.set(("roles", 3), "c")
+
+        assert cache.get(("roles", 1)) == "a"
+        assert cache.get(("roles", 2)) is MISSING
+        assert cache.get(("roles", 3)) == "c"
+
+    def test_ttl_expiration(self):
+        cache = MemoryCacheBackend(maxsize=2, ttl=0.01)
+        cache.set(("roles", 1), "a")
+        time.sleep(0.02)
+
+        assert cache.get(("roles", 1)) is MISSING
+
+    def test_invalidate_namespace(self):
+        cache = MemoryCacheBackend(maxsize=10, ttl=60)
+        cache.set(("roles", 1), "a")
+        cache.set(("equipos", 1), "b")
+        cache.invalidate("roles")
+
+        assert cache.get(("roles", 1)) is MISSING
+        assert cache.get(("equipos", 1)) == "b"
+        assert cache.stats().get("hits") == 1
+        assert cache.stats().get("misses") == 1
+
+    def test_version_changes_on_invalidate(self):
+        cache = MemoryCacheBackend(maxsize=10, ttl=60)
+        version = cache.version("roles")
+
+        assert cache.version("roles") == version
+        cache.invalidate("roles")
+        assert cache.version("roles") != version
+
+    def test_version_expires_with_ttl(self):
+        # Invalidations made through other workers don't reach this one, so its versions can't outlive the TTL.
+        cache = MemoryCacheBackend(maxsize=10, ttl=0.05)
+        version = cache.version("roles")
+        time.sleep(0.06)
+
+        assert cache.version("roles") != version
+
+    def test_version_without_cache(self):
+        cache = MemoryCacheBackend(maxsize=10, ttl=0)
+
+        assert cache.version("roles") != cache.version("roles")
+
+
+@pytest.fixture
+def redis_server():
+    fakeredis = pytest.importorskip("fakeredis")
+    return fakeredis.FakeServer()
+
+
+@pytest.fixture
+def redis_workers(redis_server):
+    """
+    Two RedisCacheBackend sharing the same fake Redis server, as two uvicorn workers would.
+    """
+    fakeredis = pytest.importorskip("fakeredis")
+    workers = [RedisCacheBackend(fakeredis.FakeRedis(server=redis_server), maxsize=10, ttl=60) for _ in range(2)]
+    for worker in workers:
+        worker.subscribe()
+
+    yield workers
+
+    for worker in workers:
+        worker.close()
+
+
+@pytest.fixture
+def unavailable_redis():
+    """ A RedisCacheBackend whose server is down: nothing listens on its port. """
+    redis = pytest.importorskip("redis")
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+
+    backend = RedisCacheBackend(redis.Redis(port=port, socket_connect_timeout=0.2), maxsize=10, ttl=60)
+    yield backend
+    backend.close()
+
+
+def wait_for(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+    return condition()
+
+
+class TestRedisCacheBackendClass:
+
+    def test_shared_between_workers(self, redis_workers):
+        worker_a, worker_b = redis_workers
+        worker_a.set(("selecciones", "get_seleccion", 1), {"id": 1, "pais": "Argentina"})
+
+        assert worker_b.get(("selecciones", "get_seleccion", 1)) == {"id": 1, "pais": "Argentina"}
+        assert worker_b.get(("selecciones", "get_seleccion", 2)) is MISSING
+
+    def test_invalidation_reaches_every_worker(self, redis_workers):
+        worker_a, worker_b = redis_workers
+        key = ("selecciones", "get_seleccion", 1)
+        worker_a.set(key, {"id": 1, "pais": "Argentina"})
+        worker_a.set(("roles", "get_rol", 1), {"id": 1, "titulo": "DT"})
+        worker_b.get(key)
+
+        worker_b.invalidate("selecciones")
+
+        assert wait_for(lambda: worker_a.local.get(key) is MISSING)
+        assert worker_a.get(key) is MISSING
+        assert worker_a.get(("roles", "get_rol", 1)) == {"id": 1, "titulo": "DT"}
+
+    def test_version_shared_between_workers(self, redis_workers):
+        worker_a, worker_b = redis_workers
+        version = worker_a.version("selecciones")
+
+        assert worker_b.version("selecciones") == version
+
+        worker_b.invalidate("selecciones")
+
+        assert wait_for(lambda: worker_a.version("selecciones") != version)
+        assert worker_a.version("selecciones") == worker_b.version("selecciones")
+
+    def test_set_after_other_worker_invalidated(self, redis_workers, monkeypatch):
+        worker_a, worker_b = redis_workers
+        key = ("selecciones", "get_seleccion", 1)
+        # Worker A doesn't hear about the invalidation yet, so its local copy of the version is stale.
+        worker_a.close()
+        monkeypatch.setattr(worker_a, "subscribe", lambda: None)
+        version = worker_a.version("selecciones")
+
+        worker_b.invalidate("selecciones")
+        worker_a.set(key, {"id": 1, "pais": "old"}, version=version)
+
+        assert worker_a.version("selecciones") == version
+        assert worker_b.get(key) is MISSING
+        assert worker_a.get(key) is MISSING
+
+        worker_b.set(key, {"id": 1, "pais": "new"}, version=worker_b.version("selecciones"))
+        assert worker_b.get(key) == {"id": 1, "pais": "new"}
+
+    def test_no_blocking_calls_on_event_loop(self, redis_workers):
+        worker_a, _ = redis_workers
+        worker_a.set(("roles", "get_rol", 1), {"id": 1, "titulo": "DT"})
+        worker_a.local.clear()
+        threads = []
+        get = worker_a.client.get
+
+        def record_thread(*args):
+            threads.append(threading.get_ident())
+            return get(*args)
+
+        worker_a.client.get = record_thread
+
+        async def read():
+            # The way crud getters run under ASYNC_DB: inside AsyncSession.run_sync, on the event loop thread.
+            return await greenlet_spawn(worker_a.get, ("roles", "get_rol", 1)), threading.get_ident()
+
+        value, loop_thread = asyncio.run(read())
+
+        assert value == {"id": 1, "titulo": "DT"}
+        assert threads and loop_thread not in threads
+
+    def test_unavailable_redis_degrades(self, unavailable_redis):
+        key = ("roles", "get_rol", 1)
+
+        assert unavailable_redis.get(key) is MISSING
+        unavailable_redis.set(key, {"id": 1, "titulo": "DT"})
+        assert unavailable_redis.get(key) is MISSING
+        assert unavailable_redis.version("roles") != unavailable_redis.version("roles")
+        unavailable_redis.invalidate("roles")
+        assert unavailable_redis.stats().get("errors") >= 5
+
+    def test_unavailable_redis_requests(self, client, admin_login, unavailable_redis, monkeypatch):
+        monkeypatch.setattr(cache, "catalog_cache", unavailable_redis)
+        monkeypatch.setattr(http_cache, "catalog_cache", unavailable_redis)
+        headers = {'Authorization': f'{admin_login.token_type} {admin_login.access_token}'}
+
+        created = client.post(f"{ROLES_URL}/", json={"titulo": "rol_1"}, headers=headers)
+        response = client.get(f"{ROLES_URL}/{created.json().get('id')}")
+
+        assert created.status_code == 200
+        assert response.status_code == 200
+        assert client.get(f"{ROLES_URL}/", headers={"If-None-Match": response.headers["ETag"]}).status_code == 200
+
+    def test_dead_listener_resubscribes(self, redis_workers):
+        worker_a, worker_b = redis_workers
+        key = ("selecciones", "get_seleccion", 1)
+        worker_a._subscriber.stop()
+        worker_a._subscriber.join()
+
+        worker_a.set(key, {"id": 1, "pais": "Argentina"})
+        worker_b.invalidate("selecciones")
+
+        assert wait_for(lambda: worker_a.local.get(key) is MISSING)
+
+    def test_listener_error_drops_local_entries(self, redis_workers, monkeypatch):
+        worker_a, _ = redis_workers
+        monkeypatch.setattr(cache, "REDIS_RETRY_SECONDS", 0)
+        worker_a.set(("roles", "get_rol", 1), {"id": 1, "titulo": "DT"})
+
+        worker_a._on_listener_error(ConnectionError("connection lost"), None, None)
+
+        assert worker_a.local.get(("roles", "get_rol", 1)) is MISSING
+
+
+class TestCatalogCacheClass:
+
+    def test_get_selecciones_cached(self, client, seleccion_test, queries):
+        first = client.get(f"{SELECCIONES_URL}/")
+        second = client.get(f"{SELECCIONES_URL}/")
+
+        assert first.json() == second.json() == [seleccion_test]
+        assert len([query for query in queries if "FROM selecciones" in query]) == 1
+        assert client.get(CACHE_URL).json().get("catalog").get("hits") == 1
+
+    def test_update_seleccion_invalidates(self, client, seleccion_test, admin_login):
+        client.get(f"{SELECCIONES_URL}/{seleccion_test.get('id')}")
+        client.put(f"{SELECCIONES_URL}/{seleccion_test.get('id')}", json={"pais": "pais_updated"},
+                   headers={'Authorization': f'{admin_login.token_type} {admin_login.access_token}'})
+
+        response = client.get(f"{SELECCIONES_URL}/{seleccion_test.get('id')}")
+
+        assert response.json().get("pais") == "pais_updated"
+
+    def test_write_during_read_not_cached(self):
+        @cached("roles", RolResponseModel)
+        def get_rol(db, rol_id):
+            calls.append(rol_id)
+            if len(calls) == 1:
+                # A write commits and invalidates the namespace while the query runs.
+                catalog_cache.invalidate("roles")
+            return SimpleNamespace(id=rol_id, titulo=f"titulo_{len(calls)}")
+
+        calls = []
+        primary = SimpleNamespace(info={})
+
+        assert get_rol(primary, 1).titulo == "titulo_1"
+        assert get_rol(primary, 1).titulo == "titulo_2"
+        assert get_rol(primary, 1).titulo == "titulo_2"
+        assert calls == [1, 1]
@@ -0,0 +1,161 @@
+import asyncio
+import threading
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+
+from project import database
+from project.database import MeteredQueuePool, PRIMARY_COOKIE, REPLICA_SESSION_INFO, close_session
+from tests.conftest import SQLALCHEMY_TEST_DATABASE_URL, TestingSessionLocal, engine
+
+DB_URL = "/api/v1/monitoring/db"
+ROLES_URL = "/api/v1/roles"
+SELECCIONES_URL = "/api/v1/selecciones"
+
+
+class TestMeteredPoolClass:
+
+    def test_checkouts_counted(self):
+        engine = create_engine(SQLALCHEMY_TEST_DATABASE_URL, poolclass=MeteredQueuePool, pool_size=2, max_overflow=0)
+
+        with engine.connect(), engine.connect():
+            stats = engine.pool.stats()
+
+        assert stats.get("checkouts") == 2
+        assert stats.get("checked_out") == 2
+        assert stats.get("timeouts") == 0
+        assert engine.pool.stats().get("checked_out") == 0
+        engine.dispose()
+
+    def test_timeouts_counted(self):
+        engine = create_engine(SQLALCHEMY_TEST_DATABASE_URL, poolclass=MeteredQueuePool, pool_size=1, max_overflow=0,
+                               pool_timeout=0.1)
+
+        with engine.connect():
+            with pytest.raises(PoolTimeoutError):
+                engine.connect()
+
+        stats = engine.pool.stats()
+        assert stats.get("timeouts") == 1
+        assert stats.get("wait_seconds_max") >= 0.1
+        engine.dispose()
+
+    def test_get_db_pool_stats(self, client):
+        response = client.get(DB_URL)
+
+        assert response.status_code == 200
+        assert {"size", "checked_out", "overflow", "checkouts", "timeouts",
+                "wait_seconds_avg"} <= response.json().get("sync").keys()
+
+
+class TestCloseSessionClass:
+
+    @staticmethod
+    def close_threads(db):
+        """ Close :db: with close_session and get the threads of the event loop and of the close. """
+        threads = []
+        close = db.close
+
+        def record_close():
+            threads.append(threading.get_ident())
+            close()
+
+        db.close = record_close
+
+        async def run():
+            await close_session(db)
+            return threading.get_ident()
+
+        return asyncio.run(run()), threads
+
+    def test_close_off_the_event_loop(self, session):
+        db = TestingSessionLocal()
+        db.execute("SELECT 1")
+
+        loop_thread, threads = self.close_threads(db)
+
+        assert threads and loop_thread not in threads
+        assert not db.in_transaction()
+
+    def test_close_unused_session_inline(self, session):
+        loop_thread, threads = self.close_threads(TestingSessionLocal())
+
+        assert threads == [loop_thread]
+
+
+@pytest.fixture
+def replica(monkeypatch):
+    """ A fake replica (the test database itself) that counts the Sessions it opens. """
+    opened = []
+
+    def replica_session():
+        opened.append(TestingSessionLocal(info=REPLICA_SESSION_INFO))
+        return opened[-1]
+
+    monkeypatch.setattr(database, "replica_sessions", [replica_session])
+    monkeypatch.setattr(database, "next_replica_session", replica_session)
+    return opened
+
+
+class TestReplicaRoutingClass:
+
+    def test_reads_use_replica(self, client, replica):
+        response = client.get(f"{ROLES_URL}/")
+
+        assert response.status_code == 200
+        assert len(replica) == 1
+
+    def test_writes_use_primary(self, client, admin_login, replica):
+        headers = {'Authorization': f'{admin_login.token_type} {admin_login.access_token}'}
+        response = client.post(f"{ROLES_URL}/", json={"titulo": "rol_1"}, headers=headers)
+
+        assert response.status_code == 200
+        assert not replica
+        assert PRIMARY_COOKIE in response.cookies
+
+    def test_reads_after_write_use_primary(self, client, admin_login, replica):
+        headers = {'Authorization': f'{admin_login.token_type} {admin_login.access_token}'}
+        rol_id = client.post(f"{ROLES_URL}/", json={"titulo": "rol_1"}, headers=headers).json().get("id")
+
+        response = client.get(f"{ROLES_URL}/{rol_id}")
+
+        assert response.status_code == 200
+        assert not replica
+
+    def test_lagging_replica_miss_reads_primary(self, client, admin_login, monkeypatch):
+        headers = {'Authorization': f'{admin_login.token_type} {admin_login.access_token}'}
+        rol_id = client.post(f"{ROLES_URL}/", json={"titulo": "rol_1"}, headers=headers).json().get("id")
+
+        # A replica that hasn't applied the next write yet: a REPEATABLE READ snapshot taken before it.
+        connection = engine.connect().execution_options(isolation_level="REPEATABLE READ")
+        lagging_replica = TestingSessionLocal(bind=connection, info=REPLICA_SESSION_INFO)
+        try:
+            lagging_replica.execute("SELECT count(*) FROM roles")
+            client.put(f"{ROLES_URL}/{rol_id}", json={"titulo": "rol_updated"}, headers=headers)
+
+            monkeypatch.setattr(database, "replica_sessions", [lambda: lagging_replica])
+            monkeypatch.setattr(database, "next_replica_session", lambda: lagging_replica)
+            client.cookies.clear()
+            response = client.get(f"{ROLES_URL}/{rol_id}")
+            cached_response = client.get(f"{ROLES_URL}/{rol_id}", headers={"If-None-Match": response.headers["ETag"]})
+        finally:
+            lagging_replica.close()
+            connection.close()
+
+        assert response.json().get("titulo") == "rol_updated"
+        assert cached_response.status_code == 304
+
+    def test_uncached_replica_etag_differs(self, client, replica):
+        replica_etag = client.get(f"{SELECCIONES_URL}/search", params={"q": "arg"}).headers["ETag"]
+        cached_etag = client.get(f"{SELECCIONES_URL}/").headers["ETag"]
+        client.cookies.set(PRIMARY_COOKIE, "1")
+
+        assert client.get(f"{SELECCIONES_URL}/search", params={"q": "arg"}).headers["ETag"] != replica_etag
+        assert client.get(f"{SELECCIONES_URL}/").headers["ETag"] == cached_etag
+
+    def test_no_sticky_cookie_without_replicas(self, client, admin_login):
+        headers = {'Authorization': f'{admin_login.token_type} {admin_login.access_token}'}
+        response = client.post(f"{ROLES_URL}/", json={"titulo": "rol_1"}, headers=headers)
+
+        assert PRIMARY_COOKIE not in response.cookies
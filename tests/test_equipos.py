@@ -74,3 +74,45 @@ class TestEquipoClass:
 
         assert response.status_code == 404
         assert response.json().get('detail') == "Equipo no encontrado."
+
+
+class TestEquipoIntegrantesClass:
+
+    def test_get_equipo_integrantes(self, client, integrante_test):
+        equipo = integrante_test.get("equipo")
+        response = client.get(f"{EQUIPOS_URL}/{equipo.get('id')}/integrantes")
+
+        assert response.status_code == 200
+        assert response.json().get("equipo") == equipo
+        assert response.json().get("integrantes") == [{
+            "id": integrante_test.get("id"), "nombre": "nombre_test", "apodo": "apodo_test",
+            "apellido": "apellido_test", "edad": 30, "num_camiseta": 10,
+            "seleccion_id": integrante_test.get("seleccion").get("id"), "equipo_id": equipo.get("id"),
+            "rol_id": integrante_test.get("rol").get("id"), "seleccion": integrante_test.get("seleccion")}]
+
+    def test_get_equipo_integrantes_empty(self, client, equipo_test):
+        response = client.get(f"{EQUIPOS_URL}/{equipo_test.get('id')}/integrantes")
+
+        assert response.status_code == 200
+        assert response.json() == {"equipo": equipo_test, "integrantes": []}
+
+    def test_get_equipo_integrantes_error404(self, client):
+        response = client.get(f"{EQUIPOS_URL}/99999/integrantes")
+
+        assert response.status_code == 404
+        assert response.json().get("detail") == "Equipo no encontrado."
+
+    def test_get_equipo_integrantes_pages(self, client, plantel_test, queries):
+        equipo_id = client.get(f"{EQUIPOS_URL}/").json()[0].get("id")
+        queries.clear()
+
+        first_page = client.get(f"{EQUIPOS_URL}/{equipo_id}/integrantes", params={"limit": 3})
+        cursor = first_page.headers.get("X-Next-Cursor")
+        second_page = client.get(f"{EQUIPOS_URL}/{equipo_id}/integrantes", params={"limit": 3, "cursor": cursor})
+
+        # The first equipo has integrantes 0 to 3, and 16 to 19.
+        assert [integrante.get("num_camiseta") for integrante in first_page.json().get("integrantes")] == [0, 1, 2]
+        assert [integrante.get("num_camiseta") for integrante in second_page.json().get("integrantes")] == \
+               [3, 16, 17]
+        assert second_page.json().get("equipo").get("id") == equipo_id
+        assert len(queries) == 2
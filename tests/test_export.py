@@ -0,0 +1,64 @@
+import asyncio
+import csv
+import io
+import json
+
+from project.database import stream_db
+from project.crud import select_integrantes_export
+from project.routers import export
+from tests.conftest import TestingSessionLocal
+
+EXPORT_URL = "/api/v1/export/integrantes"
+
+
+class TestExportClass:
+
+    def test_export_integrantes_ndjson(self, client, plantel_test):
+        response = client.get(EXPORT_URL)
+
+        rows = [json.loads(line) for line in response.text.splitlines()]
+        assert response.status_code == 200
+        assert response.headers["content-type"] == "application/x-ndjson"
+        assert "ETag" in response.headers
+        assert len(rows) == 26
+        assert [row.get("id") for row in rows] == sorted(row.get("id") for row in rows)
+        assert rows[0] == {"id": rows[0].get("id"), "nombre": "nombre_0", "apodo": "apodo_0",
+                           "apellido": "apellido_0", "edad": 20, "num_camiseta": 0,
+                           "seleccion_id": rows[0].get("seleccion_id"), "seleccion_pais": "pais_0",
+                           "equipo_id": rows[0].get("equipo_id"), "equipo_nombre": "equipo_0",
+                           "rol_id": rows[0].get("rol_id"), "rol_titulo": "rol_0"}
+
+    def test_export_integrantes_csv(self, client, plantel_test, monkeypatch):
+        monkeypatch.setattr(export, "EXPORT_BATCH_SIZE", 10)
+
+        response = client.get(EXPORT_URL, params={"format": "csv"})
+
+        rows = list(csv.DictReader(io.StringIO(response.text)))
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/csv")
+        assert len(rows) == 26
+        assert rows[25].get("nombre") == "nombre_25"
+        assert rows[25].get("rol_titulo") == "rol_1"
+
+    def test_export_integrantes_csv_empty(self, client, session):
+        response = client.get(EXPORT_URL, params={"format": "csv"})
+
+        assert response.text.splitlines() == ["id,nombre,apodo,apellido,edad,num_camiseta,seleccion_id,seleccion_pais,"
+                                              "equipo_id,equipo_nombre,rol_id,rol_titulo"]
+
+    def test_export_integrantes_error422(self, client):
+        response = client.get(EXPORT_URL, params={"format": "xml"})
+
+        assert response.status_code == 422
+
+    def test_stream_db_batches(self, plantel_test):
+        async def batch_sizes():
+            return [len(partition) async for partition in stream_db(db, select_integrantes_export(), 10)]
+
+        db = TestingSessionLocal()
+        try:
+            sizes = asyncio.run(batch_sizes())
+        finally:
+            db.close()
+
+        assert sizes == [10, 10, 6]
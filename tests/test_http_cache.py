@@ -0,0 +1,46 @@
+SELECCIONES_URL = "/api/v1/selecciones"
+INTEGRANTES_URL = "/api/v1/integrantes"
+
+
+class TestETagClass:
+
+    def test_get_seleccion_etag(self, client, seleccion_test):
+        response = client.get(f"{SELECCIONES_URL}/{seleccion_test.get('id')}")
+
+        assert response.status_code == 200
+        assert response.headers.get("ETag").startswith('"')
+        assert response.headers.get("Cache-Control") == "no-cache"
+
+    def test_get_seleccion_not_modified(self, client, seleccion_test, queries):
+        etag = client.get(f"{SELECCIONES_URL}/{seleccion_test.get('id')}").headers.get("ETag")
+        queries.clear()
+
+        response = client.get(f"{SELECCIONES_URL}/{seleccion_test.get('id')}", headers={"If-None-Match": etag})
+
+        assert response.status_code == 304
+        assert response.content == b""
+        assert response.headers.get("ETag") == etag
+        assert queries == []
+
+    def test_get_integrantes_not_modified_weak(self, client, integrante_test):
+        etag = client.get(f"{INTEGRANTES_URL}/").headers.get("ETag")
+
+        response = client.get(f"{INTEGRANTES_URL}/", headers={"If-None-Match": f'"other", W/{etag}'})
+
+        assert response.status_code == 304
+
+    def test_update_seleccion_changes_etags(self, client, integrante_test, admin_login):
+        seleccion_id = integrante_test["seleccion"]["id"]
+        seleccion_etag = client.get(f"{SELECCIONES_URL}/{seleccion_id}").headers.get("ETag")
+        integrantes_etag = client.get(f"{INTEGRANTES_URL}/").headers.get("ETag")
+
+        client.put(f"{SELECCIONES_URL}/{seleccion_id}", json={"pais": "pais_updated"},
+                   headers={'Authorization': f'{admin_login.token_type} {admin_login.access_token}'})
+
+        seleccion_response = client.get(f"{SELECCIONES_URL}/{seleccion_id}", headers={"If-None-Match": seleccion_etag})
+        integrantes_response = client.get(f"{INTEGRANTES_URL}/", headers={"If-None-Match": integrantes_etag})
+
+        assert seleccion_response.status_code == 200
+        assert seleccion_response.json().get("pais") == "pais_updated"
+        assert integrantes_response.status_code == 200
+        assert integrantes_response.json()[0].get("seleccion").get("pais") == "pais_updated"
@@ -0,0 +1,144 @@
+import asyncio
+import json
+import sys
+
+import pytest
+
+from project import crud
+from project.importer import IntegranteImporter, ImportFormat, numbered_lines, main
+from project.models import Integrante
+
+IMPORT_URL = "/api/v1/integrantes/import"
+
+CSV_HEADER = "nombre,apodo,apellido,edad,num_camiseta,seleccion,equipo,rol"
+
+
+def admin_headers(admin_login):
+    return {'Authorization': f'{admin_login.token_type} {admin_login.access_token}'}
+
+
+class TestImportClass:
+
+    def test_import_integrantes_csv(self, client, session, admin_login, seleccion_test, equipo_test, rol_test):
+        lines = [CSV_HEADER] + [f"nombre_{i},apodo_{i},apellido_{i},{20 + i},{i},PAÍS_TEST,equipo_test,Rol_Test"
+                                for i in range(30)]
+
+        response = client.post(IMPORT_URL, data="\n".join(lines).encode(), headers=admin_headers(admin_login))
+
+        assert response.status_code == 200
+        assert response.json().get("inserted") == 30
+        assert response.json().get("rejected") == 0
+        assert response.json().get("method") == "copy"
+        integrantes = session.query(Integrante).order_by(Integrante.num_camiseta).all()
+        assert len(integrantes) == 30
+        assert (integrantes[29].nombre, integrantes[29].edad, integrantes[29].seleccion_id) == \
+               ("nombre_29", 49, seleccion_test.get("id"))
+
+    def test_import_integrantes_csv_rejects(self, client, session, admin_login, seleccion_test, equipo_test,
+                                            rol_test):
+        lines = [CSV_HEADER,
+                 "nombre_0,apodo_0,apellido_0,20,1,pais_test,equipo_test,rol_test",
+                 "nombre_1,apodo_1,apellido_1,veinte,2,pais_test,equipo_test,rol_test",
+                 "",
+                 "nombre_3,apodo_3,apellido_3,23,3,pais_inexistente,equipo_test,rol_test",
+                 "nombre_4,apodo_4",
+                 '"nombre, 5",,apellido_5,25,5,pais_test,equipo_test,rol_test']
+
+        response = client.post(IMPORT_URL, data="\r\n".join(lines).encode(), headers=admin_headers(admin_login))
+
+        assert response.status_code == 200
+        assert response.json().get("inserted") == 2
+        assert response.json().get("rejected") == 3
+        assert response.json().get("errors") == [
+            {"line": 3, "detail": "edad: value is not a valid integer"},
+            {"line": 5, "detail": "Selección no encontrada: pais_inexistente."},
+            {"line": 6, "detail": "Se esperaban 8 columnas y hay 2."}]
+        assert session.query(Integrante).filter(Integrante.num_camiseta == 5).one().nombre == "nombre, 5"
+
+    def test_import_integrantes_csv_too_long(self, client, session, admin_login, seleccion_test, equipo_test,
+                                             rol_test):
+        lines = [CSV_HEADER,
+                 "nombre_0,apodo_0,apellido_0,20,1,pais_test,equipo_test,rol_test",
+                 f"{'n' * 60},apodo_1,apellido_1,21,2,pais_test,equipo_test,rol_test",
+                 "nombre_2,apodo_2,apellido_2,22,3,pais_test,equipo_test,rol_test"]
+
+        response = client.post(IMPORT_URL, data="\n".join(lines).encode(), headers=admin_headers(admin_login))
+
+        assert response.status_code == 200
+        assert response.json().get("inserted") == 2
+        assert response.json().get("errors") == [
+            {"line": 3, "detail": "nombre: ensure this value has at most 50 characters"}]
+        assert session.query(Integrante).count() == 2
+
+    def test_import_failed_batch_rejected(self, session, seleccion_test, equipo_test, rol_test):
+        references = crud.get_integrante_references(session)
+        importer = IntegranteImporter(ImportFormat.csv, references)
+        valid = "nombre_{0},apodo_{0},apellido_{0},20,{0},pais_test,equipo_test,rol_test"
+        importer.load(session, [(1, CSV_HEADER), (2, valid.format(1)), (3, valid.format(2))])
+        # Deleted after the references were loaded, so the batch passes validation but fails its foreign key.
+        session.execute("DELETE FROM integrantes")
+        session.execute("DELETE FROM roles")
+        session.commit()
+
+        importer.load(session, [(4, valid.format(3)), (5, valid.format(4))])
+
+        assert importer.inserted == 2
+        assert importer.rejected == 2
+        assert [error["line"] for error in importer.errors] == [4, 5]
+        assert importer.errors[0]["detail"].startswith("No se pudo cargar el lote: ")
+        assert session.query(Integrante).count() == 0
+
+    def test_import_integrantes_ndjson(self, client, session, admin_login, seleccion_test, equipo_test, rol_test):
+        records = [{"nombre": "nombre_0", "apodo": "apodo_0", "apellido": "apellido_0", "edad": 20,
+                    "num_camiseta": 1, "seleccion_id": seleccion_test.get("id"), "equipo_id": equipo_test.get("id"),
+                    "rol_id": rol_test.get("id")},
+                   {"nombre": "nombre_1", "apodo": "apodo_1", "apellido": "apellido_1", "edad": 21,
+                    "num_camiseta": 2, "seleccion_id": seleccion_test.get("id"), "equipo_id": 99999,
+                    "rol_id": rol_test.get("id")}]
+        lines = [json.dumps(record) for record in records] + ["{no es json", "[]"]
+
+        response = client.post(IMPORT_URL, params={"format": "ndjson"}, data="\n".join(lines).encode(),
+                               headers=admin_headers(admin_login))
+
+        assert response.status_code == 200
+        assert response.json().get("inserted") == 1
+        assert response.json().get("errors") == [{"line": 2, "detail": "Equipo no encontrado."},
+                                                 {"line": 3, "detail": "JSON inválido."},
+                                                 {"line": 4, "detail": "Se esperaba un objeto JSON."}]
+        assert session.query(Integrante).one().nombre == "nombre_0"
+
+    def test_import_integrantes_export_round_trip(self, client, session, admin_login, plantel_test):
+        exported = client.get("/api/v1/export/integrantes", params={"format": "csv"}).content
+
+        response = client.post(IMPORT_URL, data=exported, headers=admin_headers(admin_login))
+
+        assert response.status_code == 200
+        assert response.json().get("inserted") == 26
+        assert session.query(Integrante).count() == 52
+
+    def test_import_integrantes_error403(self, client, usuario_login):
+        response = client.post(IMPORT_URL, data=CSV_HEADER.encode(),
+                               headers={'Authorization': f'{usuario_login.token_type} {usuario_login.access_token}'})
+
+        assert response.status_code == 403
+
+    def test_numbered_lines_batches(self):
+        async def chunks():
+            for chunk in ["﻿a\nb".encode(), "\n\nc\r".encode(), "\nd\ne\nf".encode()]:
+                yield chunk
+
+        async def batches():
+            return [batch async for batch in numbered_lines(chunks(), 2)]
+
+        assert asyncio.run(batches()) == [[(1, "a"), (2, "b")], [(4, "c"), (5, "d")], [(6, "e"), (7, "f")]]
+
+    def test_cli_requires_shared_cache(self, monkeypatch, tmp_path, capsys):
+        path = tmp_path / "jugadores.csv"
+        path.write_text(CSV_HEADER)
+        monkeypatch.setattr(sys, "argv", ["importer", str(path)])
+
+        with pytest.raises(SystemExit) as exit_info:
+            main()
+
+        assert exit_info.value.code == 2
+        assert "CACHE_BACKEND=redis o --force" in capsys.readouterr().err
@@ -0,0 +1,45 @@
+import pytest
+from sqlalchemy import text
+from sqlalchemy.dialects import postgresql
+
+from project.models import Integrante, Usuario, Seleccion
+from project.search import search_vector
+
+
+def explain(session, query):
+    """ Get the plan of an ORM :query:, with sequential scans disabled so the planner shows whether an index fits
+    even on the near empty test tables. """
+    statement = query.statement.compile(dialect=postgresql.dialect(), compile_kwargs={"literal_binds": True})
+    session.execute(text("SET LOCAL enable_seqscan = off"))
+    plan = session.execute(text(f"EXPLAIN {statement}")).scalars().all()
+    session.rollback()
+    return "\n".join(plan)
+
+
+class TestIndexesClass:
+
+    @pytest.mark.parametrize("criteria, index", [
+        ((Integrante.seleccion_id == 1,), "ix_integrantes_seleccion_id_num_camiseta"),
+        ((Integrante.seleccion_id == 1, Integrante.num_camiseta == 10), "ix_integrantes_seleccion_id_num_camiseta"),
+        ((Integrante.equipo_id == 1,), "ix_integrantes_equipo_id"),
+        ((Integrante.rol_id == 1,), "ix_integrantes_rol_id"),
+    ])
+    def test_integrantes_lookups_use_index(self, session, criteria, index):
+        plan = explain(session, session.query(Integrante).filter(*criteria))
+
+        assert index in plan
+        assert "Seq Scan on integrantes" not in plan
+
+    @pytest.mark.parametrize("model, columns, index", [
+        (Integrante, (Integrante.nombre, Integrante.apodo, Integrante.apellido), "ix_integrantes_search"),
+        (Seleccion, (Seleccion.pais,), "ix_selecciones_search"),
+    ])
+    def test_search_uses_index(self, session, model, columns, index):
+        query = session.query(model).filter(search_vector(*columns).op("@@")(text("to_tsquery('simple', 'mes:*')")))
+
+        assert index in explain(session, query)
+
+    def test_usuario_by_email_uses_index(self, session):
+        plan = explain(session, session.query(Usuario).filter(Usuario.email == "usuario@test.com"))
+
+        assert "usuarios_email_key" in plan
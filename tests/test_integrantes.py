@@ -0,0 +1,408 @@
+import pytest
+from sqlalchemy import insert
+
+from project import crud
+from project.models import Integrante
+from project.schemas import IntegranteBaseModel
+
+INTEGRANTES_URL = "/api/v1/integrantes"
+
+
+def integrante_payload(seleccion_id, equipo_id, rol_id, **values):
+    return {"nombre": "nombre_test", "apodo": "apodo_test", "apellido": "apellido_test", "edad": 30,
+            "num_camiseta": 10, "seleccion_id": seleccion_id, "equipo_id": equipo_id, "rol_id": rol_id, **values}
+
+
+def get_all_pages(client, params):
+    """ Follow the X-Next-Cursor headers of /integrantes/ and return every page. """
+    pages = []
+    params = dict(params)
+
+    while True:
+        response = client.get(f"{INTEGRANTES_URL}/", params=params)
+        assert response.status_code == 200
+        pages.append(response.json())
+
+        if "X-Next-Cursor" not in response.headers:
+            return pages
+        params["cursor"] = response.headers["X-Next-Cursor"]
+
+
+class TestIntegranteClass:
+
+    def test_create_integrante(self, client, admin_login, seleccion_test, equipo_test, rol_test):
+        response = client.post(f"{INTEGRANTES_URL}/",
+                               json={"nombre": "nombre_test", "apodo": "apodo_test", "apellido": "apellido_test",
+                                     "edad": 30, "num_camiseta": 10, "seleccion_id": seleccion_test.get("id"),
+                                     "equipo_id": equipo_test.get("id"), "rol_id": rol_test.get("id")},
+                               headers={
+                                   'Authorization': f'{admin_login.token_type} {admin_login.access_token}'})
+
+        assert response.status_code == 200
+        assert response.json().get("seleccion") == seleccion_test
+        assert response.json().get("equipo") == equipo_test
+        assert response.json().get("rol") == rol_test
+
+    def test_get_integrante(self, client, integrante_test):
+        response = client.get(f"{INTEGRANTES_URL}/{integrante_test.get('id')}")
+
+        assert response.status_code == 200
+        assert response.json() == integrante_test
+
+    def test_get_integrante_error404(self, client):
+        response = client.get(f"{INTEGRANTES_URL}/99999")
+
+        assert response.status_code == 404
+        assert response.json().get("detail") == "Integrante no encontrado"
+
+    def test_get_integrantes(self, client, integrante_test):
+        response = client.get(f"{INTEGRANTES_URL}/")
+
+        assert response.status_code == 200
+        assert response.json() == [integrante_test]
+
+    def test_get_integrantes_query_count(self, client, plantel_test, queries):
+        response = client.get(f"{INTEGRANTES_URL}/")
+
+        assert response.status_code == 200
+        assert len(response.json()) == 26
+        assert len([query for query in queries if query.lstrip().upper().startswith("SELECT")]) == 1
+
+    def test_get_integrante_query_count(self, client, integrante_test, queries):
+        response = client.get(f"{INTEGRANTES_URL}/{integrante_test.get('id')}")
+
+        assert response.status_code == 200
+        assert len([query for query in queries if query.lstrip().upper().startswith("SELECT")]) == 1
+
+    def test_update_integrante_query_count(self, client, integrante_test, admin_login, queries):
+        response = client.put(f"{INTEGRANTES_URL}/{integrante_test.get('id')}",
+                              json={"nombre": "nombre_updated", "apodo": "apodo_test", "apellido": "apellido_test",
+                                    "edad": 31, "num_camiseta": 9, "seleccion_id": integrante_test["seleccion"]["id"],
+                                    "equipo_id": integrante_test["equipo"]["id"],
+                                    "rol_id": integrante_test["rol"]["id"]},
+                              headers={
+                                  'Authorization': f'{admin_login.token_type} {admin_login.access_token}'})
+
+        assert response.status_code == 200
+        assert response.json().get("nombre") == "nombre_updated"
+        assert response.json().get("seleccion") == integrante_test.get("seleccion")
+        # usuario lookup + a single UPDATE ... RETURNING, not followed by lazy loads
+        assert len(queries) == 2
+        assert queries[1].lstrip().upper().startswith("WITH")
+
+    def test_get_integrantes_paginated(self, client, plantel_test):
+        ids = []
+        pages = 0
+        params = {"limit": 10}
+
+        while True:
+            response = client.get(f"{INTEGRANTES_URL}/", params=params)
+            assert response.status_code == 200
+            assert len(response.json()) <= 10
+
+            ids += [integrante.get("id") for integrante in response.json()]
+            pages += 1
+
+            if "X-Next-Cursor" not in response.headers:
+                break
+            params["cursor"] = response.headers["X-Next-Cursor"]
+
+        assert pages == 3
+        assert len(ids) == 26
+        assert ids == sorted(set(ids))
+
+    @pytest.mark.parametrize("params, status_code", [
+        ({"cursor": "not-a-cursor"}, 400),
+        ({"limit": 0}, 422),
+        ({"limit": 100000}, 422),
+    ])
+    def test_get_integrantes_paginated_error(self, client, params, status_code):
+        response = client.get(f"{INTEGRANTES_URL}/", params=params)
+
+        assert response.status_code == status_code
+
+    def test_patch_integrante(self, client, integrante_test, admin_login, queries):
+        response = client.patch(f"{INTEGRANTES_URL}/{integrante_test.get('id')}", json={"num_camiseta": 7},
+                                headers={
+                                    'Authorization': f'{admin_login.token_type} {admin_login.access_token}'})
+
+        update_statement = next(query for query in queries if "UPDATE integrantes" in query)
+        assert response.status_code == 200
+        assert response.json() == {**integrante_test, "num_camiseta": 7}
+        assert "SET num_camiseta=" in update_statement
+        assert "nombre=" not in update_statement
+
+    @pytest.mark.parametrize("payload, status_code", [
+        ({}, 422),
+        ({"edad": None}, 422),
+        ({"edad": "treinta"}, 422),
+        ({"camiseta": 7}, 422),
+    ])
+    def test_patch_integrante_error422(self, client, integrante_test, admin_login, payload, status_code):
+        response = client.patch(f"{INTEGRANTES_URL}/{integrante_test.get('id')}", json=payload,
+                                headers={
+                                    'Authorization': f'{admin_login.token_type} {admin_login.access_token}'})
+
+        assert response.status_code == status_code
+
+    def test_patch_integrante_error404(self, client, admin_login):
+        response = client.patch(f"{INTEGRANTES_URL}/99999", json={"edad": 31},
+                                headers={
+                                    'Authorization': f'{admin_login.token_type} {admin_login.access_token}'})
+
+        assert response.status_code == 404
+        assert response.json().get("detail") == "Integrante no encontrado"
+
+    def test_patch_integrante_error403(self, client, integrante_test, usuario_login):
+        response = client.patch(f"{INTEGRANTES_URL}/{integrante_test.get('id')}", json={"edad": 31},
+                                headers={
+                                    'Authorization': f'{usuario_login.token_type} {usuario_login.access_token}'})
+
+        assert response.status_code == 403
+
+    def test_delete_integrante(self, client, integrante_test, admin_login):
+        response = client.delete(f"{INTEGRANTES_URL}/{integrante_test.get('id')}",
+                                 headers={
+                                     'Authorization': f'{admin_login.token_type} {admin_login.access_token}'})
+
+        assert response.status_code == 200
+        assert response.json() == {"OK": f"Integrante con id: {integrante_test.get('id')} eliminado exitosamente"}
+
+
+class TestIntegranteWriteClass:
+
+    @pytest.mark.parametrize("write", ["create", "update", "delete"])
+    def test_write_integrante_statement_count(self, session, integrante_test, queries, write):
+        values = IntegranteBaseModel(**integrante_payload(integrante_test["seleccion"]["id"],
+                                                          integrante_test["equipo"]["id"],
+                                                          integrante_test["rol"]["id"], nombre="nombre_written"))
+        queries.clear()
+
+        if write == "create":
+            integrante = crud.create_integrante(session, values)
+        elif write == "update":
+            integrante = crud.update_integrante(session, values, integrante_test.get("id"))
+        else:
+            integrante = crud.delete_integrante(session, integrante_test.get("id"))
+
+        assert integrante is not None
+        if write != "delete":
+            assert (integrante.nombre, integrante.seleccion.pais) == ("nombre_written", "pais_test")
+        assert len(queries) == 1
+        assert session.query(Integrante).filter(Integrante.nombre == "nombre_written").count() == \
+               (0 if write == "delete" else 1)
+
+    def test_write_integrante_not_found(self, session, queries):
+        assert crud.delete_integrante(session, 99999) is None
+        assert len(queries) == 1
+
+
+class TestIntegranteQueryClass:
+
+    @pytest.mark.parametrize("params, num_camisetas", [
+        ({"rol_id_index": 1}, list(range(16, 26))),
+        ({"seleccion_id_index": 2, "edad_min": 30}, [10, 14, 18, 22]),
+        ({"equipo_id_index": 0, "edad_max": 22}, [0, 1, 2]),
+        ({"num_camiseta": 7}, [7]),
+        ({"edad_min": 50}, []),
+    ])
+    def test_get_integrantes_filtered(self, client, plantel_test, session, params, num_camisetas):
+        # plantel_test ids depend on the sequences, so the *_index params pick the n-th row of each table.
+        for name, table in (("seleccion_id", "selecciones"), ("equipo_id", "equipos"), ("rol_id", "roles")):
+            if f"{name}_index" in params:
+                ids = session.execute(f"SELECT id FROM {table} ORDER BY id").scalars().all()
+                params[name] = ids[params.pop(f"{name}_index")]
+
+        response = client.get(f"{INTEGRANTES_URL}/", params=params)
+
+        assert response.status_code == 200
+        assert [integrante.get("num_camiseta") for integrante in response.json()] == num_camisetas
+
+    @pytest.mark.parametrize("sort, num_camisetas", [
+        ("-edad", list(range(25, -1, -1))),
+        ("nombre", sorted(range(26), key=lambda i: f"nombre_{i}")),
+        ("-seleccion_id", [i for seleccion in (3, 2, 1, 0) for i in range(25, -1, -1) if i % 4 == seleccion]),
+    ])
+    def test_get_integrantes_sorted_pages(self, client, plantel_test, sort, num_camisetas):
+        pages = get_all_pages(client, {"sort": sort, "limit": 7})
+
+        assert len(pages) == 4
+        assert [integrante.get("num_camiseta") for page in pages for integrante in page] == num_camisetas
+
+    @pytest.mark.parametrize("sort", ["apodo", "-apodo"])
+    def test_get_integrantes_sorted_pages_nulls(self, client, session, plantel_test, sort):
+        session.query(Integrante).filter(Integrante.num_camiseta % 3 == 0).update({Integrante.apodo: None},
+                                                                                synchronize_session=False)
+        session.commit()
+        integrantes = session.query(Integrante).all()
+        # Postgres sorts NULLs last in ascending order and first in descending order.
+        expected = sorted(integrantes, key=lambda integrante: (integrante.apodo is None, integrante.apodo or "",
+                                                               integrante.id))
+        if sort.startswith("-"):
+            expected.reverse()
+
+        pages = get_all_pages(client, {"sort": sort, "limit": 4})
+
+        assert len(pages) == 7
+        assert [integrante.get("id") for page in pages for integrante in page] == \
+               [integrante.id for integrante in expected]
+
+    def test_get_integrantes_sorted_cursor_error400(self, client, plantel_test):
+        cursor = client.get(f"{INTEGRANTES_URL}/", params={"limit": 7}).headers["X-Next-Cursor"]
+
+        response = client.get(f"{INTEGRANTES_URL}/", params={"sort": "nombre", "cursor": cursor})
+
+        assert response.status_code == 400
+
+    def test_get_integrantes_fields(self, client, integrante_test, queries):
+        response = client.get(f"{INTEGRANTES_URL}/", params={"fields": "nombre,num_camiseta,equipo"})
+
+        assert response.status_code == 200
+        assert response.json() == [{"id": integrante_test.get("id"), "nombre": "nombre_test", "num_camiseta": 10,
+                                    "equipo": integrante_test.get("equipo")}]
+        assert "ETag" in response.headers
+        assert not [query for query in queries if "apellido" in query or "selecciones" in query]
+
+    def test_get_integrantes_fields_pages(self, client, plantel_test):
+        pages = get_all_pages(client, {"fields": "apellido", "sort": "-num_camiseta", "limit": 10})
+
+        assert [len(page) for page in pages] == [10, 10, 6]
+        assert pages[0][0] == {"id": pages[0][0].get("id"), "apellido": "apellido_25", "num_camiseta": 25}
+
+    @pytest.mark.parametrize("params", [{"fields": "nombre,password"}, {"sort": "password"}])
+    def test_get_integrantes_query_error(self, client, params):
+        response = client.get(f"{INTEGRANTES_URL}/", params=params)
+
+        assert response.status_code in (400, 422)
+
+
+@pytest.fixture
+def jugadores_test(session, seleccion_test, equipo_test, rol_test):
+    for nombre, apodo, apellido in (("Lionel", "Leo", "Messi"), ("Lautaro", "El Toro", "Martínez"),
+                                    ("Emiliano", "Dibu", "Martínez"), ("Ángel", "Fideo", "Di María")):
+        session.add(Integrante(nombre=nombre, apodo=apodo, apellido=apellido, edad=30, num_camiseta=1,
+                               seleccion_id=seleccion_test.get("id"), equipo_id=equipo_test.get("id"),
+                               rol_id=rol_test.get("id")))
+    session.commit()
+
+
+class TestIntegranteSearchClass:
+
+    @pytest.mark.parametrize("q, apellidos", [
+        ("messi", ["Messi"]),
+        ("MES", ["Messi"]),
+        ("martinez", ["Martínez", "Martínez"]),
+        ("dibu martí", ["Martínez"]),
+        ("angel maria", ["Di María"]),
+        ("Ángel", ["Di María"]),
+        ("Mesi", ["Messi"]),
+        ("Martines dibu", ["Martínez"]),
+        ("Ronaldo", []),
+        ("!!", []),
+    ])
+    def test_search_integrantes(self, client, jugadores_test, q, apellidos):
+        response = client.get(f"{INTEGRANTES_URL}/search", params={"q": q})
+
+        assert response.status_code == 200
+        assert [integrante.get("apellido") for integrante in response.json()] == apellidos
+
+    def test_search_integrantes_limit(self, client, jugadores_test):
+        response = client.get(f"{INTEGRANTES_URL}/search", params={"q": "martinez", "limit": 1})
+
+        assert len(response.json()) == 1
+
+    def test_search_integrantes_error422(self, client):
+        response = client.get(f"{INTEGRANTES_URL}/search")
+
+        assert response.status_code == 422
+
+
+@pytest.fixture
+def homonimos_test(session, seleccion_test, equipo_test, rol_test):
+    """ More than FUZZY_MAX_CANDIDATES Integrantes sharing the first letters of the Martínez added last. """
+    ids = {"edad": 30, "num_camiseta": 1, "seleccion_id": seleccion_test.get("id"), "equipo_id": equipo_test.get("id"),
+           "rol_id": rol_test.get("id")}
+    session.execute(insert(Integrante), [{"nombre": "Jugador", "apodo": f"apodo_{i}", "apellido": "Marquez", **ids}
+                                         for i in range(3000)])
+    session.execute(insert(Integrante), [{"nombre": "Lautaro", "apodo": "El Toro", "apellido": "Martínez", **ids}])
+    session.commit()
+
+
+class TestIntegranteFuzzySearchClass:
+
+    @pytest.mark.parametrize("q", ["martinex", "lautaro martinex", "marxinez"])
+    def test_search_among_homonimos(self, session, homonimos_test, q):
+        integrantes = crud.search_integrantes(session, q, 5)
+
+        assert [integrante.apellido for integrante in integrantes] == ["Martínez"]
+
+    def test_search_scanned_capped(self, session, homonimos_test, monkeypatch):
+        monkeypatch.setattr(crud, "FUZZY_MAX_SCANNED", 1000)
+
+        assert crud.search_integrantes(session, "marxinez", 5) == []
+
+
+class TestIntegranteBulkClass:
+
+    def test_create_integrantes(self, client, admin_login, seleccion_test, equipo_test, rol_test, queries):
+        payload = [integrante_payload(seleccion_test.get("id"), equipo_test.get("id"), rol_test.get("id"),
+                                      num_camiseta=number) for number in range(1, 27)]
+        payload[3]["seleccion_id"] = 99999
+        payload[7]["rol_id"] = 99999
+
+        response = client.post(f"{INTEGRANTES_URL}/bulk", json=payload,
+                               headers={
+                                   'Authorization': f'{admin_login.token_type} {admin_login.access_token}'})
+
+        assert response.status_code == 200
+        assert len(response.json().get("integrantes")) == 24
+        assert [integrante.get("num_camiseta") for integrante in response.json().get("integrantes")] == \
+               [number for number in range(1, 27) if number not in (4, 8)]
+        assert response.json().get("errors") == [{"index": 3, "detail": "Selección no encontrada"},
+                                                 {"index": 7, "detail": "Rol no encontrado."}]
+        assert len([query for query in queries if "INSERT INTO integrantes" in query]) == 1
+
+    def test_create_integrantes_error422(self, client, admin_login, seleccion_test, equipo_test, rol_test):
+        payload = [integrante_payload(seleccion_test.get("id"), equipo_test.get("id"), rol_test.get("id")),
+                   {"nombre": "sin_apellido"}]
+
+        response = client.post(f"{INTEGRANTES_URL}/bulk", json=payload,
+                               headers={
+                                   'Authorization': f'{admin_login.token_type} {admin_login.access_token}'})
+
+        assert response.status_code == 422
+        assert all(error.get("loc")[1] == 1 for error in response.json().get("detail"))
+
+    def test_create_integrantes_error403(self, client, usuario_login, seleccion_test, equipo_test, rol_test):
+        payload = [integrante_payload(seleccion_test.get("id"), equipo_test.get("id"), rol_test.get("id"))]
+
+        response = client.post(f"{INTEGRANTES_URL}/bulk", json=payload,
+                               headers={
+                                   'Authorization': f'{usuario_login.token_type} {usuario_login.access_token}'})
+
+        assert response.status_code == 403
+
+    def test_update_integrantes(self, client, admin_login, integrante_test):
+        payload = [integrante_payload(integrante_test["seleccion"]["id"], integrante_test["equipo"]["id"],
+                                      integrante_test["rol"]["id"], id=integrante_test.get("id"), num_camiseta=5),
+                   integrante_payload(integrante_test["seleccion"]["id"], integrante_test["equipo"]["id"],
+                                      integrante_test["rol"]["id"], id=99999)]
+
+        response = client.put(f"{INTEGRANTES_URL}/bulk", json=payload,
+                              headers={
+                                  'Authorization': f'{admin_login.token_type} {admin_login.access_token}'})
+
+        assert response.status_code == 200
+        assert [integrante.get("num_camiseta") for integrante in response.json().get("integrantes")] == [5]
+        assert response.json().get("errors") == [{"index": 1, "detail": "Integrante no encontrado"}]
+
+    def test_delete_integrantes(self, client, admin_login, plantel_test):
+        ids = [integrante.get("id") for integrante in client.get(f"{INTEGRANTES_URL}/").json()]
+
+        response = client.delete(f"{INTEGRANTES_URL}/bulk", params={"ids": ids[:5] + [99999]},
+                                 headers={
+                                     'Authorization': f'{admin_login.token_type} {admin_login.access_token}'})
+
+        assert response.status_code == 200
+        assert response.json() == {"ids": ids[:5], "errors": [{"index": 5, "detail": "Integrante no encontrado"}]}
+        assert len(client.get(f"{INTEGRANTES_URL}/").json()) == 21
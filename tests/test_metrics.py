@@ -0,0 +1,139 @@
+import asyncio
+import logging
+import re
+
+import pytest
+
+from project.metrics import RouteMetrics, MetricsMiddleware, RequestTimings, route_metrics, labels, observe_statement
+
+INTEGRANTES_URL = "/api/v1/integrantes"
+
+
+@pytest.fixture
+def metrics():
+    route_metrics.clear()
+    yield route_metrics
+    route_metrics.clear()
+
+
+class TestRouteMetricsClass:
+
+    def test_metrics_by_route_template(self, client, integrante_test, metrics):
+        client.get(f"{INTEGRANTES_URL}/{integrante_test.get('id')}")
+        client.get(f"{INTEGRANTES_URL}/{integrante_test.get('id')}")
+        client.get(f"{INTEGRANTES_URL}/99999")
+        client.get("/api/v1/no-existe")
+
+        response = client.get("/metrics")
+
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+        assert 'http_requests_total{method="GET",route="/api/v1/integrantes/{integrante_id}",status="200"} 2' \
+               in response.text.splitlines()
+        assert 'http_requests_total{method="GET",route="/api/v1/integrantes/{integrante_id}",status="404"} 1' \
+               in response.text.splitlines()
+        assert 'http_requests_total{method="GET",route="<unmatched>",status="404"} 1' in response.text.splitlines()
+        assert 'http_request_duration_seconds_count{method="GET",route="/api/v1/integrantes/{integrante_id}"} 3' \
+               in response.text.splitlines()
+        # The /metrics request itself is still in flight while it renders
+        assert "http_requests_in_flight 1" in response.text.splitlines()
+
+    def test_histogram_buckets(self):
+        metrics = RouteMetrics(buckets=(0.1, 0.5))
+        for seconds in (0.05, 0.1, 0.3, 2):
+            metrics.start_request()
+            metrics.observe_request("GET", "/roles/", 200, seconds)
+
+        lines = metrics.render().splitlines()
+
+        assert [line for line in lines if line.startswith("http_request_duration_seconds")] == [
+            'http_request_duration_seconds_bucket{method="GET",route="/roles/",le="0.1"} 2',
+            'http_request_duration_seconds_bucket{method="GET",route="/roles/",le="0.5"} 3',
+            'http_request_duration_seconds_bucket{method="GET",route="/roles/",le="+Inf"} 4',
+            'http_request_duration_seconds_sum{method="GET",route="/roles/"} 2.45',
+            'http_request_duration_seconds_count{method="GET",route="/roles/"} 4']
+        assert "http_requests_in_flight 0" in lines
+
+    def test_middleware_records_unhandled_errors(self):
+        async def failing_app(scope, receive, send):
+            raise RuntimeError("boom")
+
+        metrics = RouteMetrics()
+        middleware = MetricsMiddleware(failing_app, metrics)
+
+        with pytest.raises(RuntimeError):
+            asyncio.run(middleware({"type": "http", "method": "POST", "app": None}, None, None))
+
+        assert metrics.requests == {("POST", "<unmatched>", "500"): 1}
+        assert metrics.in_flight == 0
+
+    def test_labels_escaping(self):
+        assert labels(route='/a"b\\c\n') == '{route="/a\\"b\\\\c\\n"}'
+
+
+def server_timing(response):
+    """ The durations of the Server-Timing header of :response:, and the description of db. """
+    header = response.headers["Server-Timing"]
+    durations = {name: float(duration) for name, duration in re.findall(r"(\w+);dur=([\d.]+)", header)}
+
+    return durations, re.search(r'desc="([^"]*)"', header).group(1)
+
+
+class TestRequestTimingsClass:
+
+    def test_server_timing_header(self, client, admin_login, integrante_test, metrics):
+        response = client.patch(f"{INTEGRANTES_URL}/{integrante_test.get('id')}", json={"edad": 30},
+                                headers={'Authorization': f'{admin_login.token_type} {admin_login.access_token}'})
+
+        durations, description = server_timing(response)
+        assert response.status_code == 200
+        assert set(durations) == {"db", "serialize", "auth", "total"}
+        # get_current_usuario reads the usuario, and update_integrante writes with a single statement.
+        assert description == "2 statements"
+        assert durations["db"] > 0 and durations["auth"] > 0 and durations["serialize"] > 0
+        assert durations["total"] >= durations["db"]
+
+    def test_db_metrics_by_route(self, client, integrante_test, metrics):
+        client.get(f"{INTEGRANTES_URL}/{integrante_test.get('id')}")
+        client.get(f"{INTEGRANTES_URL}/{integrante_test.get('id')}")
+
+        lines = client.get("/metrics").text.splitlines()
+
+        assert 'http_request_db_statements_total{method="GET",route="/api/v1/integrantes/{integrante_id}"} 2' in lines
+        assert any(line.startswith('http_request_phase_seconds_total{method="GET",'
+                                   'route="/api/v1/integrantes/{integrante_id}",phase="serialize"} ')
+                   for line in lines)
+
+    def test_n_plus_one_logging(self, caplog):
+        async def app(scope, receive, send):
+            for _ in range(3):
+                observe_statement("SELECT * FROM equipos WHERE id = %(id)s", 0.001)
+            observe_statement("SELECT * FROM integrantes", 0.001)
+            await send({"type": "http.response.start", "status": 200, "headers": []})
+
+        messages = []
+
+        async def send(message):
+            messages.append(message)
+
+        metrics = RouteMetrics()
+        middleware = MetricsMiddleware(app, metrics, n_plus_one_threshold=2)
+
+        with caplog.at_level(logging.WARNING, logger="project.metrics"):
+            asyncio.run(middleware({"type": "http", "method": "GET", "app": None}, None, send))
+
+        assert [record.getMessage() for record in caplog.records] == [
+            "Possible N+1 in GET <unmatched>: statement executed 3 times: SELECT * FROM equipos WHERE id = %(id)s"]
+        name, value = messages[0]["headers"][0]
+        assert name == b"server-timing"
+        assert value.startswith(b'db;dur=4.000;desc="4 statements", serialize;dur=0.000, auth;dur=0.000, total;dur=')
+        assert metrics.db_statements == {("GET", "<unmatched>"): 4}
+
+    def test_statements_outside_requests(self):
+        timings = RequestTimings()
+
+        observe_statement("SELECT 1", 0.5)
+        timings.observe_statement("SELECT 1", 0.5)
+
+        assert timings.db_statements == 1
+        assert timings.repeated_statements(0) == []
@@ -0,0 +1,55 @@
+import os
+import subprocess
+import sys
+
+import pytest
+from alembic import command
+from alembic.autogenerate import compare_metadata
+from alembic.config import Config
+from alembic.migration import MigrationContext
+from sqlalchemy import text
+
+from project.database import Base
+from tests.conftest import engine, SQLALCHEMY_TEST_DATABASE_URL
+
+
+def get_indexes(connection):
+    return dict(connection.execute(text("SELECT indexname, indexdef FROM pg_indexes WHERE schemaname = 'public' "
+                                        "AND tablename <> 'alembic_version'")).all())
+
+
+class TestMigrationsClass:
+
+    @pytest.mark.filterwarnings("ignore:.*expression-based index", "ignore:autogenerate skipping functional index")
+    def test_migrations_match_models(self, session):
+        session.close()
+        Base.metadata.drop_all(bind=engine)
+
+        config = Config("alembic.ini")
+        config.set_main_option("sqlalchemy.url", SQLALCHEMY_TEST_DATABASE_URL)
+        try:
+            command.upgrade(config, "head")
+
+            with engine.connect() as connection:
+                differences = compare_metadata(MigrationContext.configure(connection), Base.metadata)
+                migrated_indexes = get_indexes(connection)
+        finally:
+            command.downgrade(config, "base")
+
+        Base.metadata.create_all(bind=engine)
+        with engine.connect() as connection:
+            model_indexes = get_indexes(connection)
+
+        assert differences == []
+        # Autogenerate skips expression indexes, so their definitions are compared as Postgres reports them.
+        assert migrated_indexes == model_indexes
+
+
+class TestStartupClass:
+
+    def test_import_without_database(self):
+        # Nothing listens on port 1: importing the app must not need the database.
+        result = subprocess.run([sys.executable, "-c", "import project"], env={**os.environ, "DB_PORT": "1"},
+                                capture_output=True, timeout=60)
+
+        assert result.returncode == 0, result.stderr.decode()
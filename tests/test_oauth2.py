@@ -0,0 +1,75 @@
+from project import cache, crud
+from project.cache import MemoryCacheBackend, auth_cache
+
+ROLES_URL = "/api/v1/roles"
+USUARIOS_URL = "/api/v1/usuarios"
+
+
+class TestCurrentUsuarioClass:
+
+    def test_authenticated_requests_cached(self, client, admin_login, queries):
+        headers = {'Authorization': f'{admin_login.token_type} {admin_login.access_token}'}
+        client.post(f"{ROLES_URL}/", json={"titulo": "rol_1"}, headers=headers)
+        queries.clear()
+
+        response = client.post(f"{ROLES_URL}/", json={"titulo": "rol_2"}, headers=headers)
+
+        assert response.status_code == 200
+        assert not [query for query in queries if "FROM usuarios" in query]
+
+    def test_update_usuario_invalidates(self, client, admin_test, admin_login, usuario_test, usuario_login, session):
+        headers = {'Authorization': f'{admin_login.token_type} {admin_login.access_token}'}
+        assert client.post(f"{ROLES_URL}/", json={"titulo": "rol_1"}, headers=headers).status_code == 200
+
+        # Demote the admin and write something through the API, so the cached principal is dropped.
+        session.execute("UPDATE usuarios SET is_admin = false WHERE id = :id", {"id": admin_test.get("id")})
+        session.commit()
+        client.put(f"{USUARIOS_URL}/{usuario_test.get('id')}",
+                   json={"email": usuario_test.get("email"), "password": usuario_test.get("password")},
+                   headers={'Authorization': f'{usuario_login.token_type} {usuario_login.access_token}'})
+
+        response = client.post(f"{ROLES_URL}/", json={"titulo": "rol_2"}, headers=headers)
+
+        assert response.status_code == 403
+
+    def test_deleted_usuario_unauthorized(self, client, usuario_test, usuario_login):
+        headers = {'Authorization': f'{usuario_login.token_type} {usuario_login.access_token}'}
+        client.delete(f"{USUARIOS_URL}/{usuario_test.get('id')}", headers=headers)
+
+        response = client.delete(f"{USUARIOS_URL}/{usuario_test.get('id')}", headers=headers)
+
+        assert response.status_code == 401
+
+    def test_create_usuario_keeps_cached_principals(self, client, admin_login, queries):
+        headers = {'Authorization': f'{admin_login.token_type} {admin_login.access_token}'}
+        client.post(f"{ROLES_URL}/", json={"titulo": "rol_1"}, headers=headers)
+        client.post(f"{USUARIOS_URL}/", json={"email": "nuevo@email.com", "password": "password123"})
+        queries.clear()
+
+        response = client.post(f"{ROLES_URL}/", json={"titulo": "rol_2"}, headers=headers)
+
+        assert response.status_code == 200
+        assert not [query for query in queries if "FROM usuarios" in query]
+
+    def test_update_usuario_password_invalidates(self, client, admin_test, admin_login, session, queries):
+        headers = {'Authorization': f'{admin_login.token_type} {admin_login.access_token}'}
+        client.post(f"{ROLES_URL}/", json={"titulo": "rol_1"}, headers=headers)
+        crud.update_usuario_password(session, admin_test.get("id"), "hashed_password")
+        queries.clear()
+
+        client.post(f"{ROLES_URL}/", json={"titulo": "rol_2"}, headers=headers)
+
+        assert [query for query in queries if "FROM usuarios" in query]
+
+    def test_principals_apart_from_catalog(self, client, admin_login, queries, monkeypatch):
+        # A disabled catalog cache must not disable the principals, which live in their own cache.
+        monkeypatch.setattr(cache, "catalog_cache", MemoryCacheBackend(maxsize=10, ttl=0))
+        headers = {'Authorization': f'{admin_login.token_type} {admin_login.access_token}'}
+        client.post(f"{ROLES_URL}/", json={"titulo": "rol_1"}, headers=headers)
+        queries.clear()
+
+        response = client.post(f"{ROLES_URL}/", json={"titulo": "rol_2"}, headers=headers)
+
+        assert response.status_code == 200
+        assert not [query for query in queries if "FROM usuarios" in query]
+        assert auth_cache.stats()["size"] == 1
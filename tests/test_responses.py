@@ -0,0 +1,45 @@
+from typing import Dict
+
+import pytest
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import ORJSONResponse
+
+from project import app, crud
+from project.responses import orm_serializer, orm_response
+from project.schemas import IntegranteResponseModel, IntegrantesXEquipoResponseModel, ResponseModel
+
+
+class TestOrmSerializerClass:
+
+    def test_orm_serializer_matches_response_model(self, session, plantel_test):
+        integrantes = crud.get_integrantes(session)
+
+        assert [orm_serializer(IntegranteResponseModel)(integrante) for integrante in integrantes] == \
+               [jsonable_encoder(IntegranteResponseModel.from_orm(integrante)) for integrante in integrantes]
+
+    def test_orm_serializer_nested_list(self, session, plantel_test):
+        equipo, integrantes = crud.get_equipo_integrantes(session, crud.get_integrantes(session)[0].equipo_id, 10, None)
+        content = {"equipo": equipo, "integrantes": integrantes}
+
+        assert orm_serializer(IntegrantesXEquipoResponseModel)(content) == \
+               jsonable_encoder(IntegrantesXEquipoResponseModel(**content))
+
+    def test_orm_serializer_error(self):
+        class MappingModel(ResponseModel):
+            values: Dict[str, int]
+
+        with pytest.raises(TypeError):
+            orm_serializer(MappingModel)
+
+    def test_orm_response(self, session, integrante_test):
+        response = orm_response(crud.get_integrantes(session), IntegranteResponseModel)
+
+        assert isinstance(response, ORJSONResponse)
+        assert app.router.default_response_class is ORJSONResponse
+
+    def test_search_integrantes_etag(self, client, integrante_test):
+        response = client.get("/api/v1/integrantes/search", params={"q": "nombre"})
+
+        assert response.status_code == 200
+        assert response.json() == [integrante_test]
+        assert response.headers.get("ETag").startswith('"')
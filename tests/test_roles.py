@@ -54,6 +54,22 @@ class TestRolClass:
         assert response.status_code == 404
         assert response.json().get("detail") == "Rol no encontrado."
 
+    def test_patch_rol(self, client, rol_test, admin_login):
+        response = client.patch(f"{ROLES_URL}/{rol_test.get('id')}", json={"titulo": "rol_patched"},
+                                headers={
+                                    'Authorization': f'{admin_login.token_type} {admin_login.access_token}'})
+
+        assert response.status_code == 200
+        assert response.json() == {"id": rol_test.get("id"), "titulo": "rol_patched"}
+
+    def test_patch_rol_error404(self, client, admin_login):
+        response = client.patch(f"{ROLES_URL}/99999", json={"titulo": "rol_patched"},
+                                headers={
+                                    'Authorization': f'{admin_login.token_type} {admin_login.access_token}'})
+
+        assert response.status_code == 404
+        assert response.json().get("detail") == "Rol no encontrado."
+
     def test_delete_rol(self, client, rol_test, admin_login):
         response = client.delete(f"{ROLES_URL}/{rol_test.get('id')}",
                                  headers={
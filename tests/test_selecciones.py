@@ -1,5 +1,6 @@
 import pytest
 
+from project.models import Seleccion
 from project.schemas import SeleccionResponseModel
 
 SELECCIONES_URL = "/api/v1/selecciones"
@@ -49,6 +50,18 @@ class TestSeleccionClass:
                                   'Authorization': f'{admin_login.token_type} {admin_login.access_token}'})
         assert response.status_code == status_code
 
+    @pytest.mark.parametrize("patched_pais, status_code", [
+        ("pais_patched", 200),
+        ("a", 422),
+        (None, 422),
+    ])
+    def test_patch_seleccion(self, client, seleccion_test, admin_login, patched_pais, status_code):
+        response = client.patch(f"{SELECCIONES_URL}/{seleccion_test.get('id')}",
+                                json={"pais": patched_pais},
+                                headers={
+                                    'Authorization': f'{admin_login.token_type} {admin_login.access_token}'})
+        assert response.status_code == status_code
+
     def test_update_seleccion_error404(self, client, admin_login):
         response = client.put(f"{SELECCIONES_URL}/99999",
                               json={"pais": "updated_pais"},
@@ -73,3 +86,60 @@ class TestSeleccionClass:
 
         assert response.status_code == 404
         assert response.json().get("detail") == "Selección no encontrada"
+
+
+class TestSeleccionIntegrantesClass:
+
+    def test_get_seleccion_integrantes(self, client, integrante_test):
+        seleccion = integrante_test.get("seleccion")
+        response = client.get(f"{SELECCIONES_URL}/{seleccion.get('id')}/integrantes")
+
+        assert response.status_code == 200
+        assert response.json().get("seleccion") == seleccion
+        assert response.json().get("integrantes") == [{
+            "id": integrante_test.get("id"), "nombre": "nombre_test", "apodo": "apodo_test",
+            "apellido": "apellido_test", "edad": 30, "num_camiseta": 10, "seleccion_id": seleccion.get("id"),
+            "equipo_id": integrante_test.get("equipo").get("id"), "rol_id": integrante_test.get("rol").get("id"),
+            "equipo": integrante_test.get("equipo")}]
+
+    def test_get_seleccion_integrantes_empty(self, client, seleccion_test):
+        response = client.get(f"{SELECCIONES_URL}/{seleccion_test.get('id')}/integrantes")
+
+        assert response.status_code == 200
+        assert response.json() == {"seleccion": seleccion_test, "integrantes": []}
+
+    def test_get_seleccion_integrantes_error404(self, client):
+        response = client.get(f"{SELECCIONES_URL}/99999/integrantes")
+
+        assert response.status_code == 404
+        assert response.json().get("detail") == "Selección no encontrada"
+
+    def test_get_seleccion_integrantes_single_query(self, client, plantel_test, queries):
+        seleccion_id = client.get(f"{SELECCIONES_URL}/").json()[0].get("id")
+        queries.clear()
+
+        response = client.get(f"{SELECCIONES_URL}/{seleccion_id}/integrantes")
+
+        assert len(response.json().get("integrantes")) == 7
+        assert [integrante.get("num_camiseta") for integrante in response.json().get("integrantes")] == \
+               list(range(0, 26, 4))
+        assert len(queries) == 1
+
+
+class TestSeleccionSearchClass:
+
+    @pytest.mark.parametrize("q, paises", [
+        ("arg", ["Argentina"]),
+        ("Argentna", ["Argentina"]),
+        ("republica", ["República Checa", "República de Corea"]),
+        ("rep corea", ["República de Corea"]),
+        ("Brasil", []),
+    ])
+    def test_search_selecciones(self, client, session, q, paises):
+        session.add_all([Seleccion(pais=pais) for pais in ("Argentina", "República Checa", "República de Corea")])
+        session.commit()
+
+        response = client.get(f"{SELECCIONES_URL}/search", params={"q": q})
+
+        assert response.status_code == 200
+        assert [seleccion.get("pais") for seleccion in response.json()] == paises
@@ -1,7 +1,12 @@
+import threading
+
 import pytest
+from passlib.context import CryptContext
 from decouple import config
 from jose import jwt
 
+from project import utils
+from project.models import Usuario
 from project.oauth2 import SECRET_KEY, ALGORITHM
 
 from project.schemas import UsuarioResponseModel, Token
@@ -88,6 +93,21 @@ class TestUsuarioClass:
                               )
         assert response.status_code == status_code
 
+    @pytest.mark.parametrize("payload, login_password", [
+        ({"email": "patched@email.com"}, "password123"),
+        ({"password": "new-password"}, "new-password"),
+    ])
+    def test_patch_usuario(self, client, usuario_test, usuario_login, payload, login_password):
+        response = client.patch(f"{USUARIOS_URL}/{usuario_test.get('id')}", json=payload,
+                                headers={
+                                    'Authorization': f'{usuario_login.token_type} {usuario_login.access_token}'})
+        email = response.json().get("email")
+        login_response = client.post("/api/v1/auth/login", data={"username": email, "password": login_password})
+
+        assert response.status_code == 200
+        assert email == payload.get("email", usuario_test.get("email"))
+        assert login_response.status_code == 200
+
     def test_delete_usuario(self, client, usuario_test, usuario_login):
         response = client.delete(f"{USUARIOS_URL}/{usuario_test.get('id')}",
                                  headers={
@@ -104,3 +124,27 @@ class TestUsuarioClass:
                                  )
 
         assert response.status_code == 404
+
+    def test_authenticate_usuario_password_pool_full(self, client, usuario_test, monkeypatch):
+        monkeypatch.setattr(utils, "password_slots", threading.BoundedSemaphore(1))
+        utils.password_slots.acquire()
+
+        response = client.post(f"{AUTH_URL}", data={"username": usuario_test.get("email"),
+                                                    "password": usuario_test.get("password")})
+
+        assert response.status_code == 503
+        assert response.headers.get("Retry-After") == "1"
+
+    def test_authenticate_usuario_rehash(self, client, session):
+        outdated_hash = CryptContext(schemes=["bcrypt"], bcrypt__rounds=4).hash("password123")
+        new_usuario = Usuario(email="outdated@email.com", password=outdated_hash)
+        session.add(new_usuario)
+        session.commit()
+
+        response = client.post(f"{AUTH_URL}", data={"username": "outdated@email.com", "password": "password123"})
+        new_hash = session.query(Usuario.password).filter(Usuario.email == "outdated@email.com").scalar()
+
+        assert response.status_code == 200
+        assert new_hash != outdated_hash
+        assert utils.verify_password("password123", new_hash)
+        assert not utils.password_needs_update(new_hash)